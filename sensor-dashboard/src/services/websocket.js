@@ -78,7 +78,11 @@ class WebSocketService {
         this.emit('message', data);
 
         // Emit specific event types
-        if (data.type === 'sensor_update') {
+        if (data.type === 'sensor_batch') {
+          // One frame per aggregation tick: every sensor's new data and any anomalies
+          (data.sensors || []).forEach((update) => this.emit('sensor_update', update));
+          (data.anomalies || []).forEach((anomaly) => this.emit('anomaly', anomaly));
+        } else if (data.type === 'sensor_update') {
           this.emit('sensor_update', data.data);
         } else if (data.type === 'anomaly_detected') {
           this.emit('anomaly', data.data);
@@ -32,6 +32,10 @@ app.conf.beat_schedule = {
         'task': 'sensors.tasks.cleanup_old_readings',
         'schedule': crontab(hour=2, minute=0),  # Run daily at 2 AM
     },
+    'maintain-reading-partitions': {
+        'task': 'sensors.tasks.maintain_reading_partitions',
+        'schedule': crontab(minute=5),  # Run hourly
+    },
 }
 
 @app.task(bind=True, ignore_result=True)
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sensors.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -131,6 +132,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ASGI Application for Channels
 ASGI_APPLICATION = 'sensor_backend.asgi.application'
 
+# Cache Configuration (Redis, shared by the web, Celery and ingest processes)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+    # Closed history windows (see sensors.history_cache). Local memory with
+    # LRU eviction; a Redis cache with maxmemory-policy allkeys-lru also works.
+    'history': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sensor-history',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
 # Channels Layer Configuration (Redis)
 CHANNEL_LAYERS = {
     'default': {
@@ -164,3 +180,89 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+
+# Sensor Ingest Configuration
+# Validate ingest batches column-wise instead of through the DRF serializer
+SENSOR_INGEST_FAST_PATH = True
+
+# Coalesce small ingest POSTs into large bulk_create transactions
+SENSOR_INGEST_BUFFER = {
+    'ENABLED': True,
+    'MAX_ROWS': 5000,         # Flush once this many readings are pending
+    'FLUSH_INTERVAL': 0.25,   # Flush at least this often (seconds)
+    'MAX_PENDING': 50000,     # Reject ingest with 429 beyond this many pending readings
+    'MAX_RETRY_BACKOFF': 5,   # Longest wait between retries of a failed flush (seconds)
+}
+
+# Aggregate 1-second summaries in the ingest process instead of rescanning
+# the raw table from Celery every second
+SENSOR_STREAMING_AGGREGATION = {
+    'ENABLED': True,
+    'EMIT_INTERVAL': 0.25,    # How often finished seconds are written (seconds)
+    'GRACE_SECONDS': 1,       # Wait this long past a second's end before emitting it
+}
+
+# Watermark-driven catch-up for the scheduled aggregation tasks
+SENSOR_AGGREGATION = {
+    'LATENESS': {'1sec': 10, '1min': 120, '1hour': 3600},       # Seconds re-aggregated behind the watermark
+    'CHUNK_BUCKETS': {'1sec': 300, '1min': 60, '1hour': 24},    # Buckets per grouped query
+    'MAX_CHUNKS_PER_RUN': 10,                                   # Remaining backlog waits for the next run
+    'MAX_NEW_ROWS': 10_000,                                     # Newly closed rows passed on per run (newest kept)
+}
+
+# Score every sensor's rolling z-score in-process, once per tick, instead of
+# one detect_anomalies Celery task per sensor per second
+SENSOR_ANOMALY_ENGINE = {
+    'ENABLED': True,
+    'WINDOW_SECONDS': 600,    # Rolling window of 1-second averages
+    'MIN_HISTORY': 30,        # Seconds of history required before scoring
+}
+
+# Daily partitions of the raw readings table (PostgreSQL only)
+SENSOR_READING_PARTITIONS = {
+    'PRECREATE_DAYS': 3,      # Partitions kept created ahead of today
+}
+
+# Retention: expired rows are deleted oldest first in small chunks
+SENSOR_RETENTION = {
+    'DAYS': {'raw': 7, '1sec': 30, '1min': 365},
+    'CHUNK_SIZE': 5000,       # Rows per DELETE statement
+    'SLEEP_SECONDS': 0.05,    # Pause between chunks to leave I/O for ingest
+    'MAX_SECONDS': 600,       # Budget per scheduled run; the rest resumes next run
+}
+
+# Newest reading per sensor, published by ingest for list_sensors and dropout checks
+SENSOR_LATEST_VALUES = {
+    'CACHE_ALIAS': 'default',
+    'NO_DATA_TIMEOUT': 10,    # Seconds a sensor without readings is remembered as such
+}
+
+# Cache of closed history windows served by get_historical_data
+SENSOR_HISTORY_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'history',
+    'BLOCK_SECONDS': {'1sec': 900, '1min': 86400, '1hour': 30 * 86400},
+    'TIMEOUT': 86400,         # Seconds a block is kept (bounds staleness after backfills)
+}
+
+# Last 1-second aggregates per sensor, published by the aggregator for /live/ and WebSocket get_latest
+SENSOR_LIVE_BUFFER = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'WINDOW_SECONDS': 60,     # Slots per sensor ring
+}
+
+# Per-tick WebSocket broadcast of 1-second aggregates and anomalies (one sensor_batch frame per tick)
+SENSOR_BROADCAST = {
+    'ENABLED': True,
+    'GROUP': 'sensors',
+    'MAX_FRAME_ROWS': 600,    # Newest rows kept in one frame (bounds catch-up frames)
+}
+
+# Prometheus metrics at /metrics: each process publishes a snapshot of its counters to the cache
+SENSOR_METRICS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'PUBLISH_INTERVAL': 5,    # Seconds between snapshots of one process
+    'PROCESS_TIMEOUT': 60,    # Processes silent this long are retired into the totals
+}
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from sensors.views import get_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/sensors/', include('sensors.urls')),
+    path('metrics', get_metrics, name='metrics'),
 ]
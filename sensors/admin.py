@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import (
+    AggregationWatermark,
     SensorReading,
     SensorAggregated1Sec,
     SensorAggregated1Min,
@@ -44,6 +45,12 @@ class SensorAggregated1HourAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
 
 
+@admin.register(AggregationWatermark)
+class AggregationWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['tier', 'watermark', 'updated_at']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(Anomaly)
 class AnomalyAdmin(admin.ModelAdmin):
     list_display = ['id', 'sensor_id', 'timestamp', 'anomaly_type', 'severity', 'value', 'acknowledged']
@@ -0,0 +1,303 @@
+"""
+Exact, mergeable aggregation helpers shared by the Celery tasks and the
+streaming aggregator.
+
+Every aggregation row stores count, sum, sum_sq, min and max next to the
+derived avg and std. Those sufficient statistics combine exactly, so a
+coarser tier is a plain SUM/MIN/MAX over the finer one (no average of
+averages, no averaged standard deviations), and partial results for the
+same bucket can be merged in the database with a single upsert.
+
+Each tier is computed with one GROUP BY (sensor_id, time bucket) query over
+its source table and written with one bulk upsert, however many sensors
+and buckets the range covers.
+
+Scheduled runs are watermark-driven (see catch_up): every closed bucket
+since the tier's last watermark is processed in bounded chunks, so paused
+or late workers never lose buckets, and a trailing lateness window is
+re-aggregated on each run to pick up late-arriving readings.
+"""
+import math
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DateTimeField, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from . import metrics
+from .models import (
+    AggregationWatermark,
+    SensorReading,
+    SensorAggregated1Sec,
+    SensorAggregated1Min,
+    SensorAggregated1Hour
+)
+
+
+AGGREGATE_FIELDS = ['avg', 'min', 'max', 'std', 'count', 'sum', 'sum_sq']
+
+DEFAULTS = {
+    # Seconds behind the watermark that are re-aggregated on every run
+    'LATENESS': {'1sec': 10, '1min': 120, '1hour': 3600},
+    # Buckets aggregated per grouped query while catching up
+    'CHUNK_BUCKETS': {'1sec': 300, '1min': 60, '1hour': 24},
+    # Upper bound on chunks per scheduled run; the rest waits for the next run
+    'MAX_CHUNKS_PER_RUN': 10,
+    # Newest newly closed rows returned by catch_up (for the live rings,
+    # anomaly detection and the broadcast)
+    'MAX_NEW_ROWS': 10_000,
+}
+
+Tier = namedtuple('Tier', ['name', 'model', 'source', 'kind', 'width'])
+
+TIERS = {
+    '1sec': Tier('1sec', SensorAggregated1Sec, SensorReading, 'second', timedelta(seconds=1)),
+    '1min': Tier('1min', SensorAggregated1Min, SensorAggregated1Sec, 'minute', timedelta(minutes=1)),
+    '1hour': Tier('1hour', SensorAggregated1Hour, SensorAggregated1Min, 'hour', timedelta(hours=1)),
+}
+
+
+CatchUpResult = namedtuple('CatchUpResult', ['count', 'rows', 'watermark'])
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_AGGREGATION', {})}
+
+
+def bucket_start(dt, kind):
+    """Round a datetime down to the start of its second/minute/hour bucket"""
+    if kind == 'second':
+        return dt.replace(microsecond=0)
+    if kind == 'minute':
+        return dt.replace(second=0, microsecond=0)
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+class TimeBucket(Trunc):
+    """
+    Trunc that avoids a Python call per row on SQLite.
+
+    Django's Trunc on SQLite calls a registered Python function for every row,
+    which dominates grouped aggregation. SQLite stores UTC datetimes as ISO
+    text, so in UTC a prefix of the string is the same bucket.
+    """
+    SQLITE_TEMPLATES = {
+        'second': "substr(%s, 1, 19)",
+        'minute': "substr(%s, 1, 16) || ':00'",
+        'hour': "substr(%s, 1, 13) || ':00:00'",
+    }
+
+    def __init__(self, expression, kind):
+        super().__init__(expression, kind, output_field=DateTimeField())
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        if self.kind not in self.SQLITE_TEMPLATES or self.get_tzname() != 'UTC':
+            return self.as_sql(compiler, connection, **extra_context)
+        sql, params = compiler.compile(self.lhs)
+        return self.SQLITE_TEMPLATES[self.kind] % sql, params
+
+
+def finalize(count, total, total_sq, minimum, maximum):
+    """Derive the stored aggregate fields from sufficient statistics"""
+    mean = total / count
+    # Population variance; clamp rounding noise for near-constant buckets
+    variance = max(total_sq / count - mean * mean, 0.0)
+    return {
+        'avg': mean,
+        'min': minimum,
+        'max': maximum,
+        'std': math.sqrt(variance),
+        'count': count,
+        'sum': total,
+        'sum_sq': total_sq,
+    }
+
+
+def summarize_readings(queryset, kind):
+    """Group raw SensorReading rows by (sensor, bucket) into sufficient statistics"""
+    return queryset.annotate(bucket=TimeBucket('timestamp', kind)).values('sensor_id', 'bucket').annotate(
+        n=Count('id'),
+        total=Sum('value'),
+        total_sq=Sum(F('value') * F('value')),
+        low=Min('value'),
+        high=Max('value'),
+    ).order_by('bucket', 'sensor_id')
+
+
+def summarize_aggregates(queryset, kind):
+    """Group rows of a finer aggregation tier by (sensor, bucket) into sufficient statistics"""
+    return queryset.annotate(bucket=TimeBucket('timestamp', kind)).values('sensor_id', 'bucket').annotate(
+        n=Sum('count'),
+        total=Sum('sum'),
+        total_sq=Sum('sum_sq'),
+        low=Min('min'),
+        high=Max('max'),
+    ).order_by('bucket', 'sensor_id')
+
+
+def upsert_aggregates(model, summaries):
+    """
+    Write one aggregation row per (sensor, bucket) summary, replacing any
+    existing rows. Returns the written instances.
+    """
+    objs = [
+        model(
+            sensor_id=summary['sensor_id'],
+            timestamp=summary['bucket'],
+            **finalize(summary['n'], summary['total'], summary['total_sq'],
+                       summary['low'], summary['high'])
+        )
+        for summary in summaries
+        if summary['n']
+    ]
+    model.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=['sensor_id', 'timestamp'],
+        update_fields=AGGREGATE_FIELDS,
+    )
+    return objs
+
+
+def aggregate_range(tier_name, start_time, end_time):
+    """
+    (Re)compute every bucket of a tier in [start_time, end_time) for all
+    sensors found in the source data: one grouped query, one upsert.
+    Returns the written instances.
+    """
+    tier = TIERS[tier_name]
+    queryset = tier.source.objects.filter(timestamp__gte=start_time, timestamp__lt=end_time)
+    if tier.source is SensorReading:
+        summaries = summarize_readings(queryset, tier.kind)
+    else:
+        summaries = summarize_aggregates(queryset, tier.kind)
+    return upsert_aggregates(tier.model, summaries)
+
+
+def merge_aggregates(model, rows):
+    """
+    Add partial statistics into aggregation rows, creating them if needed.
+
+    rows are dicts with sensor_id, timestamp, count, sum, sum_sq, min and max.
+    Existing rows are combined in the database (INSERT ... ON CONFLICT DO
+    UPDATE), so concurrent writers and late data merge exactly instead of
+    overwriting each other. All batches are written in one transaction, so
+    a failed write merges nothing. Supported on SQLite and PostgreSQL.
+    """
+    if not rows:
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+
+    def merged(column):
+        return f'({table}.{qn(column)} + excluded.{qn(column)})'
+
+    count, total, total_sq = merged('count'), merged('sum'), merged('sum_sq')
+    mean = f'({total} / {count})'
+    assignments = {
+        'count': count,
+        'sum': total,
+        'sum_sq': total_sq,
+        'min': f'{least}({table}.{qn("min")}, excluded.{qn("min")})',
+        'max': f'{greatest}({table}.{qn("max")}, excluded.{qn("max")})',
+        'avg': mean,
+        'std': f'SQRT({greatest}({total_sq} / {count} - {mean} * {mean}, 0.0))',
+    }
+    columns = ['sensor_id', 'timestamp', 'created_at'] + AGGREGATE_FIELDS
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = []
+    for row in rows:
+        fields = finalize(row['count'], row['sum'], row['sum_sq'], row['min'], row['max'])
+        params.append(
+            [row['sensor_id'], connection.ops.adapt_datetimefield_value(row['timestamp']), now]
+            + [fields[name] for name in AGGREGATE_FIELDS]
+        )
+
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    batch_size = connection.ops.bulk_batch_size(columns, params)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(params), batch_size):
+            batch = params[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(qn(c) for c in columns)}) '
+                f'VALUES {", ".join([placeholder] * len(batch))} '
+                f'ON CONFLICT ({qn("sensor_id")}, {qn("timestamp")}) DO UPDATE SET '
+                + ', '.join(f'{qn(c)} = {expr}' for c, expr in assignments.items()),
+                [value for row in batch for value in row]
+            )
+
+
+def catch_up(tier_name, now=None):
+    """
+    Aggregate every closed bucket of a tier from its watermark up to now.
+
+    The range also reaches LATENESS seconds behind the watermark so late
+    readings are folded in, and is processed in chunks of CHUNK_BUCKETS
+    buckets (at most MAX_CHUNKS_PER_RUN per call) to bound memory and run
+    time. The watermark advances after each chunk in the same transaction.
+
+    Returns a CatchUpResult with the number of rows written, the rows of
+    buckets closed for the first time in any chunk (in time order, at most
+    the newest MAX_NEW_ROWS), and the new watermark.
+    """
+    started = time.perf_counter()
+    config = _config()
+    tier = TIERS[tier_name]
+    closed_end = bucket_start(now or timezone.now(), tier.kind)
+
+    stored = AggregationWatermark.objects.filter(tier=tier_name).first()
+    watermark = stored.watermark if stored else closed_end - tier.width
+    lateness = timedelta(seconds=config['LATENESS'][tier_name])
+    start_time = bucket_start(min(watermark, closed_end - lateness), tier.kind)
+    chunk = tier.width * config['CHUNK_BUCKETS'][tier_name]
+
+    previous_watermark = watermark
+    count = 0
+    new_rows = []
+    for _ in range(config['MAX_CHUNKS_PER_RUN']):
+        if start_time >= closed_end:
+            break
+        end_time = min(start_time + chunk, closed_end)
+        with transaction.atomic():
+            rows = aggregate_range(tier_name, start_time, end_time)
+            if end_time > watermark:
+                watermark = end_time
+                AggregationWatermark.objects.update_or_create(
+                    tier=tier_name, defaults={'watermark': watermark}
+                )
+        count += len(rows)
+        new_rows.extend(row for row in rows if row.timestamp >= previous_watermark)
+        del new_rows[:-config['MAX_NEW_ROWS']]
+        start_time = end_time
+
+    metrics.AGGREGATION_SECONDS.observe(time.perf_counter() - started, tier=tier_name)
+    metrics.AGGREGATION_ROWS.inc(count, tier=tier_name)
+    return CatchUpResult(count, new_rows, watermark)
+
+
+def advance_watermark(tier_name, watermark):
+    """Move a tier's watermark forward to watermark; never moves it back"""
+    updated = AggregationWatermark.objects.filter(tier=tier_name, watermark__lt=watermark).update(watermark=watermark)
+    if not updated:
+        AggregationWatermark.objects.get_or_create(tier=tier_name, defaults={'watermark': watermark})
+
+
+def final_until(tier_name):
+    """
+    Rows of a tier before this time are final: catch_up never re-aggregates
+    buckets older than the watermark minus the LATENESS window. None if the
+    tier has no watermark yet.
+    """
+    watermark = AggregationWatermark.objects.filter(tier=tier_name).values_list(
+        'watermark', flat=True
+    ).first()
+    if watermark is None:
+        return None
+    return watermark - timedelta(seconds=_config()['LATENESS'][tier_name])
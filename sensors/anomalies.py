@@ -0,0 +1,292 @@
+"""
+In-process, vectorized anomaly detection over 1-second aggregates.
+
+detect_anomalies used to run as one Celery task per sensor per second, each
+issuing a count() and an aggregate(Avg, StdDev) over the last 10 minutes of
+SensorAggregated1Sec. The engine instead keeps those 10 minutes in memory as
+one ring buffer per sensor, indexed by epoch second, and scores every sensor
+of a tick in a single NumPy pass. Anomalies are written with one
+bulk_create.
+
+The rules match detect_anomalies exactly: population mean and standard
+deviation of the 1-second averages in [timestamp - window, timestamp),
+at least MIN_HISTORY points, spikes beyond SPIKE_THRESHOLD standard
+deviations and values outside [SENSOR_MIN, SENSOR_MAX].
+
+Ring buffers are filled from the database on first sight of a sensor and
+whenever the process has missed seconds (e.g. Celery ticks handled by
+another worker), so several processes can each run an engine.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .ingest import EPOCH
+from .models import Anomaly, SensorAggregated1Sec
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    'WINDOW_SECONDS': 600,
+    'MIN_HISTORY': 30,
+}
+
+# Sensor-specific thresholds (these would normally come from config/database)
+SENSOR_MIN = 0.0  # Minimum expected value
+SENSOR_MAX = 100.0  # Maximum expected value
+SPIKE_THRESHOLD = 3.0  # Number of standard deviations
+HIGH_SEVERITY_THRESHOLD = 5.0
+
+
+def _epoch_seconds(dt):
+    return int((dt - EPOCH).total_seconds())
+
+
+class AnomalyEngine:
+    """Rolling per-sensor windows of 1-second averages with batched scoring"""
+
+    def __init__(self, window_seconds=600, min_history=30):
+        self.window_seconds = window_seconds
+        self.min_history = min_history
+
+        # The window plus the second being scored
+        self.slots = window_seconds + 1
+
+        self._lock = threading.Lock()
+        # One row per sensor id, one slot per second (second % slots)
+        self._seconds = np.full((0, self.slots), -1, dtype=np.int64)
+        self._sums = np.zeros((0, self.slots))
+        self._counts = np.zeros((0, self.slots))
+        # Per sensor: seconds below this are known to match the database
+        self._synced_until = {}
+
+        # Metrics
+        self._ticks = 0
+        self._scored = 0
+        self._anomalies = 0
+        self._warm_queries = 0
+
+    def _ensure_capacity(self, max_sensor_id):
+        rows = self._seconds.shape[0]
+        if max_sensor_id < rows:
+            return
+        extra = max_sensor_id + 1 - rows
+        self._seconds = np.vstack([self._seconds, np.full((extra, self.slots), -1, dtype=np.int64)])
+        self._sums = np.vstack([self._sums, np.zeros((extra, self.slots))])
+        self._counts = np.vstack([self._counts, np.zeros((extra, self.slots))])
+
+    def _observe(self, sensor_ids, seconds, sums, counts, merge):
+        """Write 1-second statistics into the ring buffers"""
+        if not len(sensor_ids):
+            return
+        self._ensure_capacity(int(sensor_ids.max()))
+        slots = seconds % self.slots
+
+        # Slots still holding an older second start over
+        stale = self._seconds[sensor_ids, slots] != seconds
+        self._seconds[sensor_ids, slots] = seconds
+        self._sums[sensor_ids[stale], slots[stale]] = 0.0
+        self._counts[sensor_ids[stale], slots[stale]] = 0.0
+
+        if merge:
+            np.add.at(self._sums, (sensor_ids, slots), sums)
+            np.add.at(self._counts, (sensor_ids, slots), counts)
+        else:
+            self._sums[sensor_ids, slots] = sums
+            self._counts[sensor_ids, slots] = counts
+
+    def _warm(self, first_seconds):
+        """
+        Load seconds the ring buffers have not seen from SensorAggregated1Sec,
+        for every sensor in first_seconds ({sensor_id: first second of the
+        incoming batch}) in one query.
+        """
+        needed = {}
+        for sensor_id, first in first_seconds.items():
+            start = max(self._synced_until.get(sensor_id, first - self.window_seconds),
+                        first - self.window_seconds)
+            if start < first:
+                needed[sensor_id] = (start, first)
+        if not needed:
+            return
+
+        start = min(lower for lower, _ in needed.values())
+        end = max(upper for _, upper in needed.values())
+        rows = SensorAggregated1Sec.objects.filter(
+            sensor_id__in=list(needed),
+            timestamp__gte=EPOCH + timedelta(seconds=start),
+            timestamp__lt=EPOCH + timedelta(seconds=end),
+        ).values_list('sensor_id', 'timestamp', 'sum', 'count')
+        self._warm_queries += 1
+
+        # Only fill each sensor's own gap so nothing already held is counted twice
+        rows = [
+            (sensor_id, second, total, count)
+            for sensor_id, second, total, count in (
+                (sensor_id, _epoch_seconds(ts), total, count) for sensor_id, ts, total, count in rows
+            )
+            if needed[sensor_id][0] <= second < needed[sensor_id][1]
+        ]
+        if rows:
+            sensor_ids, seconds, sums, counts = map(np.array, zip(*rows))
+            self._observe(sensor_ids.astype(np.int64), seconds.astype(np.int64),
+                          sums.astype(np.float64), counts.astype(np.float64), merge=False)
+        for sensor_id, (_, upper) in needed.items():
+            self._synced_until[sensor_id] = upper
+
+    def _score(self, sensor_ids, seconds):
+        """
+        Rolling statistics over [second - window, second) for one latest
+        value per sensor. Returns (history counts, means, stds).
+        """
+        block_seconds = self._seconds[sensor_ids]
+        block_counts = self._counts[sensor_ids]
+        in_window = (
+            (block_seconds >= (seconds - self.window_seconds)[:, None])
+            & (block_seconds < seconds[:, None])
+            & (block_counts > 0)
+        )
+        averages = np.divide(self._sums[sensor_ids], block_counts,
+                             out=np.zeros_like(block_counts), where=in_window)
+
+        history = in_window.sum(axis=1)
+        safe_history = np.maximum(history, 1)
+        means = averages.sum(axis=1) / safe_history
+        deviations = np.where(in_window, averages - means[:, None], 0.0)
+        stds = np.sqrt((deviations ** 2).sum(axis=1) / safe_history)
+        return history, means, stds
+
+    def process(self, sensor_ids, timestamps, sums, counts, merge=False, score=None):
+        """
+        Record a tick of 1-second statistics and score the latest second of
+        each sensor. With merge=True the statistics are partial and add to
+        any already recorded for the same second (streaming late data).
+        score optionally flags the rows that may be scored (seconds seen
+        for the first time); the others are only recorded, so a late
+        partial second is never scored again.
+        Returns the created Anomaly instances.
+        """
+        if not len(sensor_ids):
+            return []
+
+        started = time.perf_counter()
+        sensor_ids = np.asarray(sensor_ids, dtype=np.int64)
+        seconds = np.array([_epoch_seconds(ts) for ts in timestamps], dtype=np.int64)
+        sums = np.asarray(sums, dtype=np.float64)
+        counts = np.asarray(counts, dtype=np.float64)
+
+        scored = [True] * len(sensor_ids) if score is None else list(score)
+
+        with self._lock:
+            first_seconds = {}
+            newest = {}
+            latest = {}
+            for index, (sensor_id, second) in enumerate(zip(sensor_ids.tolist(), seconds.tolist())):
+                if second < first_seconds.get(sensor_id, second + 1):
+                    first_seconds[sensor_id] = second
+                newest[sensor_id] = max(newest.get(sensor_id, second), second)
+                if scored[index] and (sensor_id not in latest or second > seconds[latest[sensor_id]]):
+                    latest[sensor_id] = index
+
+            self._warm(first_seconds)
+            self._observe(sensor_ids, seconds, sums, counts, merge)
+            for sensor_id, second in newest.items():
+                self._synced_until[sensor_id] = max(self._synced_until[sensor_id], second + 1)
+
+            index = np.fromiter(latest.values(), dtype=np.int64, count=len(latest))
+            score_ids = sensor_ids[index]
+            score_seconds = seconds[index]
+            slots = score_seconds % self.slots
+            values = self._sums[score_ids, slots] / self._counts[score_ids, slots]
+            history, means, stds = self._score(score_ids, score_seconds)
+
+            self._ticks += 1
+            self._scored += len(index)
+
+        enough = history >= self.min_history
+        distance = np.abs(values - means)
+        spikes = enough & (stds > 0) & (distance > SPIKE_THRESHOLD * stds)
+        out_of_range = enough & ((values < SENSOR_MIN) | (values > SENSOR_MAX))
+
+        anomalies = []
+        for i in np.flatnonzero(spikes | out_of_range).tolist():
+            sensor_id = int(score_ids[i])
+            timestamp = EPOCH + timedelta(seconds=int(score_seconds[i]))
+            value, mean, std = float(values[i]), float(means[i]), float(stds[i])
+            if spikes[i]:
+                anomalies.append(Anomaly(
+                    sensor_id=sensor_id,
+                    timestamp=timestamp,
+                    anomaly_type='spike',
+                    severity='high' if distance[i] > HIGH_SEVERITY_THRESHOLD * std else 'medium',
+                    value=value,
+                    expected_range_min=mean - (SPIKE_THRESHOLD * std),
+                    expected_range_max=mean + (SPIKE_THRESHOLD * std),
+                    description=f"Value {value:.2f} is {abs(value - mean) / std:.1f} std devs from mean {mean:.2f}"
+                ))
+            if out_of_range[i]:
+                anomalies.append(Anomaly(
+                    sensor_id=sensor_id,
+                    timestamp=timestamp,
+                    anomaly_type='out_of_range',
+                    severity='high',
+                    value=value,
+                    expected_range_min=SENSOR_MIN,
+                    expected_range_max=SENSOR_MAX,
+                    description=f"Value {value:.2f} is outside range [{SENSOR_MIN}, {SENSOR_MAX}]"
+                ))
+
+        if anomalies:
+            Anomaly.objects.bulk_create(anomalies)
+            self._anomalies += len(anomalies)
+            for anomaly in anomalies:
+                metrics.ANOMALIES_DETECTED.inc(anomaly_type=anomaly.anomaly_type)
+        metrics.ANOMALY_DETECTION_SECONDS.observe(time.perf_counter() - started)
+        return anomalies
+
+    def stats(self):
+        """Snapshot of engine metrics"""
+        with self._lock:
+            sensors = len(self._synced_until)
+        return {
+            'enabled': True,
+            'sensors': sensors,
+            'ticks': self._ticks,
+            'scored': self._scored,
+            'anomalies': self._anomalies,
+            'warm_queries': self._warm_queries,
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_ANOMALY_ENGINE', {})}
+
+
+def is_enabled():
+    return _config()['ENABLED']
+
+
+def get_engine():
+    """Return the process-wide anomaly engine, or None if disabled"""
+    global _engine
+
+    config = _config()
+    if not config['ENABLED']:
+        return None
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AnomalyEngine(
+                    window_seconds=config['WINDOW_SECONDS'],
+                    min_history=config['MIN_HISTORY'],
+                )
+    return _engine
@@ -0,0 +1,20 @@
+"""
+Performance benchmarks for the sensor pipeline.
+
+Each benchmark module exposes ``run(repeat, seed)`` returning a flat dict of
+results. Run them with ``python manage.py run_benchmarks [name ...]``.
+"""
+from . import aggregation, anomalies, broadcast, history, history_cache, history_stream, ingest, live, sensor_list, tasks
+
+BENCHMARKS = {
+    'ingest': ingest.run,
+    'aggregation': aggregation.run,
+    'tasks': tasks.run,
+    'anomalies': anomalies.run,
+    'sensor_list': sensor_list.run,
+    'history': history.run,
+    'history_stream': history_stream.run,
+    'history_cache': history_cache.run,
+    'live': live.run,
+    'broadcast': broadcast.run,
+}
@@ -0,0 +1,86 @@
+"""
+Aggregation tick cost at 12, 120 and 1200 sensors: the previous per-sensor
+loop (one aggregate() query and one update_or_create per sensor) against
+the grouped aggregate_range (one GROUP BY query and one bulk upsert).
+
+Each sensor gets one second of 60Hz raw readings, so this measures a
+single aggregate_1sec_data tick.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Count, F, Max, Min, Sum
+from django.utils import timezone
+
+from sensors.aggregation import aggregate_range, finalize
+from sensors.models import SensorReading, SensorAggregated1Sec
+from .base import benchmark_database, timed
+
+
+SENSOR_COUNTS = [12, 120, 1200]
+HZ = 60
+
+
+def _seed_second(sensor_count, start_time, seed):
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(HZ) * (1_000_000 // HZ)
+    values = rng.normal(50, 3, size=(sensor_count, HZ))
+    readings = [
+        SensorReading(
+            sensor_id=sensor_id,
+            timestamp=start_time + timedelta(microseconds=int(offset)),
+            value=float(value)
+        )
+        for sensor_id, row in zip(range(1, sensor_count + 1), values)
+        for offset, value in zip(offsets, row)
+    ]
+    SensorReading.objects.bulk_create(readings, batch_size=5000)
+
+
+def _per_sensor_tick(sensor_count, start_time, end_time):
+    """The pre-grouping implementation of aggregate_1sec_data"""
+    for sensor_id in range(1, sensor_count + 1):
+        agg = SensorReading.objects.filter(
+            sensor_id=sensor_id,
+            timestamp__gte=start_time,
+            timestamp__lt=end_time
+        ).aggregate(
+            n=Count('id'),
+            total=Sum('value'),
+            total_sq=Sum(F('value') * F('value')),
+            low=Min('value'),
+            high=Max('value')
+        )
+        if agg['n']:
+            SensorAggregated1Sec.objects.update_or_create(
+                sensor_id=sensor_id,
+                timestamp=start_time,
+                defaults=finalize(agg['n'], agg['total'], agg['total_sq'], agg['low'], agg['high'])
+            )
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    start_time = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+    end_time = start_time + timedelta(seconds=1)
+
+    with benchmark_database():
+        for sensor_count in SENSOR_COUNTS:
+            SensorReading.objects.all().delete()
+            _seed_second(sensor_count, start_time, seed)
+
+            per_sensor = min(
+                timed(_per_sensor_tick, sensor_count, start_time, end_time)[:2]
+                for _ in range(repeat)
+            )
+            grouped = min(
+                timed(aggregate_range, '1sec', start_time, end_time)[:2]
+                for _ in range(repeat)
+            )
+
+            results[f'{sensor_count}_sensors_per_sensor_ms'] = per_sensor[0] * 1000
+            results[f'{sensor_count}_sensors_per_sensor_queries'] = per_sensor[1]
+            results[f'{sensor_count}_sensors_grouped_ms'] = grouped[0] * 1000
+            results[f'{sensor_count}_sensors_grouped_queries'] = grouped[1]
+
+    return results
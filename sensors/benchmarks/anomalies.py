@@ -0,0 +1,94 @@
+"""
+Anomaly detection load per 1-second tick: the detect_anomalies fan-out (one
+Celery message and two window queries per sensor) against the in-process
+AnomalyEngine (one vectorized pass and at most one bulk insert per tick).
+
+Both run against ten minutes of seeded 1-second history for 12 sensors.
+The fan-out tasks are called inline, so its time excludes broker and
+worker overhead.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from sensors.aggregation import finalize
+from sensors.anomalies import AnomalyEngine
+from sensors.models import Anomaly, SensorAggregated1Sec
+from sensors.tasks import detect_anomalies
+from .base import benchmark_database, timed
+
+
+SENSORS = 12
+HISTORY_SECONDS = 600
+TICKS = 60
+
+
+def _seed(start_time, seed):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(50, 3, size=(SENSORS, HISTORY_SECONDS + TICKS, 60))
+    rows = [
+        SensorAggregated1Sec(
+            sensor_id=sensor_id,
+            timestamp=start_time + timedelta(seconds=second),
+            **finalize(60, float(window.sum()), float((window * window).sum()),
+                       float(window.min()), float(window.max()))
+        )
+        for sensor_id, seconds in zip(range(1, SENSORS + 1), values)
+        for second, window in enumerate(seconds)
+    ]
+    SensorAggregated1Sec.objects.bulk_create(rows, batch_size=5000)
+
+
+def _ticks(start_time):
+    rows = SensorAggregated1Sec.objects.filter(
+        timestamp__gte=start_time + timedelta(seconds=HISTORY_SECONDS)
+    ).order_by('timestamp', 'sensor_id')
+    ticks = {}
+    for row in rows:
+        ticks.setdefault(row.timestamp, []).append(row)
+    return list(ticks.values())
+
+
+def _fan_out(ticks):
+    """The previous path: one detect_anomalies task per sensor per second"""
+    for rows in ticks:
+        for row in rows:
+            detect_anomalies(row.sensor_id, row.timestamp, row.avg)
+
+
+def _engine(ticks):
+    engine = AnomalyEngine()
+    for rows in ticks:
+        engine.process(
+            [row.sensor_id for row in rows],
+            [row.timestamp for row in rows],
+            [row.sum for row in rows],
+            [row.count for row in rows],
+        )
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    start_time = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+
+    with benchmark_database():
+        _seed(start_time, seed)
+        ticks = _ticks(start_time)
+
+        for name, fn in [('fan_out', _fan_out), ('engine', _engine)]:
+            best = None
+            for _ in range(repeat):
+                Anomaly.objects.all().delete()
+                elapsed, queries, _ = timed(fn, ticks)
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, queries)
+            results[f'{name}_ms_per_tick'] = best[0] * 1000 / len(ticks)
+            results[f'{name}_queries_per_tick'] = best[1] / len(ticks)
+
+        # Every sensor's second was one broker message on the fan-out path
+        results['fan_out_broker_messages_per_tick'] = SENSORS
+        results['engine_broker_messages_per_tick'] = 0
+        results['anomalies'] = Anomaly.objects.count()
+
+    return results
@@ -0,0 +1,66 @@
+"""
+Shared helpers for benchmarks that need a database.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from sensors import seeding
+
+
+# Local memory, so no Redis server is needed
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'history': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-history'},
+}
+LOCAL_CHANNEL_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the block against a throwaway test database so benchmarks never
+    touch the configured one. The database is destroyed afterwards.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timed(fn, *args, **kwargs):
+    """Call fn once; return (seconds, query count, result)"""
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+    return elapsed, len(queries), result
+
+
+def seed_database(seed, end_time, seconds, frequency=60, sensor_ids=range(1, 13)):
+    """
+    Fill the benchmark database with seed_sensors data: the same seed,
+    range and sensors always give the same readings and aggregation tiers.
+    Returns the start of the seeded range.
+    """
+    start_time = end_time - timedelta(seconds=seconds)
+    for block in seeding.plan_blocks(seed, list(sensor_ids), start_time, seconds, frequency):
+        seeding.seed_block(block)
+    seeding.aggregate_tiers(start_time, end_time)
+    return start_time
+
+
+def best_of(fn, repeat, before=None):
+    """Call fn repeat times (before() ahead of each); return the fastest (seconds, query count)"""
+    runs = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        runs.append(timed(fn)[:2])
+    return min(runs)
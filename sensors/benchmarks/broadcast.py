@@ -0,0 +1,194 @@
+"""
+Channel layer cost of pushing aggregation ticks to WebSocket clients: one
+group_send per sensor per tick through async_to_sync (a new event loop per
+call) against one sensor_batch frame per tick through the TickPublisher's
+persistent loop.
+
+Uses an in-memory channel layer with CLIENTS subscribed channels, so no
+Redis server is needed. With channels_redis each group_send is also a
+network round trip, which makes the message count matter more; the
+in-memory layer instead deep-copies each message per client, which
+favours small messages. Reports group_send messages per second achieved,
+and frames and bytes each client receives per tick (at one tick per
+second, frames per tick is the client frame rate).
+
+The fan-out part sends the same ticks with one group_send each and cuts
+every delivered frame down with broadcast.filter_frame, as the consumer
+does: every client on every sensor, against each client subscribed to one
+sensor, counting group_sends, frames sent to clients and their bytes per
+tick over all clients.
+
+The consumer part runs CONSUMER_CLIENTS real SensorDataConsumer instances
+(driven through asgiref's ApplicationCommunicator, no server) on the
+in-memory layer and reports the sensor_batch frames per second they
+deliver to their WebSockets, group_send to websocket.send.
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.test.utils import override_settings
+
+from sensors.aggregation import finalize
+from sensors.broadcast import TickPublisher, build_frame, filter_frame
+from sensors.consumers import SensorDataConsumer
+from .base import LOCAL_CACHE, LOCAL_CHANNEL_LAYER
+
+
+SENSORS = 12
+CLIENTS = 50
+TICKS = 200
+GROUP = 'sensors'
+CONSUMER_CLIENTS = 20
+START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _ticks(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(50, 3, (TICKS, SENSORS)).tolist()
+    return [
+        [
+            {
+                'sensor_id': sensor_id,
+                'timestamp': START + timedelta(seconds=tick),
+                **finalize(60, value * 60, value * value * 60, value - 1, value + 1),
+            }
+            for sensor_id, value in enumerate(tick_values, start=1)
+        ]
+        for tick, tick_values in enumerate(values)
+    ]
+
+
+async def _subscribe(layer):
+    channels = []
+    for _ in range(CLIENTS):
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        channels.append(channel)
+    return channels
+
+
+async def _fanout(layer, channels, subscriptions, ticks):
+    sends = 0
+    for rows in ticks:
+        await layer.group_send(GROUP, {'type': 'sensor_batch', 'data': build_frame(rows)})
+        sends += 1
+    deliveries = total_bytes = 0
+    for channel, sensor_ids in zip(channels, subscriptions):
+        frames, size = await _drain(layer, channel, sensor_ids)
+        deliveries += frames
+        total_bytes += size
+    return sends, deliveries, total_bytes
+
+
+async def _drain(layer, channel, sensor_ids=None):
+    """Frames (cut down to sensor_ids) and their bytes waiting on a channel"""
+    frames = total_bytes = 0
+    queue = layer.channels.get(channel)
+    while queue is not None and not queue.empty():
+        message = await layer.receive(channel)
+        frame = filter_frame(message['data'], sensor_ids)
+        if frame is not None:
+            frames += 1
+            total_bytes += len(json.dumps(frame))
+    return frames, total_bytes
+
+
+def _per_sensor(layer, ticks):
+    """The naive hook: one group_send per sensor per tick"""
+    sent = 0
+    for rows in ticks:
+        for sensor in build_frame(rows)['sensors']:
+            async_to_sync(layer.group_send)(GROUP, {'type': 'sensor_update', 'data': {'type': 'sensor_data', **sensor}})
+            sent += 1
+    return sent
+
+
+def _batched(publisher, ticks):
+    futures = [publisher.publish(build_frame(rows), group=GROUP) for rows in ticks]
+    for future in futures:
+        future.result()
+    return len(futures)
+
+
+async def _consumer_throughput(ticks):
+    """Connect CONSUMER_CLIENTS consumers, send every tick, wait until all are delivered"""
+    application = SensorDataConsumer.as_asgi()
+    clients = []
+    for _ in range(CONSUMER_CLIENTS):
+        client = ApplicationCommunicator(application, {'type': 'websocket', 'path': '/ws/sensors/', 'headers': []})
+        await client.send_input({'type': 'websocket.connect'})
+        await client.receive_output(5)  # websocket.accept
+        await client.receive_output(5)  # connection_established
+        clients.append(client)
+
+    layer = get_channel_layer()
+    frames = [build_frame(rows) for rows in ticks]
+    started = time.perf_counter()
+    for frame in frames:
+        await layer.group_send(GROUP, {'type': 'sensor_batch', 'data': frame})
+    total_bytes = 0
+    for client in clients:
+        for _ in frames:
+            total_bytes += len((await client.receive_output(5))['text'])
+    elapsed = time.perf_counter() - started
+
+    for client in clients:
+        await client.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await client.wait(5)
+    return elapsed, total_bytes
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    ticks = _ticks(seed)
+
+    for name in ['per_sensor', 'batched']:
+        layer = InMemoryChannelLayer(capacity=SENSORS * TICKS + 1)
+        publisher = TickPublisher(channel_layer=layer) if name == 'batched' else None
+        try:
+            channels = async_to_sync(_subscribe)(layer)
+
+            started = time.perf_counter()
+            if publisher is None:
+                messages = _per_sensor(layer, ticks)
+            else:
+                messages = _batched(publisher, ticks)
+            elapsed = time.perf_counter() - started
+
+            frames, total_bytes = async_to_sync(_drain)(layer, channels[0])
+        finally:
+            if publisher is not None:
+                publisher.close()
+
+        results[f'{name}_group_sends'] = messages
+        results[f'{name}_group_sends_per_sec'] = messages / elapsed
+        results[f'{name}_ticks_per_sec'] = TICKS / elapsed
+        results[f'{name}_client_frames_per_tick'] = frames / TICKS
+        results[f'{name}_client_bytes_per_tick'] = total_bytes / TICKS
+        results[f'{name}_deliveries_per_tick'] = frames * CLIENTS / TICKS
+
+    one_sensor_each = [{client % SENSORS + 1} for client in range(CLIENTS)]
+    for name, subscriptions in [('fanout_all_sensors', [None] * CLIENTS), ('fanout_one_sensor_each', one_sensor_each)]:
+        layer = InMemoryChannelLayer(capacity=SENSORS * TICKS + 1)
+        channels = async_to_sync(_subscribe)(layer)
+        sends, deliveries, total_bytes = async_to_sync(_fanout)(layer, channels, subscriptions, ticks)
+
+        results[f'{name}_group_sends_per_tick'] = sends / TICKS
+        results[f'{name}_deliveries_per_tick'] = deliveries / TICKS
+        results[f'{name}_bytes_per_tick'] = total_bytes / TICKS
+
+    # Room for every tick in each consumer's channel
+    layer_settings = {'default': {**LOCAL_CHANNEL_LAYER['default'], 'CONFIG': {'capacity': TICKS + 1}}}
+    with override_settings(CACHES=LOCAL_CACHE, CHANNEL_LAYERS=layer_settings):
+        elapsed, total_bytes = min(async_to_sync(_consumer_throughput)(ticks) for _ in range(max(1, repeat // 2)))
+    results['consumer_clients'] = CONSUMER_CLIENTS
+    results['consumer_frames_per_sec'] = CONSUMER_CLIENTS * TICKS / elapsed
+    results['consumer_ticks_per_sec'] = TICKS / elapsed
+    results['consumer_mb_per_sec'] = total_bytes / elapsed / 1e6
+
+    return results
@@ -0,0 +1,49 @@
+"""
+get_historical_data latency per resolution on a seed_sensors database:
+two days of 1Hz readings for sensor 1 with all aggregation tiers.
+
+- 1sec: the last hour (3,600 rows)
+- 1min: the whole range (2,880 rows)
+- 1hour: the whole range (48 rows)
+- auto: the whole range with the default point budget
+
+The closed-window cache is disabled so every request reads the database
+(history_cache measures the cache).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from sensors.views import get_historical_data
+from .base import LOCAL_CACHE, benchmark_database, best_of, seed_database
+
+
+DAYS = 2
+END = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    factory = APIRequestFactory()
+
+    with benchmark_database(), override_settings(CACHES=LOCAL_CACHE, SENSOR_HISTORY_CACHE={'ENABLED': False}):
+        start = seed_database(seed, END, DAYS * 86400, frequency=1, sensor_ids=[1])
+
+        for resolution, start_time in [
+            ('1sec', END - timedelta(hours=1)),
+            ('1min', start),
+            ('1hour', start),
+            ('auto', start),
+        ]:
+            params = {'start_time': start_time.isoformat(), 'end_time': END.isoformat(), 'resolution': resolution}
+
+            def request():
+                return get_historical_data(factory.get('/api/sensors/1/history/', params), sensor_id=1).render()
+
+            seconds, queries = best_of(request, repeat)
+            results[f'{resolution}_points'] = request().data['count']
+            results[f'{resolution}_ms'] = seconds * 1000
+            results[f'{resolution}_queries'] = queries
+
+    return results
@@ -0,0 +1,83 @@
+"""
+Latency of a closed 1-minute history window (one week of one sensor):
+uncached, with the history cache cold (blocks read and stored) and warm
+(served from cached blocks, one watermark query), plus a window that
+overlaps the open tail, composed of cached blocks and a fresh query.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from sensors import history_cache
+from sensors.aggregation import finalize
+from sensors.models import AggregationWatermark, SensorAggregated1Min
+from sensors.views import get_historical_data
+from .base import benchmark_database, timed
+
+
+DAYS = 7
+START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+# Local memory, so no Redis server is needed
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'history': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'history-benchmark'},
+}
+
+
+def _seed(seed):
+    minutes = DAYS * 1440
+    rng = np.random.default_rng(seed)
+    SensorAggregated1Min.objects.bulk_create(
+        [
+            SensorAggregated1Min(
+                sensor_id=1,
+                timestamp=START + timedelta(minutes=minute),
+                **finalize(60, value * 60, value * value * 60, value, value)
+            )
+            for minute, value in enumerate(rng.normal(50, 3, minutes).tolist())
+        ],
+        batch_size=5000
+    )
+    # Everything but the last six hours is closed
+    AggregationWatermark.objects.create(tier='1min', watermark=START + timedelta(days=DAYS, hours=-6))
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    factory = APIRequestFactory()
+
+    def request(end_time):
+        params = {
+            'start_time': START.isoformat(),
+            'end_time': end_time.isoformat(),
+            'resolution': '1min',
+        }
+        return get_historical_data(factory.get('/api/sensors/1/history/', params), sensor_id=1).render()
+
+    closed_end = START + timedelta(days=DAYS - 1)
+    open_end = START + timedelta(days=DAYS)
+
+    with benchmark_database(), override_settings(CACHES=LOCAL_CACHE):
+        _seed(seed)
+
+        for name, end_time, enabled, before in [
+            ('uncached', closed_end, False, None),
+            ('cold', closed_end, True, history_cache.clear),
+            ('warm', closed_end, True, None),
+            ('open_tail_warm', open_end, True, None),
+        ]:
+            runs = []
+            with override_settings(SENSOR_HISTORY_CACHE={'ENABLED': enabled}):
+                for _ in range(repeat):
+                    if before is not None:
+                        before()
+                    runs.append(timed(request, end_time)[:2])
+            seconds, queries = min(runs)
+            results[f'{name}_ms'] = seconds * 1000
+            results[f'{name}_queries'] = queries
+
+        results.update(history_cache.stats())
+
+    return results
@@ -0,0 +1,83 @@
+"""
+Peak memory and time of a large 1sec history response: the default JSON
+response (queryset and serializer output materialized) against streamed
+NDJSON and CSV.
+
+Peak memory is the tracemalloc peak while producing and consuming the
+response body, measured at two range sizes. The process RSS high-water
+mark cannot be reset between runs, so it would only show the largest
+run. Streamed peaks should stay flat as the range grows.
+"""
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from rest_framework.test import APIRequestFactory
+
+from sensors.aggregation import finalize
+from sensors.models import SensorAggregated1Sec
+from sensors.views import get_historical_data
+from .base import benchmark_database
+
+
+ROW_COUNTS = [25_000, 100_000]
+START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _seed(rows, seed):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(50, 3, rows)
+    SensorAggregated1Sec.objects.bulk_create(
+        [
+            SensorAggregated1Sec(
+                sensor_id=1,
+                timestamp=START + timedelta(seconds=second),
+                **finalize(60, value * 60, value * value * 60, value, value)
+            )
+            for second, value in enumerate(values.tolist())
+        ],
+        batch_size=5000
+    )
+
+
+def _consume(factory, rows, output):
+    params = {
+        'start_time': START.isoformat(),
+        'end_time': (START + timedelta(seconds=rows - 1)).isoformat(),
+        'resolution': '1sec',
+    }
+    if output != 'json':
+        params['format'] = output
+    response = get_historical_data(factory.get('/api/sensors/1/history/', params), sensor_id=1)
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.render().content)
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    factory = APIRequestFactory()
+
+    with benchmark_database():
+        for rows in ROW_COUNTS:
+            SensorAggregated1Sec.objects.all().delete()
+            _seed(rows, seed)
+
+            for output in ['json', 'ndjson', 'csv']:
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    size = _consume(factory, rows, output)
+                    timings.append(time.perf_counter() - started)
+
+                tracemalloc.start()
+                _consume(factory, rows, output)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                results[f'{rows}_rows_{output}_ms'] = min(timings) * 1000
+                results[f'{rows}_rows_{output}_peak_mb'] = peak / 2**20
+                results[f'{rows}_rows_{output}_mb'] = size / 2**20
+
+    return results
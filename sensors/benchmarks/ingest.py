@@ -0,0 +1,144 @@
+"""
+Ingest decode/validation throughput for each payload path:
+
+- serializer: JSON body through SensorReadingBulkCreateSerializer
+- fast_path: JSON body through the columnar parse_json_readings
+- binary: columnar binary frame through decode_binary_readings
+
+Every path goes from request body bytes to a validated ReadingBatch.
+Building SensorReading instances for bulk_create is the same for all paths
+and is reported separately (model_build) so the decode cost is not drowned
+by model __init__.
+
+The view_* results POST the same payloads through ingest_sensor_data with
+the write buffer off, so each request is decoded and stored before it
+returns. budget_x is that throughput over the 720 readings/s of 12
+sensors at 60Hz.
+"""
+import json
+import random
+import time
+from datetime import timedelta
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from sensors.ingest import (
+    BINARY_CONTENT_TYPE,
+    EPOCH,
+    ONE_MICROSECOND,
+    ReadingBatch,
+    decode_binary_readings,
+    encode_binary_readings,
+    parse_json_readings
+)
+from sensors.serializers import SensorReadingBulkCreateSerializer
+from sensors.views import ingest_sensor_data
+from .base import LOCAL_CACHE, benchmark_database, best_of
+
+
+READINGS = 7200  # 10 seconds of 60Hz data from 12 sensors
+BUDGET_READINGS_PER_SEC = 12 * 60
+
+
+def make_payload(readings=READINGS, seed=0):
+    """Build a deterministic ingest payload shaped like the Pi simulator's"""
+    rng = random.Random(seed)
+    start = timezone.now().replace(microsecond=0)
+    step = timedelta(seconds=1.0 / 60.0)
+    return [
+        {
+            'sensor_id': (i % 12) + 1,
+            'timestamp': start + step * (i // 12),
+            'value': round(rng.gauss(50, 3), 2),
+        }
+        for i in range(readings)
+    ]
+
+
+def encode_json(payload):
+    return json.dumps([
+        {**reading, 'timestamp': reading['timestamp'].isoformat()}
+        for reading in payload
+    ]).encode()
+
+
+def encode_binary(payload):
+    return encode_binary_readings(
+        [reading['sensor_id'] for reading in payload],
+        [(reading['timestamp'] - EPOCH) // ONE_MICROSECOND for reading in payload],
+        [reading['value'] for reading in payload],
+        value_width=8
+    )
+
+
+def _serializer_path(body):
+    serializer = SensorReadingBulkCreateSerializer(data=json.loads(body), many=True)
+    serializer.is_valid(raise_exception=True)
+    return ReadingBatch.from_validated_data(serializer.validated_data)
+
+
+def _fast_path(body):
+    return parse_json_readings(json.loads(body))
+
+
+def _binary_path(body):
+    return decode_binary_readings(body)
+
+
+def _model_build(body):
+    return decode_binary_readings(body).to_models()
+
+
+def _best_time(fn, body, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(body)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(repeat=5, seed=0):
+    payload = make_payload(seed=seed)
+    json_body = encode_json(payload)
+    binary_body = encode_binary(payload)
+
+    serializer_time = _best_time(_serializer_path, json_body, repeat)
+    fast_time = _best_time(_fast_path, json_body, repeat)
+    binary_time = _best_time(_binary_path, binary_body, repeat)
+    model_time = _best_time(_model_build, binary_body, repeat)
+
+    results = {
+        'readings': len(payload),
+        'json_bytes_per_reading': len(json_body) / len(payload),
+        'binary_bytes_per_reading': len(binary_body) / len(payload),
+        'serializer_readings_per_sec': len(payload) / serializer_time,
+        'fast_path_readings_per_sec': len(payload) / fast_time,
+        'binary_readings_per_sec': len(payload) / binary_time,
+        'model_build_readings_per_sec': len(payload) / model_time,
+        'fast_path_speedup': serializer_time / fast_time,
+        'binary_speedup': serializer_time / binary_time,
+    }
+
+    factory = APIRequestFactory()
+    with benchmark_database(), override_settings(
+        CACHES=LOCAL_CACHE,
+        SENSOR_INGEST_BUFFER={'ENABLED': False},
+        SENSOR_STREAMING_AGGREGATION={'ENABLED': False},
+    ):
+        for name, body, content_type in [
+            ('view_json', json_body, 'application/json'),
+            ('view_binary', binary_body, BINARY_CONTENT_TYPE),
+        ]:
+            def post():
+                response = ingest_sensor_data(factory.post('/api/sensors/ingest/', body, content_type=content_type))
+                assert response.status_code == 201, response.data
+
+            seconds, queries = best_of(post, repeat)
+            results[f'{name}_readings_per_sec'] = len(payload) / seconds
+            results[f'{name}_budget_x'] = len(payload) / seconds / BUDGET_READINGS_PER_SEC
+            results[f'{name}_queries'] = queries
+
+    return results
@@ -0,0 +1,85 @@
+"""
+p50/p99 latency of the live endpoints and the WebSocket get_latest query,
+reading SensorAggregated1Sec against the live ring buffers.
+
+Runs on a local-memory cache so no Redis server is needed. With Redis the
+ring path adds one get_many round trip.
+"""
+from datetime import timedelta
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from sensors import live
+from sensors.aggregation import finalize
+from sensors.consumers import SensorDataConsumer
+from sensors.models import SensorAggregated1Sec
+from sensors.views import get_batch_live_data, get_live_data
+from .base import benchmark_database, timed
+
+
+SENSORS = 12
+# An hour of history so the live window is a small slice of the table
+SECONDS = 3600
+REQUESTS = 200
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _seed(now, seed):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for sensor_id in range(1, SENSORS + 1):
+        for second, value in enumerate(rng.normal(50, 3, SECONDS).tolist()):
+            rows.append({
+                'sensor_id': sensor_id,
+                'timestamp': now - timedelta(seconds=SECONDS - second),
+                **finalize(60, value * 60, value * value * 60, value - 1, value + 1),
+            })
+    SensorAggregated1Sec.objects.bulk_create(
+        [SensorAggregated1Sec(**row) for row in rows],
+        batch_size=5000
+    )
+    # What the aggregator would have published
+    live.publish_rows([row for row in rows if row['timestamp'] >= now - timedelta(seconds=60)])
+
+
+def _percentiles(fn, requests):
+    samples = []
+    queries = 0
+    for _ in range(requests):
+        seconds, queries, _ = timed(fn)
+        samples.append(seconds * 1000)
+    return np.percentile(samples, 50), np.percentile(samples, 99), queries
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    factory = APIRequestFactory()
+    requests = REQUESTS * max(1, repeat) // 5
+
+    def single():
+        return get_live_data(factory.get('/api/sensors/3/live/'), sensor_id=3).render()
+
+    def batch():
+        return get_batch_live_data(factory.get('/api/sensors/live/')).render()
+
+    consumer = SensorDataConsumer()
+
+    def get_latest():
+        return async_to_sync(consumer.get_latest_sensor_data)()
+
+    with benchmark_database(), override_settings(CACHES=LOCAL_CACHE):
+        _seed(timezone.now().replace(microsecond=0), seed)
+
+        for source, enabled in [('database', False), ('ring', True)]:
+            with override_settings(SENSOR_LIVE_BUFFER={'ENABLED': enabled}):
+                for name, fn in [('live', single), ('batch_live', batch), ('ws_get_latest', get_latest)]:
+                    p50, p99, queries = _percentiles(fn, requests)
+                    results[f'{name}_{source}_p50_ms'] = p50
+                    results[f'{name}_{source}_p99_ms'] = p99
+                    results[f'{name}_{source}_queries'] = queries
+
+    return results
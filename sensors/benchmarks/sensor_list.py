@@ -0,0 +1,88 @@
+"""
+/api/sensors/list/ latency: the previous per-sensor ORDER BY ... LIMIT 1
+queries against the latest-value registry, cold (loaded from the database)
+and warm (no queries).
+
+Runs on a local-memory cache so no Redis server is needed. With Redis the
+warm path adds one get_many round trip.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from sensors import latest
+from sensors.models import SensorReading
+from sensors.serializers import SensorListSerializer
+from sensors.views import list_sensors
+from .base import benchmark_database, timed
+
+
+SENSORS = 12
+READINGS_PER_SENSOR = 20000
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _seed(now, seed):
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(READINGS_PER_SENSOR) * (1_000_000 // 60)
+    readings = [
+        SensorReading(
+            sensor_id=sensor_id,
+            timestamp=now - timedelta(microseconds=int(offset)),
+            value=float(value)
+        )
+        for sensor_id in range(1, SENSORS + 1)
+        for offset, value in zip(offsets, rng.normal(50, 3, READINGS_PER_SENSOR))
+    ]
+    SensorReading.objects.bulk_create(readings, batch_size=5000)
+
+
+def _per_sensor_list():
+    """The pre-registry implementation of list_sensors"""
+    sensors_data = []
+    for sensor_id in range(1, SENSORS + 1):
+        last_reading = SensorReading.objects.filter(sensor_id=sensor_id).order_by('-timestamp').first()
+        sensors_data.append({
+            "sensor_id": sensor_id,
+            "name": f"Sensor {sensor_id}",
+            "status": "online" if last_reading else "no_data",
+            "last_reading_time": last_reading.timestamp if last_reading else None,
+            "last_value": last_reading.value if last_reading else None
+        })
+    serializer = SensorListSerializer(sensors_data, many=True)
+    return Response({"sensors": serializer.data, "count": len(sensors_data)})
+
+
+def _best(fn, repeat, before=None):
+    runs = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        runs.append(timed(fn)[:2])
+    return min(runs)
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    factory = APIRequestFactory()
+
+    def registry_list():
+        return list_sensors(factory.get('/api/sensors/list/')).render()
+
+    with benchmark_database(), override_settings(CACHES=LOCAL_CACHE):
+        _seed(timezone.now(), seed)
+
+        for name, fn, before in [
+            ('per_sensor', _per_sensor_list, None),
+            ('registry_cold', registry_list, latest.reset),
+            ('registry_warm', registry_list, None),
+        ]:
+            seconds, queries = _best(fn, repeat, before)
+            results[f'{name}_ms'] = seconds * 1000
+            results[f'{name}_queries'] = queries
+
+    return results
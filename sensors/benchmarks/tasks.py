@@ -0,0 +1,52 @@
+"""
+Wall time of the scheduled aggregation tasks (aggregate_1sec_data,
+aggregate_1min_data, aggregate_1hour_data) catching up on a fixed table:
+SECONDS of 60Hz seed_sensors data for 12 sensors, ending at the start of
+the current hour so every bucket is closed.
+
+Each run rewinds the tier's watermark to the start of the seeded range,
+so the task re-aggregates the whole range (MAX_CHUNKS_PER_RUN is lifted).
+The 1sec task also feeds the live rings, the anomaly engine and the
+broadcast, on a local-memory cache and an in-memory channel layer.
+"""
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from sensors import tasks
+from sensors.aggregation import DEFAULTS as AGGREGATION_DEFAULTS
+from sensors.models import AggregationWatermark, SensorAggregated1Min, SensorAggregated1Sec, SensorReading
+from .base import LOCAL_CACHE, LOCAL_CHANNEL_LAYER, benchmark_database, best_of, seed_database
+
+
+SECONDS = 600
+TASKS = {
+    '1sec': tasks.aggregate_1sec_data,
+    '1min': tasks.aggregate_1min_data,
+    '1hour': tasks.aggregate_1hour_data,
+}
+
+
+def run(repeat=5, seed=0):
+    results = {}
+    end_time = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    with benchmark_database(), override_settings(
+        CACHES=LOCAL_CACHE,
+        CHANNEL_LAYERS=LOCAL_CHANNEL_LAYER,
+        SENSOR_STREAMING_AGGREGATION={'ENABLED': False},
+        SENSOR_AGGREGATION={**AGGREGATION_DEFAULTS, 'MAX_CHUNKS_PER_RUN': 1000},
+    ):
+        start_time = seed_database(seed, end_time, SECONDS)
+        results['raw_rows'] = SensorReading.objects.count()
+        results['1sec_rows'] = SensorAggregated1Sec.objects.count()
+        results['1min_rows'] = SensorAggregated1Min.objects.count()
+
+        for tier, task in TASKS.items():
+            def rewind():
+                AggregationWatermark.objects.update_or_create(tier=tier, defaults={'watermark': start_time})
+
+            seconds, queries = best_of(task, repeat, before=rewind)
+            results[f'aggregate_{tier}_ms'] = seconds * 1000
+            results[f'aggregate_{tier}_queries'] = queries
+
+    return results
@@ -0,0 +1,236 @@
+"""
+Per-tick WebSocket broadcast of 1-second aggregates and new anomalies.
+
+Every aggregation tick (a run of aggregate_1sec_data, or an emit of the
+streaming aggregator) becomes one ``sensor_batch`` frame holding all
+sensors' emitted seconds and the anomalies found in the tick, sent with a
+single group_send instead of one message per sensor.
+
+Every client is in the all-sensors group, whatever it subscribed to; the
+consumer cuts each frame down to its sensors (filter_frame) and sends
+nothing if none are in the tick. So a tick costs one group_send however
+many sensors or subscriptions there are, and a client gets at most one
+frame per tick.
+
+The callers are synchronous (Celery tasks, the ingest emit thread).
+async_to_sync would start a fresh event loop, and with channels_redis a
+fresh connection, for every call, so a TickPublisher keeps one event loop
+running in a daemon thread per process and hands it each frame with
+run_coroutine_threadsafe. Publishing never blocks the aggregator.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .aggregation import finalize
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'GROUP': 'sensors',
+    # Newest rows kept in one frame (a catch-up run can emit thousands)
+    'MAX_FRAME_ROWS': 600,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_BROADCAST', {})}
+
+
+def is_enabled():
+    return _config()['ENABLED']
+
+
+def filter_frame(frame, sensor_ids):
+    """
+    The part of a sensor_batch frame for a client subscribed to sensor_ids
+    (None: every sensor), or None if nothing in it is for the client
+    """
+    if sensor_ids is None:
+        return frame
+    sensors = [row for row in frame['sensors'] if row['sensor_id'] in sensor_ids]
+    anomalies = [anomaly for anomaly in frame['anomalies'] if anomaly['sensor_id'] in sensor_ids]
+    if not sensors and not anomalies:
+        return None
+    return {
+        **frame,
+        'timestamp': sensors[-1]['timestamp'] if sensors else frame['timestamp'],
+        'sensors': sensors,
+        'anomalies': anomalies,
+    }
+
+
+def _isoformat(dt):
+    # Same representation as the serializers (UTC, 'Z' suffix)
+    value = dt.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def build_frame(rows, anomalies=(), max_rows=None):
+    """
+    The sensor_batch frame of one tick.
+
+    rows are emitted 1-second aggregates (dicts with sensor_id, timestamp,
+    count, sum, sum_sq, min and max), anomalies are Anomaly instances.
+    Only the newest max_rows rows are kept. Values are JSON/msgpack
+    friendly so the frame can cross the channel layer as is.
+    """
+    rows = sorted(rows, key=lambda row: (row['timestamp'], row['sensor_id']))
+    if max_rows is not None:
+        rows = rows[-max_rows:]
+
+    sensors = []
+    for row in rows:
+        fields = finalize(row['count'], row['sum'], row['sum_sq'], row['min'], row['max'])
+        sensors.append({
+            'sensor_id': row['sensor_id'],
+            'timestamp': _isoformat(row['timestamp']),
+            'avg': fields['avg'],
+            'min': fields['min'],
+            'max': fields['max'],
+            'std': fields['std'],
+            'count': fields['count'],
+        })
+
+    return {
+        'type': 'sensor_batch',
+        'timestamp': sensors[-1]['timestamp'] if sensors else None,
+        'sensors': sensors,
+        'anomalies': [
+            {
+                'sensor_id': anomaly.sensor_id,
+                'timestamp': _isoformat(anomaly.timestamp),
+                'anomaly_type': anomaly.anomaly_type,
+                'severity': anomaly.severity,
+                'value': anomaly.value,
+                'description': anomaly.description,
+            }
+            for anomaly in anomalies
+        ],
+    }
+
+
+class TickPublisher:
+    """
+    Sends channel layer group messages from synchronous code through one
+    long-lived event loop running in a daemon thread.
+    """
+
+    def __init__(self, channel_layer=None):
+        self._channel_layer = channel_layer
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='tick-publisher', daemon=True)
+        self._thread.start()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._failed = 0
+        self._pending = 0
+        self._last_send_seconds = 0.0
+        self._started = time.monotonic()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    @property
+    def channel_layer(self):
+        if self._channel_layer is None:
+            from channels.layers import get_channel_layer
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+
+    async def _send(self, group, message):
+        started = time.perf_counter()
+        await self.channel_layer.group_send(group, message)
+        return time.perf_counter() - started
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                if not future.cancelled():
+                    logger.error('Channel layer group_send failed', exc_info=future.exception())
+                metrics.CHANNEL_GROUP_SENDS.inc(result='failed')
+            else:
+                self._sent += 1
+                self._last_send_seconds = future.result()
+                metrics.CHANNEL_GROUP_SENDS.inc(result='sent')
+                metrics.CHANNEL_GROUP_SEND_SECONDS.observe(self._last_send_seconds)
+
+    def send(self, group, message):
+        """Queue one group_send on the publisher loop; returns a concurrent Future"""
+        with self._lock:
+            self._pending += 1
+        future = asyncio.run_coroutine_threadsafe(self._send(group, message), self._loop)
+        future.add_done_callback(self._done)
+        return future
+
+    def publish(self, frame, group=None):
+        """Send a frame to every client of the group as one sensor_batch message"""
+        return self.send(group or _config()['GROUP'], {'type': 'sensor_batch', 'data': frame})
+
+    def close(self, timeout=5):
+        """Let queued sends finish, then stop the loop"""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=timeout)
+
+    def stats(self):
+        """Messages sent, failed and in flight, the message rate and last send latency"""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            return {
+                'messages_sent': self._sent,
+                'messages_failed': self._failed,
+                'pending': self._pending,
+                'messages_per_second': self._sent / elapsed if elapsed > 0 else 0.0,
+                'last_send_ms': self._last_send_seconds * 1000,
+            }
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """Return the process-wide tick publisher, or None if broadcasting is disabled"""
+    global _publisher
+
+    if not is_enabled():
+        return None
+
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = TickPublisher()
+                atexit.register(_publisher.close)
+    return _publisher
+
+
+def publish_tick(rows, anomalies=()):
+    """
+    Broadcast one aggregation tick to the all-sensors group as one
+    sensor_batch message (no-op when empty or disabled). Returns the send
+    futures.
+    """
+    if not rows and not anomalies:
+        return []
+    publisher = get_publisher()
+    if publisher is None:
+        return []
+    try:
+        frame = build_frame(rows, anomalies, _config()['MAX_FRAME_ROWS'])
+        return [publisher.publish(frame)]
+    except Exception:
+        logger.exception('Could not publish sensor batch')
+        return []
@@ -0,0 +1,231 @@
+"""
+Write-behind buffer for sensor ingest.
+
+At the simulator's default batch size every device sends ~10 small POSTs per
+second, and inserting each one in its own implicit transaction makes SQLite
+serialize writers and fsync constantly. The buffer accepts validated
+ReadingBatches from the ingest view and a background thread writes them in
+a single transaction once MAX_ROWS readings are pending or FLUSH_INTERVAL
+seconds have passed, whichever comes first.
+
+Pending readings are bounded by MAX_PENDING; beyond that submit() raises
+IngestBufferFull and the view answers 429 so devices back off and retry.
+
+Readings are acknowledged before they are written, so a failed flush must
+not drop them: the merged batch goes back to the front of the queue and is
+retried with exponential backoff (capped at MAX_RETRY_BACKOFF seconds).
+Until a flush succeeds again submit() refuses new batches with
+IngestBufferFull, so the failure reaches devices as 429 backpressure
+instead of as lost readings.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics
+from .ingest import ReadingBatch, store_readings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_ROWS': 5000,
+    'FLUSH_INTERVAL': 0.25,
+    'MAX_PENDING': 50000,
+    'MAX_RETRY_BACKOFF': 5,
+}
+
+
+class IngestBufferFull(Exception):
+    """Raised when accepting a batch would exceed the buffer's capacity"""
+
+
+class IngestWriteBuffer:
+    """Thread-safe, bounded buffer that coalesces ingest batches"""
+
+    def __init__(self, max_rows=5000, flush_interval=0.25, max_pending=50000, max_retry_backoff=5):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retry_backoff = max_retry_backoff
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._batches = []
+        self._pending = 0
+        self._thread = None
+        self._closed = False
+        # Consecutive failed flushes; while non-zero new batches are refused
+        self._failures = 0
+        self._retry_at = 0.0
+
+        # Metrics
+        self._accepted = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._rows_failed = 0
+        self._failed_flushes = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    def submit(self, batch):
+        """Queue a validated ReadingBatch for writing"""
+        with self._cond:
+            if self._closed:
+                raise IngestBufferFull('Ingest buffer is shut down')
+            if self._failures:
+                self._rejected += len(batch)
+                metrics.INGEST_BUFFER_REJECTED.inc(len(batch))
+                raise IngestBufferFull(
+                    f'Ingest buffer cannot write to the database ({self._pending} readings pending)'
+                )
+            if self._pending + len(batch) > self.max_pending:
+                self._rejected += len(batch)
+                metrics.INGEST_BUFFER_REJECTED.inc(len(batch))
+                raise IngestBufferFull(
+                    f'Ingest buffer is full ({self._pending} readings pending)'
+                )
+
+            self._batches.append(batch)
+            self._pending += len(batch)
+            self._accepted += len(batch)
+            metrics.INGEST_BUFFER_DEPTH.inc(len(batch))
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='ingest-write-buffer', daemon=True
+                )
+                self._thread.start()
+            if self._pending >= self.max_rows:
+                self._cond.notify()
+
+    def flush(self):
+        """
+        Write everything pending now. Returns the number of readings written.
+        On failure the readings are requeued for a retry and 0 is returned.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batches, self._batches = self._batches, []
+                pending = self._pending
+
+            if not batches:
+                return 0
+
+            merged = ReadingBatch.concat(batches)
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    store_readings(merged)
+            except Exception:
+                with self._cond:
+                    # Back in front of anything submitted meanwhile, so retries keep arrival order
+                    self._batches.insert(0, merged)
+                    self._failures += 1
+                    self._failed_flushes += 1
+                    backoff = min(self.flush_interval * 2 ** self._failures, self.max_retry_backoff)
+                    self._retry_at = time.monotonic() + backoff
+                    failures = self._failures
+                logger.exception(
+                    'Failed to flush %d buffered sensor readings (attempt %d), retrying in %.2fs',
+                    len(merged), failures, backoff
+                )
+                return 0
+
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                self._pending -= pending
+                self._failures = 0
+                self._retry_at = 0.0
+            metrics.INGEST_BUFFER_DEPTH.dec(pending)
+            metrics.INGEST_BUFFER_FLUSH_SECONDS.observe(elapsed)
+            self._flushes += 1
+            self._rows_flushed += len(merged)
+            self._last_flush_seconds = elapsed
+            self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+            self._total_flush_seconds += elapsed
+            return len(merged)
+
+    def close(self):
+        """Stop the flush thread and write anything still pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+        with self._cond:
+            lost = self._pending
+        if lost:
+            # Nothing left to retry with at shutdown
+            self._rows_failed += lost
+            logger.error('Discarding %d buffered sensor readings that could not be written at shutdown', lost)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if self._failures:
+                    self._cond.wait(timeout=max(self._retry_at - time.monotonic(), 0))
+                elif self._pending < self.max_rows:
+                    self._cond.wait(timeout=self.flush_interval)
+                if self._closed:
+                    return
+                if self._failures and time.monotonic() < self._retry_at:
+                    continue
+            self.flush()
+
+    def stats(self):
+        """Snapshot of buffer depth and flush latency metrics"""
+        with self._cond:
+            depth = self._pending
+        return {
+            'enabled': True,
+            'depth': depth,
+            'capacity': self.max_pending,
+            'accepted': self._accepted,
+            'rejected': self._rejected,
+            'flushes': self._flushes,
+            'rows_flushed': self._rows_flushed,
+            'rows_failed': self._rows_failed,
+            'failed_flushes': self._failed_flushes,
+            'retrying': self._failures > 0,
+            'last_flush_ms': self._last_flush_seconds * 1000,
+            'max_flush_ms': self._max_flush_seconds * 1000,
+            'avg_flush_ms': (
+                self._total_flush_seconds / self._flushes * 1000 if self._flushes else 0.0
+            ),
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer():
+    """Return the process-wide write buffer, or None if buffering is disabled"""
+    global _buffer
+
+    config = {**DEFAULTS, **getattr(settings, 'SENSOR_INGEST_BUFFER', {})}
+    if not config['ENABLED']:
+        return None
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = IngestWriteBuffer(
+                    max_rows=config['MAX_ROWS'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    max_pending=config['MAX_PENDING'],
+                    max_retry_backoff=config['MAX_RETRY_BACKOFF'],
+                )
+                atexit.register(_buffer.close)
+    return _buffer
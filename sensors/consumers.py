@@ -1,20 +1,42 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
 from datetime import timedelta
+from . import broadcast, metrics
 
 
 class SensorDataConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time sensor data streaming.
     Clients subscribe to this to receive 1-second aggregated data updates.
+
+    Every client is in the 'sensors' group and gets one frame per tick. A
+    new client receives every sensor; after subscribing to particular
+    sensors, each frame is cut down to those (broadcast.filter_frame) and
+    ticks without them are skipped. Messages from the client:
+    - {"type": "subscribe", "sensor_ids": [1, 2], "rate": 1}: add sensors
+      (or "sensor_id": 1; no ids means every sensor again). "subscribe_sensor"
+      is accepted too.
+    - {"type": "unsubscribe", "sensor_ids": [1]}: remove sensors
+    - {"type": "set_rate", "rate": 0.2}: at most `rate` frames per second;
+      ticks in between are decimated to each sensor's newest row (anomalies
+      are always kept). null or 0 sends every tick.
+    - {"type": "get_latest"}: latest data of all sensors
     """
 
     async def connect(self):
         """Accept WebSocket connection and add to broadcast group"""
         # Join the sensors broadcast group
         self.room_group_name = 'sensors'
+        # None: every sensor
+        self.sensor_ids = None
+        self.rate = None
+        self._pending = None
+        self._next_send = 0.0
+        self._flush_handle = None
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -22,6 +44,7 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        metrics.WS_CLIENTS.inc()
 
         # Send initial connection confirmation
         await self.send(text_data=json.dumps({
@@ -31,6 +54,9 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         """Remove from broadcast group on disconnect"""
+        metrics.WS_CLIENTS.dec()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
@@ -45,14 +71,31 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
             message_type = data.get('type')
 
-            if message_type == 'subscribe_sensor':
-                # Client wants to subscribe to specific sensor
-                sensor_id = data.get('sensor_id')
-                await self.send(text_data=json.dumps({
-                    'type': 'subscription_confirmed',
-                    'sensor_id': sensor_id,
-                    'message': f'Subscribed to sensor {sensor_id}'
-                }))
+            if message_type in ('subscribe', 'subscribe_sensor'):
+                sensor_ids = self._requested_sensor_ids(data)
+                if sensor_ids is None:
+                    return await self._send_error('sensor_id(s) must be integers between 1 and 12')
+                if 'rate' in data and not self._set_rate(data['rate']):
+                    return await self._send_error('rate must be a positive number of frames per second or null')
+                # No ids: back to every sensor
+                self.sensor_ids = sensor_ids | (self.sensor_ids or set()) if sensor_ids else None
+                await self._send_subscriptions('subscription_confirmed')
+
+            elif message_type in ('unsubscribe', 'unsubscribe_sensor'):
+                sensor_ids = self._requested_sensor_ids(data)
+                if not sensor_ids:
+                    return await self._send_error('sensor_id(s) must be integers between 1 and 12')
+                # From every sensor: every other sensor
+                subscribed = set(range(1, 13)) if self.sensor_ids is None else self.sensor_ids
+                self.sensor_ids = subscribed - sensor_ids
+                await self._send_subscriptions('unsubscription_confirmed')
+
+            elif message_type == 'set_rate':
+                if not self._set_rate(data.get('rate')):
+                    return await self._send_error('rate must be a positive number of frames per second or null')
+                if self.rate is None and self._pending:
+                    await self._flush_pending()
+                await self._send_subscriptions('rate_confirmed')
 
             elif message_type == 'get_latest':
                 # Client requests latest data for all sensors
@@ -68,30 +111,127 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
                 'message': 'Invalid JSON'
             }))
 
+    @staticmethod
+    def _requested_sensor_ids(data):
+        """Set of sensor ids in a message (empty if none given), or None if invalid"""
+        sensor_ids = data.get('sensor_ids')
+        if sensor_ids is None:
+            sensor_ids = [] if data.get('sensor_id') is None else [data['sensor_id']]
+        if not isinstance(sensor_ids, list):
+            return None
+        if not all(isinstance(sensor_id, int) and 1 <= sensor_id <= 12 for sensor_id in sensor_ids):
+            return None
+        return set(sensor_ids)
+
+    def _set_rate(self, rate):
+        if rate in (None, 0):
+            self.rate = None
+            return True
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate < 0:
+            return False
+        self.rate = float(rate)
+        return True
+
+    async def _send_subscriptions(self, message_type):
+        await self.send(text_data=json.dumps({
+            'type': message_type,
+            'sensor_ids': 'all' if self.sensor_ids is None else sorted(self.sensor_ids),
+            'rate': self.rate,
+        }))
+
+    async def _send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
+
     async def sensor_update(self, event):
         """
         Receive sensor update from channel layer and send to WebSocket.
         This is called when broadcast_sensor_update is triggered.
         """
         await self.send(text_data=json.dumps(event['data']))
+        metrics.WS_MESSAGES_SENT.inc(type='sensor_update')
+
+    async def sensor_batch(self, event):
+        """
+        Receive one aggregation tick (the new 1-second data of the client's
+        sensors and any new anomalies) and send it to the WebSocket as one
+        frame, cut down to the client's sensors. Published by
+        sensors.broadcast. With a rate set, ticks are merged until the
+        client's next frame is due.
+        """
+        frame = broadcast.filter_frame(event['data'], self.sensor_ids)
+        if frame is None:
+            return
+        if self.rate is None:
+            await self.send(text_data=json.dumps(frame))
+            metrics.WS_MESSAGES_SENT.inc(type='sensor_batch')
+            return
+
+        if self._pending is None:
+            self._pending = {'sensors': {}, 'anomalies': []}
+        # Decimate: keep each sensor's newest row
+        for row in frame['sensors']:
+            self._pending['sensors'][row['sensor_id']] = row
+        self._pending['anomalies'].extend(frame['anomalies'])
+
+        now = time.monotonic()
+        if now >= self._next_send:
+            await self._flush_pending()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self._next_send - now, lambda: asyncio.ensure_future(self._flush_pending())
+            )
+
+    async def _flush_pending(self):
+        """Send the merged ticks held back by the rate limit"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, None
+        if self.rate is not None:
+            self._next_send = time.monotonic() + 1 / self.rate
+        if not pending:
+            return
+        sensors = sorted(pending['sensors'].values(), key=lambda row: (row['timestamp'], row['sensor_id']))
+        await self.send(text_data=json.dumps({
+            'type': 'sensor_batch',
+            'timestamp': sensors[-1]['timestamp'] if sensors else None,
+            'sensors': sensors,
+            'anomalies': pending['anomalies'],
+        }))
+        metrics.WS_MESSAGES_SENT.inc(type='sensor_batch')
 
     @database_sync_to_async
     def get_latest_sensor_data(self):
-        """Get the most recent data for all 12 sensors"""
+        """
+        Get the most recent data for all 12 sensors, from the live ring
+        buffers; only sensors without a ring are read from the database
+        """
+        from .live import get_latest_rows
         from .models import SensorAggregated1Sec
-        from .serializers import SensorAggregated1SecSerializer
+        from .serializers import SensorLiveSerializer
+
+        now = timezone.now()
+        from_rings = get_latest_rows(range(1, 13), max_age=10, now=now)
 
         latest_data = []
-        cutoff_time = timezone.now() - timedelta(seconds=10)
+        cutoff_time = now - timedelta(seconds=10)
 
         for sensor_id in range(1, 13):
+            if sensor_id in from_rings:
+                if from_rings[sensor_id] is not None:
+                    latest_data.append(from_rings[sensor_id])
+                continue
+
             latest = SensorAggregated1Sec.objects.filter(
                 sensor_id=sensor_id,
                 timestamp__gte=cutoff_time
             ).order_by('-timestamp').first()
 
             if latest:
-                serializer = SensorAggregated1SecSerializer(latest)
+                serializer = SensorLiveSerializer(latest)
                 latest_data.append(serializer.data)
 
         return latest_data
@@ -99,8 +239,9 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
 
 async def broadcast_sensor_update(sensor_id, data):
     """
-    Broadcast sensor update to all connected WebSocket clients.
-    This function is called from Celery tasks after aggregation.
+    Broadcast a single sensor update to all connected WebSocket clients.
+    The aggregation pipeline sends whole ticks instead (see
+    sensors.broadcast.publish_tick).
     """
     from channels.layers import get_channel_layer
     channel_layer = get_channel_layer()
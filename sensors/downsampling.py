@@ -0,0 +1,79 @@
+"""
+Point-budget downsampling for chart series.
+
+Both downsamplers pick a subset of the original points (returned as sorted
+row indices), so downsampled responses keep the exact row format of the
+full series:
+
+- lttb: Largest-Triangle-Three-Buckets, which keeps the points that carry
+  the visual shape of the line.
+- minmax: the lowest and highest point of each bucket, which preserves the
+  envelope (every spike and dip) of the series.
+"""
+import numpy as np
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets. x must be increasing. Returns the indices
+    of at most max_points selected points, always including the first and
+    last. Bucket bounds and next-bucket averages are computed vectorized;
+    only the choice of one point per bucket, which depends on the previous
+    choice, runs in a Python loop.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # Inner buckets cover points 1..n-2; bucket i is [edges[i], edges[i + 1])
+    buckets = max_points - 2
+    edges = (np.arange(buckets + 1) * ((n - 2) / buckets)).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Average point of each bucket; the last bucket looks ahead to the final point
+    sizes = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / sizes, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(buckets):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - mean_x[i + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, max_points):
+    """
+    Min/max envelope: split the series into max_points // 2 buckets and keep
+    the lowest and highest point of each. Fully vectorized. Returns sorted
+    indices of at most max_points points.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n or max_points < 2:
+        return np.arange(n)
+
+    buckets = max_points // 2
+    edges = (np.arange(buckets + 1) * (n / buckets)).astype(np.int64)
+    edges[-1] = n
+    bucket_ids = np.repeat(np.arange(buckets), np.diff(edges))
+
+    # Sorted by (bucket, value): each bucket's first entry is its min, last its max
+    order = np.lexsort((y, bucket_ids))
+    return np.unique(np.concatenate([order[edges[:-1]], order[edges[1:] - 1]]))
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
@@ -0,0 +1,162 @@
+"""
+Bulk export of raw readings and aggregation tiers to CSV or Parquet.
+
+Rows are read with values_list().iterator() in FETCH_SIZE batches (a
+server-side cursor on PostgreSQL) and written as they arrive, so an export
+never holds more than one batch. Parquet output needs pyarrow, which is
+optional.
+
+Exports are planned as one job per UTC day (and per sensor when run in
+parallel), each writing its own file, so jobs can run in a process pool
+(see the export_sensor_data command).
+"""
+import os
+from collections import namedtuple
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from .models import SensorReading, SensorAggregated1Sec, SensorAggregated1Min, SensorAggregated1Hour
+from .renderers import CSVRenderer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+
+# Rows per database fetch and per Parquet row group
+FETCH_SIZE = 20000
+
+AGGREGATE_EXPORT_FIELDS = ['sensor_id', 'timestamp', 'avg', 'min', 'max', 'std', 'count', 'sum', 'sum_sq']
+
+TABLES = {
+    'raw': (SensorReading, ['sensor_id', 'timestamp', 'value']),
+    '1sec': (SensorAggregated1Sec, AGGREGATE_EXPORT_FIELDS),
+    '1min': (SensorAggregated1Min, AGGREGATE_EXPORT_FIELDS),
+    '1hour': (SensorAggregated1Hour, AGGREGATE_EXPORT_FIELDS),
+}
+
+ExportJob = namedtuple('ExportJob', ['table', 'start_time', 'end_time', 'sensor_ids', 'path', 'output'])
+
+
+def export_queryset(table, start_time, end_time, sensor_ids=None):
+    """Rows of a table in [start_time, end_time), ordered by time, as value tuples"""
+    model, fields = TABLES[table]
+    queryset = model.objects.filter(timestamp__gte=start_time, timestamp__lt=end_time)
+    if sensor_ids:
+        queryset = queryset.filter(sensor_id__in=sensor_ids)
+    return queryset.order_by('timestamp', 'sensor_id').values_list(*fields)
+
+
+def iter_rows(table, start_time, end_time, sensor_ids=None):
+    return export_queryset(table, start_time, end_time, sensor_ids).iterator(chunk_size=FETCH_SIZE)
+
+
+def write_csv(fileobj, fields, rows):
+    """Write rows as CSV to a binary file object. Returns the row count."""
+    counted = _Counter(rows)
+    for chunk in CSVRenderer().stream(fields, counted):
+        fileobj.write(chunk)
+    return counted.count
+
+
+def _parquet_schema(fields):
+    types = {
+        'sensor_id': pyarrow.int32(),
+        'timestamp': pyarrow.timestamp('us', tz='UTC'),
+        'count': pyarrow.int64(),
+    }
+    return pyarrow.schema([(field, types.get(field, pyarrow.float64())) for field in fields])
+
+
+def write_parquet(fileobj, fields, rows):
+    """Write rows as Parquet, one row group per FETCH_SIZE rows. Returns the row count."""
+    schema = _parquet_schema(fields)
+    count = 0
+    with pyarrow.parquet.ParquetWriter(fileobj, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == FETCH_SIZE:
+                writer.write_batch(_record_batch(schema, fields, batch))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_batch(_record_batch(schema, fields, batch))
+            count += len(batch)
+    return count
+
+
+def _record_batch(schema, fields, rows):
+    columns = list(zip(*rows)) if rows else [[] for _ in fields]
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array(column, type=schema.field(field).type) for field, column in zip(fields, columns)],
+        schema=schema
+    )
+
+
+class _Counter:
+    """Iterator wrapper that counts the rows passed through"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self._rows)
+        self.count += 1
+        return row
+
+
+def available_outputs():
+    return ['csv', 'parquet'] if pyarrow is not None else ['csv']
+
+
+def write_rows(fileobj, table, output, rows):
+    """Write rows of a table to a binary file object in the given output format"""
+    fields = TABLES[table][1]
+    if output == 'parquet':
+        if pyarrow is None:
+            raise ValueError('Parquet export requires pyarrow')
+        return write_parquet(fileobj, fields, rows)
+    return write_csv(fileobj, fields, rows)
+
+
+def run_job(job):
+    """Export one planned file. Returns (path, row count)."""
+    tmp_path = f'{job.path}.partial'
+    with open(tmp_path, 'wb') as fileobj:
+        count = write_rows(
+            fileobj, job.table, job.output,
+            iter_rows(job.table, job.start_time, job.end_time, job.sensor_ids)
+        )
+    # Only complete files get their final name
+    os.replace(tmp_path, job.path)
+    return job.path, count
+
+
+def plan_export(table, start_time, end_time, sensor_ids, directory, output='csv', per_sensor=False):
+    """
+    Split an export into one job per UTC day in [start_time, end_time),
+    and per sensor if per_sensor is set. Returns a list of ExportJob.
+    """
+    if per_sensor and not sensor_ids:
+        raise ValueError('per_sensor export needs explicit sensor ids')
+
+    jobs = []
+    day = start_time.astimezone(dt_timezone.utc).date()
+    while True:
+        day_start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+        if day_start >= end_time:
+            break
+        window = (max(day_start, start_time), min(day_start + timedelta(days=1), end_time))
+        groups = [[sensor_id] for sensor_id in sensor_ids] if per_sensor else [sensor_ids]
+        for group in groups:
+            suffix = f'_sensor{group[0]}' if per_sensor else ''
+            path = os.path.join(directory, f'{table}_{day:%Y-%m-%d}{suffix}.{output}')
+            jobs.append(ExportJob(table, window[0], window[1], group, path, output))
+        day += timedelta(days=1)
+    return jobs
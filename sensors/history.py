@@ -0,0 +1,150 @@
+"""
+Resolution selection, downsampling and columnar encoding shared by the
+time-series endpoints.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter, itemgetter
+
+import numpy as np
+
+from .downsampling import DOWNSAMPLERS
+from .ingest import EPOCH
+from .models import SensorAggregated1Sec, SensorAggregated1Min, SensorAggregated1Hour
+from .serializers import (
+    SensorAggregated1SecSerializer,
+    SensorAggregated1MinSerializer,
+    SensorAggregated1HourSerializer
+)
+
+
+Resolution = namedtuple('Resolution', ['name', 'model', 'serializer', 'width'])
+
+# Finest first
+RESOLUTIONS = {
+    '1sec': Resolution('1sec', SensorAggregated1Sec, SensorAggregated1SecSerializer, timedelta(seconds=1)),
+    '1min': Resolution('1min', SensorAggregated1Min, SensorAggregated1MinSerializer, timedelta(minutes=1)),
+    '1hour': Resolution('1hour', SensorAggregated1Hour, SensorAggregated1HourSerializer, timedelta(hours=1)),
+}
+
+MIN_POINTS = 3
+
+# Fields of a columnar series besides the timestamp
+SERIES_COLUMNS = ['avg', 'min', 'max', 'std', 'count']
+
+ONE_MILLISECOND = timedelta(milliseconds=1)
+
+# Fields of streamed (NDJSON/CSV) rows
+STREAM_FIELDS = ['sensor_id', 'timestamp'] + SERIES_COLUMNS
+
+# Rows fetched per database round trip while streaming
+STREAM_CHUNK_SIZE = 5000
+
+
+def select_resolution(start_time, end_time, resolution='auto', max_points=None):
+    """
+    Resolve 'auto' to a tier name; explicit tiers are returned unchanged.
+
+    Without max_points the tier follows the time range (up to 1 hour: 1sec,
+    up to 1 day: 1min, longer: 1hour). With max_points it is the coarsest
+    tier that still has at least max_points buckets in the range, so the
+    chart keeps full detail while the fewest rows are read; if no tier has
+    that many, the finest one. Raises ValueError for unknown resolutions.
+    """
+    if resolution != 'auto':
+        if resolution not in RESOLUTIONS:
+            raise ValueError(resolution)
+        return resolution
+
+    time_range = end_time - start_time
+    if max_points is None:
+        if time_range <= timedelta(hours=1):
+            return '1sec'
+        if time_range <= timedelta(days=1):
+            return '1min'
+        return '1hour'
+
+    selected = '1sec'
+    for name, tier in RESOLUTIONS.items():
+        if time_range / tier.width >= max_points:
+            selected = name
+    return selected
+
+
+def downsample(rows, max_points, method='lttb'):
+    """Reduce aggregation rows (ordered by timestamp) to at most max_points, by their avg"""
+    if len(rows) <= max_points:
+        return rows
+    x = np.fromiter((row.timestamp.timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    y = np.fromiter((row.avg for row in rows), dtype=np.float64, count=len(rows))
+    return [rows[index] for index in DOWNSAMPLERS[method](x, y, max_points).tolist()]
+
+
+def _encode_columns(rows, max_points=None, method='lttb'):
+    """Columnar encoding of (timestamp, *SERIES_COLUMNS) tuples; see columnar_series"""
+    total = len(rows)
+    if not rows:
+        return {name: [] for name in ['timestamp'] + SERIES_COLUMNS}, 0
+
+    timestamps, *values = zip(*rows)
+    columns = {'timestamp': np.array([(ts - EPOCH) // ONE_MILLISECOND for ts in timestamps], dtype=np.int64)}
+    columns.update((name, np.array(column)) for name, column in zip(SERIES_COLUMNS, values))
+
+    if max_points is not None and total > max_points:
+        index = DOWNSAMPLERS[method](columns['timestamp'].astype(np.float64), columns['avg'], max_points)
+        columns = {name: column[index] for name, column in columns.items()}
+
+    return {name: column.tolist() for name, column in columns.items()}, total
+
+
+def columnar_series(queryset, max_points=None, method='lttb'):
+    """
+    Encode aggregation rows (ordered by timestamp) as one list per field,
+    with timestamps in epoch milliseconds, straight from values_list and
+    without model instances or a serializer. Optionally downsampled to
+    max_points. Returns (columns, row count before downsampling).
+    """
+    return _encode_columns(list(queryset.values_list('timestamp', *SERIES_COLUMNS)), max_points, method)
+
+
+def grouped_rows(queryset):
+    """
+    Iterate a multi-sensor queryset as (sensor_id, rows) groups, ordered by
+    (sensor_id, timestamp). Rows are streamed from the database, so only
+    one sensor's rows are held at a time.
+    """
+    rows = queryset.order_by('sensor_id', 'timestamp').iterator(chunk_size=2000)
+    for sensor_id, group in groupby(rows, key=attrgetter('sensor_id')):
+        yield sensor_id, list(group)
+
+
+def grouped_columnar_series(queryset, max_points=None, method='lttb'):
+    """
+    Columnar encoding of a multi-sensor queryset, one sensor at a time.
+    Yields (sensor_id, columns, row count before downsampling).
+    """
+    rows = queryset.order_by('sensor_id', 'timestamp').values_list(
+        'sensor_id', 'timestamp', *SERIES_COLUMNS
+    ).iterator(chunk_size=2000)
+    for sensor_id, group in groupby(rows, key=itemgetter(0)):
+        columns, total = _encode_columns([row[1:] for row in group], max_points, method)
+        yield sensor_id, columns, total
+
+
+def stream_rows(queryset, max_points=None, method='lttb'):
+    """
+    Iterate aggregation rows as STREAM_FIELDS tuples ordered by (sensor_id,
+    timestamp), fetched STREAM_CHUNK_SIZE rows at a time with no model
+    instances. With max_points each sensor's series is downsampled, which
+    holds one sensor's rows in memory at a time.
+    """
+    if max_points is None:
+        yield from queryset.order_by('sensor_id', 'timestamp').values_list(
+            *STREAM_FIELDS
+        ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+        return
+
+    for _, rows in grouped_rows(queryset):
+        for row in downsample(rows, max_points, method):
+            yield tuple(getattr(row, field) for field in STREAM_FIELDS)
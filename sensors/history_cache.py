@@ -0,0 +1,251 @@
+"""
+Cache of closed history windows for get_historical_data.
+
+Aggregation rows stop changing once the scheduled aggregation has moved
+past them (see aggregation.catch_up): a bucket older than the tier's
+watermark minus its LATENESS window is never re-aggregated. Such buckets
+are cached in fixed blocks aligned to the epoch, keyed on (resolution,
+sensor_id, block start), holding the rows as values_list tuples of
+HISTORY_FIELDS and their epoch millisecond timestamps, so a request for a
+closed window queries nothing. Columnar formats are built from the tuples
+directly; row dicts are only made for the JSON format (history_rows).
+
+A request is served from the cached blocks it covers plus a fresh query
+for the tail that is still open (the part overlapping "now"). Missing
+blocks are read with one query per contiguous run and stored.
+
+The cache alias is bounded: the default 'history' alias is a local-memory
+cache with MAX_ENTRIES, which evicts least recently used blocks. Blocks
+rewritten by backfill_aggregates are picked up once they expire (TIMEOUT)
+or the cache is cleared.
+"""
+import bisect
+import logging
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .aggregation import final_until
+from .downsampling import DOWNSAMPLERS
+from .history import RESOLUTIONS, SERIES_COLUMNS
+from .ingest import EPOCH
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'history',
+    # Seconds covered by one cached block of each resolution
+    'BLOCK_SECONDS': {'1sec': 900, '1min': 86400, '1hour': 30 * 86400},
+    'TIMEOUT': 86400,
+}
+
+KEY_PREFIX = 'sensors:history:'
+
+ONE_MILLISECOND = timedelta(milliseconds=1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Fields of the tier serializers, in the order of the cached tuples
+HISTORY_FIELDS = ['id', 'sensor_id', 'timestamp', 'avg', 'min', 'max', 'std', 'count', 'created_at']
+DATETIME_FIELDS = {'timestamp', 'created_at'}
+TIMESTAMP_INDEX = HISTORY_FIELDS.index('timestamp')
+AVG_INDEX = HISTORY_FIELDS.index('avg')
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'fresh_queries': 0}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_HISTORY_CACHE', {})}
+
+
+def _cache():
+    return caches[_config()['CACHE_ALIAS']]
+
+
+def _key(resolution, sensor_id, block_start):
+    return f'{KEY_PREFIX}{resolution}:{sensor_id}:{(block_start - EPOCH) // timedelta(seconds=1)}'
+
+
+# Result label of each counter in sensor_history_cache_lookups_total
+_METRIC_RESULTS = {'hits': 'hit', 'misses': 'miss', 'fresh_queries': 'fresh_query'}
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+    for name, value in increments.items():
+        if value:
+            metrics.HISTORY_CACHE_LOOKUPS.inc(value, result=_METRIC_RESULTS[name])
+
+
+def stats():
+    """Block hit/miss counters of this process and the hit ratio"""
+    with _stats_lock:
+        current = dict(_stats)
+    lookups = current['hits'] + current['misses']
+    current['hit_ratio'] = current['hits'] / lookups if lookups else None
+    return current
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _fetch(resolution, sensor_id, start_time, end_time):
+    """HISTORY_FIELDS tuples of [start_time, end_time) and their epoch ms timestamps"""
+    tier = RESOLUTIONS[resolution]
+    rows = list(tier.model.objects.filter(
+        sensor_id=sensor_id,
+        timestamp__gte=start_time,
+        timestamp__lt=end_time
+    ).order_by('timestamp').values_list(*HISTORY_FIELDS))
+    return [(row[TIMESTAMP_INDEX] - EPOCH) // ONE_MILLISECOND for row in rows], rows
+
+
+def _split_blocks(timestamps, rows, blocks, block_ms):
+    """Split fetched rows covering consecutive blocks into one entry per block"""
+    entries = {}
+    position = 0
+    for block_start in blocks:
+        end_ms = (block_start - EPOCH) // ONE_MILLISECOND + block_ms
+        stop = bisect.bisect_left(timestamps, end_ms, position)
+        entries[block_start] = (timestamps[position:stop], rows[position:stop])
+        position = stop
+    return entries
+
+
+def _closed_blocks(resolution, sensor_id, blocks, width):
+    """Entries of closed blocks, from the cache or (one query per missing run) the database"""
+    cache = _cache()
+    keys = {block_start: _key(resolution, sensor_id, block_start) for block_start in blocks}
+    try:
+        cached = cache.get_many(list(keys.values()))
+    except Exception:
+        logger.exception('History cache unavailable, reading the database')
+        cached = {}
+
+    entries = {block_start: cached[keys[block_start]] for block_start in blocks if keys[block_start] in cached}
+    missing = [block_start for block_start in blocks if block_start not in entries]
+    _count(hits=len(entries), misses=len(missing))
+
+    # Consecutive missing blocks are fetched together
+    runs = []
+    for block_start in missing:
+        if runs and runs[-1][-1] + width == block_start:
+            runs[-1].append(block_start)
+        else:
+            runs.append([block_start])
+
+    fetched = {}
+    for run in runs:
+        timestamps, rows = _fetch(resolution, sensor_id, run[0], run[-1] + width)
+        fetched.update(_split_blocks(timestamps, rows, run, width // ONE_MILLISECOND))
+
+    if fetched:
+        try:
+            cache.set_many(
+                {keys[block_start]: entry for block_start, entry in fetched.items()},
+                timeout=_config()['TIMEOUT']
+            )
+        except Exception:
+            logger.exception('Could not store history blocks')
+        entries.update(fetched)
+    return [entries[block_start] for block_start in blocks]
+
+
+def history_series(resolution, sensor_id, start_time, end_time):
+    """
+    Rows of one sensor in [start_time, end_time] (both inclusive, like the
+    history endpoint), ordered by time. Closed blocks come from the cache,
+    the open tail from the database.
+
+    Returns (timestamps as an int64 array of epoch ms, list of
+    HISTORY_FIELDS tuples).
+    """
+    config = _config()
+    end_exclusive = end_time + ONE_MICROSECOND
+
+    parts = []
+    tail_start = start_time
+    closed = final_until(resolution) if config['ENABLED'] else None
+    if closed is not None:
+        width = timedelta(seconds=config['BLOCK_SECONDS'][resolution])
+        block_start = EPOCH + ((start_time - EPOCH) // width) * width
+        blocks = []
+        while block_start < end_exclusive and block_start + width <= closed:
+            blocks.append(block_start)
+            block_start += width
+        if blocks:
+            parts.extend(_closed_blocks(resolution, sensor_id, blocks, width))
+            tail_start = max(start_time, block_start)
+
+    if tail_start < end_exclusive:
+        parts.append(_fetch(resolution, sensor_id, tail_start, end_exclusive))
+        _count(fresh_queries=1)
+
+    timestamps = np.array([ts for part in parts for ts in part[0]], dtype=np.int64)
+    rows = [row for part in parts for row in part[1]]
+
+    # Blocks are aligned, so the first and last may reach outside the range
+    start_ms = -((EPOCH - start_time) // ONE_MILLISECOND)
+    end_ms = (end_time - EPOCH) // ONE_MILLISECOND
+    first = int(np.searchsorted(timestamps, start_ms, side='left'))
+    last = int(np.searchsorted(timestamps, end_ms, side='right'))
+    return timestamps[first:last], rows[first:last]
+
+
+def downsample_series(timestamps, rows, max_points, method='lttb'):
+    """Reduce a history_series result to at most max_points rows, by their avg"""
+    if len(rows) <= max_points:
+        return timestamps, rows
+    y = np.fromiter((row[AVG_INDEX] for row in rows), dtype=np.float64, count=len(rows))
+    index = DOWNSAMPLERS[method](timestamps.astype(np.float64), y, max_points)
+    return timestamps[index], [rows[i] for i in index.tolist()]
+
+
+def _isoformat(dt):
+    # Same representation as the serializers (UTC, 'Z' suffix)
+    value = dt.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def history_rows(rows):
+    """Row dicts of a history_series result, as the tier serializers render them"""
+    return [
+        {
+            name: _isoformat(value) if name in DATETIME_FIELDS else value
+            for name, value in zip(HISTORY_FIELDS, row)
+        }
+        for row in rows
+    ]
+
+
+def history_columns(timestamps, rows):
+    """Columnar form of a history_series result (see history.columnar_series)"""
+    columns = {'timestamp': timestamps.tolist()}
+    columns.update(
+        (name, [row[index] for row in rows])
+        for name, index in ((name, HISTORY_FIELDS.index(name)) for name in SERIES_COLUMNS)
+    )
+    return columns
+
+
+def series_columns(timestamps, rows):
+    """Columnar form of row dicts with SERIES_COLUMNS, e.g. live.get_window rows"""
+    columns = {'timestamp': timestamps.tolist()}
+    columns.update((name, [row[name] for row in rows]) for name in SERIES_COLUMNS)
+    return columns
+
+
+def clear():
+    """Drop every cached block (clears the whole history cache alias)"""
+    _cache().clear()
@@ -0,0 +1,239 @@
+"""
+Fast-path parsing and storage for batches of raw sensor readings.
+
+The DRF serializer path builds a field tree and validates every reading one
+field at a time. At 60Hz x 12 sensors that dominates ingest CPU, so batches
+are instead split into three columns in a single pass and validated
+column-wise with NumPy. Anything the fast path does not recognise is handed
+back to the serializer so error responses stay identical.
+
+Devices can also send a compact columnar binary frame (see
+encode_binary_readings), which is decoded zero-copy with np.frombuffer.
+"""
+import struct
+import time
+from itertools import chain
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import SensorReading
+
+
+SENSOR_ID_MIN = 1
+SENSOR_ID_MAX = 12
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Binary frame layout (little-endian):
+#   header    magic b'SRB1', uint8 value width (4 or 8), 3 pad bytes, uint64 count
+#   columns   int64[count] epoch microseconds, float32/float64[count] values,
+#             uint8[count] sensor ids
+BINARY_CONTENT_TYPE = 'application/x-sensor-readings'
+BINARY_MAGIC = b'SRB1'
+BINARY_HEADER = struct.Struct('<4sB3xQ')
+BINARY_VALUE_DTYPES = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+# Latest storable timestamp, as epoch microseconds
+MAX_TIMESTAMP_US = (datetime(9999, 12, 31, 23, 59, 59, tzinfo=dt_timezone.utc) - EPOCH) // ONE_MICROSECOND
+
+
+class BinaryFrameError(ValueError):
+    """Raised when a binary readings frame is malformed"""
+
+
+class ReadingBatch:
+    """
+    Columnar batch of sensor readings.
+
+    sensor_ids and values are NumPy arrays. Timestamps are kept in whichever
+    form the batch was built from (aware datetimes or int64 epoch
+    microseconds) and converted lazily to the other on first access.
+    """
+
+    __slots__ = ('sensor_ids', 'values', '_datetimes', '_timestamps_us')
+
+    def __init__(self, sensor_ids, values, datetimes=None, timestamps_us=None):
+        self.sensor_ids = sensor_ids
+        self.values = values
+        self._datetimes = datetimes
+        self._timestamps_us = timestamps_us
+
+    def __len__(self):
+        return len(self.sensor_ids)
+
+    @classmethod
+    def from_validated_data(cls, validated_data):
+        """Build a batch from SensorReadingBulkCreateSerializer output"""
+        return cls(
+            sensor_ids=np.array([item['sensor_id'] for item in validated_data], dtype=np.int64),
+            values=np.array([item['value'] for item in validated_data], dtype=np.float64),
+            datetimes=[item['timestamp'] for item in validated_data],
+        )
+
+    @classmethod
+    def concat(cls, batches):
+        """Merge several batches into one"""
+        return cls(
+            sensor_ids=np.concatenate([batch.sensor_ids for batch in batches]),
+            values=np.concatenate([batch.values for batch in batches]),
+            datetimes=list(chain.from_iterable(batch.datetimes for batch in batches)),
+        )
+
+    @property
+    def datetimes(self):
+        if self._datetimes is None:
+            self._datetimes = [
+                EPOCH + timedelta(microseconds=us)
+                for us in self._timestamps_us.tolist()
+            ]
+        return self._datetimes
+
+    @property
+    def timestamps_us(self):
+        if self._timestamps_us is None:
+            self._timestamps_us = np.array(
+                [(dt - EPOCH) // ONE_MICROSECOND for dt in self._datetimes],
+                dtype=np.int64
+            )
+        return self._timestamps_us
+
+    def to_models(self):
+        """Build unsaved SensorReading instances for bulk_create"""
+        return [
+            SensorReading(sensor_id=sensor_id, timestamp=ts, value=value)
+            for sensor_id, ts, value in zip(
+                self.sensor_ids.tolist(), self.datetimes, self.values.tolist()
+            )
+        ]
+
+
+def _only_types(column, allowed):
+    """True if every element of column is exactly one of the allowed types"""
+    return set(map(type, column)) <= allowed
+
+
+def parse_json_readings(items):
+    """
+    Validate a parsed JSON array of readings in one columnar pass.
+
+    Returns a ReadingBatch, or None if the batch contains anything outside
+    the fast path (wrong types, out-of-range sensor ids, non-finite values,
+    unparseable timestamps). Callers fall back to the serializer in that
+    case, which either accepts the batch or produces the usual 400 errors.
+    """
+    try:
+        sensor_ids = [item['sensor_id'] for item in items]
+        timestamps = [item['timestamp'] for item in items]
+        values = [item['value'] for item in items]
+    except (KeyError, TypeError):
+        return None
+
+    # bool is an int subclass but the serializer rejects it for sensor_id
+    if not (_only_types(sensor_ids, {int})
+            and _only_types(timestamps, {str})
+            and _only_types(values, {int, float})):
+        return None
+
+    try:
+        sensor_ids = np.array(sensor_ids, dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+    except OverflowError:
+        return None
+
+    if ((sensor_ids < SENSOR_ID_MIN) | (sensor_ids > SENSOR_ID_MAX)).any():
+        return None
+    if not np.isfinite(values).all():
+        return None
+
+    try:
+        datetimes = list(map(datetime.fromisoformat, timestamps))
+    except ValueError:
+        return None
+
+    # Match DRF's DateTimeField: naive timestamps are in the current timezone
+    default_tz = timezone.get_current_timezone()
+    datetimes = [
+        dt if dt.tzinfo is not None else timezone.make_aware(dt, default_tz)
+        for dt in datetimes
+    ]
+
+    return ReadingBatch(sensor_ids=sensor_ids, values=values, datetimes=datetimes)
+
+
+def encode_binary_readings(sensor_ids, timestamps_us, values, value_width=4):
+    """Encode three equal-length columns as a binary readings frame"""
+    sensor_ids = np.asarray(sensor_ids, dtype=np.uint8)
+    timestamps_us = np.asarray(timestamps_us, dtype='<i8')
+    values = np.asarray(values, dtype=BINARY_VALUE_DTYPES[value_width])
+    return b''.join([
+        BINARY_HEADER.pack(BINARY_MAGIC, value_width, len(sensor_ids)),
+        timestamps_us.tobytes(),
+        values.tobytes(),
+        sensor_ids.tobytes(),
+    ])
+
+
+def decode_binary_readings(data):
+    """
+    Decode a binary readings frame into a ReadingBatch.
+
+    The returned arrays are read-only views over ``data``; no per-reading
+    Python objects are created. Raises BinaryFrameError if the frame is
+    malformed or fails validation.
+    """
+    if len(data) < BINARY_HEADER.size:
+        raise BinaryFrameError('Frame is shorter than the header')
+
+    magic, value_width, count = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise BinaryFrameError('Invalid frame magic')
+    if value_width not in BINARY_VALUE_DTYPES:
+        raise BinaryFrameError('Value width must be 4 or 8 bytes')
+    if len(data) != BINARY_HEADER.size + count * (8 + value_width + 1):
+        raise BinaryFrameError(f'Frame length does not match reading count {count}')
+
+    buffer = memoryview(data)
+    offset = BINARY_HEADER.size
+    timestamps_us = np.frombuffer(buffer, dtype='<i8', count=count, offset=offset)
+    offset += count * 8
+    values = np.frombuffer(buffer, dtype=BINARY_VALUE_DTYPES[value_width], count=count, offset=offset)
+    offset += count * value_width
+    sensor_ids = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset)
+
+    if ((sensor_ids < SENSOR_ID_MIN) | (sensor_ids > SENSOR_ID_MAX)).any():
+        raise BinaryFrameError(f'sensor_id must be between {SENSOR_ID_MIN} and {SENSOR_ID_MAX}')
+    if ((timestamps_us < 0) | (timestamps_us > MAX_TIMESTAMP_US)).any():
+        raise BinaryFrameError('timestamp is out of range')
+    if not np.isfinite(values).all():
+        raise BinaryFrameError('value must be a finite number')
+
+    return ReadingBatch(sensor_ids=sensor_ids, values=values, timestamps_us=timestamps_us)
+
+
+def store_readings(batch):
+    """
+    Insert a validated batch into the raw readings table, publish each
+    sensor's newest reading and feed the streaming 1-second aggregator when
+    that is enabled.
+    """
+    from .latest import publish_batch
+    from .streaming import get_aggregator
+
+    started = time.perf_counter()
+    SensorReading.objects.bulk_create(batch.to_models(), batch_size=500)
+    metrics.BULK_CREATE_SECONDS.observe(time.perf_counter() - started)
+    metrics.READINGS_INGESTED.inc(len(batch))
+    # Only visible to readers once the rows are
+    transaction.on_commit(lambda: publish_batch(batch))
+
+    aggregator = get_aggregator()
+    if aggregator is not None:
+        # Only once committed: the write buffer retries a batch whose commit
+        # failed, which would otherwise be counted twice
+        transaction.on_commit(lambda: aggregator.add(batch))
+    return len(batch)
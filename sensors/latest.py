@@ -0,0 +1,131 @@
+"""
+Latest-reading registry shared by every process through the Django cache.
+
+list_sensors and check_sensor_dropouts need each sensor's newest reading.
+Querying the raw table for it is one ORDER BY ... LIMIT 1 per sensor on
+every dashboard poll. Instead, store_readings publishes the newest
+(timestamp, value) of each sensor in a stored batch to the cache (Redis in
+the default settings), and readers fetch all sensors with one get_many.
+
+On a cold cache a sensor's entry is loaded from the database once and
+cached. Sensors without any readings are remembered for NO_DATA_TIMEOUT
+seconds. If the cache is unreachable, readers fall back to the database.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .ingest import SENSOR_ID_MAX, SENSOR_ID_MIN
+from .models import SensorReading
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'NO_DATA_TIMEOUT': 10,
+}
+
+KEY_PREFIX = 'sensors:latest:'
+
+# Cached for sensors that have no readings at all
+NO_DATA = 'no_data'
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_LATEST_VALUES', {})}
+
+
+def _cache():
+    return caches[_config()['CACHE_ALIAS']]
+
+
+def _key(sensor_id):
+    return f'{KEY_PREFIX}{sensor_id}'
+
+
+def latest_in_batch(batch):
+    """
+    Newest reading of each sensor in a ReadingBatch, in one vectorized pass.
+    Returns {sensor_id: (timestamp, value)}.
+    """
+    if not len(batch):
+        return {}
+    # Sort by (sensor, timestamp); the last row of each sensor run is its newest
+    order = np.lexsort((batch.timestamps_us, batch.sensor_ids))
+    sensor_ids = batch.sensor_ids[order]
+    last = np.flatnonzero(np.append(sensor_ids[1:] != sensor_ids[:-1], True))
+    datetimes = batch.datetimes
+    return {
+        sensor_id: (datetimes[index], value)
+        for sensor_id, index, value in zip(
+            sensor_ids[last].tolist(), order[last].tolist(), batch.values[order[last]].tolist()
+        )
+    }
+
+
+def publish_batch(batch):
+    """Record the newest reading of each sensor in a stored batch"""
+    newest = latest_in_batch(batch)
+    if not newest:
+        return
+    cache = _cache()
+    try:
+        current = cache.get_many([_key(sensor_id) for sensor_id in newest])
+        # Never move a sensor backwards (late or out-of-order batches)
+        updates = {
+            _key(sensor_id): reading
+            for sensor_id, reading in newest.items()
+            if not isinstance(current.get(_key(sensor_id)), tuple)
+            or current[_key(sensor_id)][0] < reading[0]
+        }
+        if updates:
+            cache.set_many(updates, timeout=None)
+    except Exception:
+        logger.exception('Could not publish latest sensor readings')
+
+
+def _load_from_database(sensor_id):
+    reading = SensorReading.objects.filter(sensor_id=sensor_id).order_by('-timestamp').values_list(
+        'timestamp', 'value'
+    ).first()
+    return tuple(reading) if reading else None
+
+
+def get_latest(sensor_ids):
+    """
+    Newest (timestamp, value) of each sensor, or None for sensors without
+    readings. Returns {sensor_id: (timestamp, value) or None}.
+    """
+    sensor_ids = list(sensor_ids)
+    cache = _cache()
+    try:
+        cached = cache.get_many([_key(sensor_id) for sensor_id in sensor_ids])
+    except Exception:
+        logger.exception('Latest sensor readings cache unavailable, reading the database')
+        return {sensor_id: _load_from_database(sensor_id) for sensor_id in sensor_ids}
+
+    latest = {}
+    for sensor_id in sensor_ids:
+        entry = cached.get(_key(sensor_id))
+        if entry is None:
+            # Cold start: load once, without overwriting a value published meanwhile
+            entry = _load_from_database(sensor_id)
+            try:
+                if entry is None:
+                    cache.add(_key(sensor_id), NO_DATA, timeout=_config()['NO_DATA_TIMEOUT'])
+                else:
+                    cache.add(_key(sensor_id), entry, timeout=None)
+            except Exception:
+                logger.exception('Could not cache latest reading of sensor %s', sensor_id)
+        latest[sensor_id] = entry if isinstance(entry, tuple) else None
+    return latest
+
+
+def reset(sensor_ids=None):
+    """Forget cached readings (all known sensors by default)"""
+    if sensor_ids is None:
+        sensor_ids = range(SENSOR_ID_MIN, SENSOR_ID_MAX + 1)
+    _cache().delete_many([_key(sensor_id) for sensor_id in sensor_ids])
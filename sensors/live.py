@@ -0,0 +1,233 @@
+"""
+Ring buffer of the last WINDOW_SECONDS 1-second aggregates per sensor,
+shared by every process through the Django cache.
+
+/live/ polls and WebSocket get_latest requests otherwise query
+SensorAggregated1Sec for every request. Instead, the 1-second aggregator
+(the aggregate_1sec_data task, or the streaming aggregator in the ingest
+process) publishes each emitted second into a fixed-size NumPy ring per
+sensor: slot ``second % WINDOW_SECONDS`` holds that second's sufficient
+statistics, and the ring is stored as one bytes value per sensor, after an
+int64 header with the first second the ring is complete from. Readers
+fetch all requested sensors with one get_many and never touch the database.
+
+A ring only knows the seconds published since it was created, so after a
+cache flush, restart or eviction it is complete from its first second on
+(from the second after, when created from merged partial seconds). A
+sensor whose ring is missing (cold cache, or the cache is unreachable) or
+does not yet cover the requested window is reported as None, and callers
+fall back to the database. Merged
+partial seconds from concurrent ingest processes are read-modify-write
+updates of the cached ring, so a racing update can leave a partial
+second in the ring; the database rows stay exact.
+"""
+import logging
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .aggregation import finalize
+from .ingest import EPOCH, SENSOR_ID_MAX, SENSOR_ID_MIN
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'WINDOW_SECONDS': 60,
+}
+
+KEY_PREFIX = 'sensors:live:'
+
+ONE_SECOND = timedelta(seconds=1)
+
+# One slot per second; second is -1 in empty slots
+RING_DTYPE = np.dtype([
+    ('second', '<i8'),
+    ('count', '<i8'),
+    ('sum', '<f8'),
+    ('sum_sq', '<f8'),
+    ('min', '<f8'),
+    ('max', '<f8'),
+])
+
+# Fields emitted by the aggregators that the ring keeps
+ROW_FIELDS = ['sensor_id', 'timestamp', 'count', 'sum', 'sum_sq', 'min', 'max']
+
+# Fields of the rows served from the rings; database fallbacks use the same
+# (see serializers.SensorLiveSerializer)
+LIVE_FIELDS = ['sensor_id', 'timestamp', 'avg', 'min', 'max', 'std', 'count']
+
+HEADER_DTYPE = np.dtype('<i8')
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_LIVE_BUFFER', {})}
+
+
+def is_enabled():
+    return _config()['ENABLED']
+
+
+def _cache():
+    return caches[_config()['CACHE_ALIAS']]
+
+
+def _key(sensor_id):
+    return f'{KEY_PREFIX}{sensor_id}'
+
+
+def _empty_ring(size):
+    ring = np.zeros(size, dtype=RING_DTYPE)
+    ring['second'] = -1
+    return ring
+
+
+def _load_ring(raw, size):
+    """
+    (first complete second, ring array) from the cached bytes, or None if
+    missing or of another size
+    """
+    if not isinstance(raw, bytes) or len(raw) != HEADER_DTYPE.itemsize + size * RING_DTYPE.itemsize:
+        return None
+    since = int(np.frombuffer(raw, dtype=HEADER_DTYPE, count=1)[0])
+    return since, np.frombuffer(raw, dtype=RING_DTYPE, offset=HEADER_DTYPE.itemsize).copy()
+
+
+def _dump_ring(since, ring):
+    return np.array([since], dtype=HEADER_DTYPE).tobytes() + ring.tobytes()
+
+
+def publish_rows(rows, merge=False):
+    """
+    Record emitted 1-second aggregates (dicts with ROW_FIELDS) in the rings.
+
+    With merge=False a row replaces its second. With merge=True (partial
+    seconds from the streaming aggregator) rows are combined with what the
+    ring already holds for that second, like aggregation.merge_aggregates.
+    """
+    if not rows or not is_enabled():
+        return
+    size = _config()['WINDOW_SECONDS']
+
+    by_sensor = {}
+    for row in rows:
+        by_sensor.setdefault(row['sensor_id'], []).append(row)
+
+    cache = _cache()
+    try:
+        current = cache.get_many([_key(sensor_id) for sensor_id in by_sensor])
+        updates = {}
+        for sensor_id, sensor_rows in by_sensor.items():
+            loaded = _load_ring(current.get(_key(sensor_id)), size)
+            if loaded is None:
+                # Earlier seconds were never seen by this ring; merged rows may
+                # be partial seconds, so they are not trusted either
+                seconds = [(row['timestamp'] - EPOCH) // ONE_SECOND for row in sensor_rows]
+                since = max(seconds) + 1 if merge else min(seconds)
+                ring = _empty_ring(size)
+            else:
+                since, ring = loaded
+            for row in sensor_rows:
+                second = (row['timestamp'] - EPOCH) // ONE_SECOND
+                slot = ring[second % size]
+                if slot['second'] > second:
+                    # Older than the second now in this slot: outside the window
+                    continue
+                if merge and slot['second'] == second:
+                    slot['count'] += row['count']
+                    slot['sum'] += row['sum']
+                    slot['sum_sq'] += row['sum_sq']
+                    slot['min'] = min(slot['min'], row['min'])
+                    slot['max'] = max(slot['max'], row['max'])
+                else:
+                    ring[second % size] = (
+                        second, row['count'], row['sum'], row['sum_sq'], row['min'], row['max']
+                    )
+            updates[_key(sensor_id)] = _dump_ring(since, ring)
+        cache.set_many(updates, timeout=None)
+    except Exception:
+        logger.exception('Could not publish live sensor data')
+
+
+def _format_timestamp(second):
+    # Same representation as the serializers (UTC, 'Z' suffix)
+    return (EPOCH + timedelta(seconds=second)).isoformat()[:-6] + 'Z'
+
+
+def _series(sensor_id, slots):
+    """(epoch ms timestamps, row dicts) of ring slots ordered by second"""
+    rows = []
+    for second, count, total, total_sq, minimum, maximum in slots.tolist():
+        fields = finalize(count, total, total_sq, minimum, maximum)
+        rows.append({
+            'sensor_id': sensor_id,
+            'timestamp': _format_timestamp(second),
+            'avg': fields['avg'],
+            'min': fields['min'],
+            'max': fields['max'],
+            'std': fields['std'],
+            'count': count,
+        })
+    return slots['second'] * 1000, rows
+
+
+def get_window(sensor_ids, seconds=None, now=None):
+    """
+    1-second aggregates of the last `seconds` seconds (default: the whole
+    window) per sensor, from the rings. Returns {sensor_id: (epoch ms
+    timestamps, row dicts with LIVE_FIELDS) or None when the sensor's ring
+    is unavailable or does not cover the window}.
+    """
+    sensor_ids = list(sensor_ids)
+    config = _config()
+    if not config['ENABLED']:
+        return dict.fromkeys(sensor_ids)
+    size = config['WINDOW_SECONDS']
+    seconds = size if seconds is None else seconds
+    now = now or timezone.now()
+    # Same bound as timestamp >= now - seconds on whole-second timestamps
+    cutoff = math.ceil((now - EPOCH - timedelta(seconds=seconds)) / ONE_SECOND)
+
+    try:
+        cached = _cache().get_many([_key(sensor_id) for sensor_id in sensor_ids])
+    except Exception:
+        logger.exception('Live sensor data cache unavailable')
+        cached = {}
+
+    window = {}
+    for sensor_id in sensor_ids:
+        loaded = _load_ring(cached.get(_key(sensor_id)), size)
+        if loaded is None or loaded[0] > cutoff:
+            # Missing, or created after the start of the requested window
+            window[sensor_id] = None
+            continue
+        ring = loaded[1]
+        slots = ring[ring['second'] >= cutoff]
+        window[sensor_id] = _series(sensor_id, slots[np.argsort(slots['second'])])
+    return window
+
+
+def get_latest_rows(sensor_ids, max_age=10, now=None):
+    """
+    Newest 1-second aggregate of each sensor no older than max_age seconds.
+    Returns {sensor_id: row dict, or None without a recent row} for sensors
+    whose ring is available; sensors without a ring are left out.
+    """
+    latest = {}
+    for sensor_id, series in get_window(sensor_ids, max_age, now).items():
+        if series is not None:
+            latest[sensor_id] = series[1][-1] if series[1] else None
+    return latest
+
+
+def reset(sensor_ids=None):
+    """Drop the rings (all known sensors by default)"""
+    if sensor_ids is None:
+        sensor_ids = range(SENSOR_ID_MIN, SENSOR_ID_MAX + 1)
+    _cache().delete_many([_key(sensor_id) for sensor_id in sensor_ids])
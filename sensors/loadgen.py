@@ -0,0 +1,214 @@
+"""
+Open-loop load generator for the ingest endpoint (simulate_sensor_stream
+--load).
+
+N simulated devices each send the readings of all 12 sensors, batch_size
+per sensor, every batch_size / hz seconds over one shared aiohttp
+connection pool. Requests are started on a fixed schedule whether or not
+earlier ones have completed, and latency is measured from the scheduled
+send time, so a slow server shows up as latency instead of silently
+lowering the offered rate (no coordinated omission).
+
+aiohttp is optional; is_available() tells whether the load mode can run.
+"""
+import asyncio
+import json
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from .ingest import BINARY_CONTENT_TYPE, encode_binary_readings
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+
+SENSOR_IDS = np.arange(1, 13, dtype=np.uint8)
+
+PERCENTILES = {'p50': 50, 'p95': 95, 'p99': 99, 'p999': 99.9}
+
+LoadConfig = namedtuple('LoadConfig', [
+    'url', 'devices', 'hz', 'batch_size', 'duration', 'connections', 'payload_format', 'timeout', 'seed'
+])
+
+
+def is_available():
+    return aiohttp is not None
+
+
+class DeviceSignal:
+    """Readings of one simulated device: a noisy, drifting sine per sensor with rare spikes"""
+
+    def __init__(self, seed, device, hz):
+        self.rng = np.random.default_rng([seed, device])
+        self.hz = hz
+        self.base = self.rng.uniform(40, 60, len(SENSOR_IDS))
+        self.noise = self.rng.uniform(1, 3, len(SENSOR_IDS))
+        self.iteration = 0
+
+    def next_batch(self, end_us, batch_size):
+        """batch_size readings per sensor, 1/hz apart and ending at end_us"""
+        steps = np.arange(self.iteration, self.iteration + batch_size)
+        self.iteration += batch_size
+        timestamps = end_us - (((batch_size - 1 - np.arange(batch_size)) * 1_000_000) // self.hz).astype(np.int64)
+
+        shape = (batch_size, len(SENSOR_IDS))
+        values = (
+            self.base
+            + self.rng.normal(0, 1, shape) * self.noise
+            + 5 * np.sin(steps[:, None] * 0.1 + SENSOR_IDS)
+            + np.where(self.rng.random(shape) < 0.01, self.rng.choice([-20, 20], shape), 0)
+        )
+        return (
+            np.tile(SENSOR_IDS, batch_size),
+            np.repeat(timestamps, len(SENSOR_IDS)),
+            np.round(values, 2).ravel(),
+        )
+
+
+def encode_payload(sensor_ids, timestamps_us, values, payload_format):
+    """Request body and content type for one batch"""
+    if payload_format == 'binary':
+        # float32 would distort the 2-decimal values
+        return encode_binary_readings(sensor_ids, timestamps_us, values, value_width=8), BINARY_CONTENT_TYPE
+
+    timestamps = np.datetime_as_string(timestamps_us.astype('datetime64[us]'), unit='us')
+    body = json.dumps([
+        {'sensor_id': sensor_id, 'timestamp': f'{timestamp}+00:00', 'value': value}
+        for sensor_id, timestamp, value in zip(sensor_ids.tolist(), timestamps.tolist(), values.tolist())
+    ])
+    return body.encode(), 'application/json'
+
+
+class LoadRecorder:
+    """Per-request outcomes of a run"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.readings_ok = 0
+        self.readings_sent = 0
+        self.max_dispatch_lag = 0.0
+
+    def record(self, status, latency, readings):
+        self.statuses[status] += 1
+        self.readings_sent += readings
+        if isinstance(status, int) and 200 <= status < 300:
+            self.readings_ok += readings
+        self.latencies.append(latency)
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items()
+                   if not (isinstance(status, int) and 200 <= status < 300))
+
+    def summary(self, config, elapsed):
+        latencies = np.array(self.latencies) * 1000
+        requests = self.requests
+        return {
+            'config': config._asdict(),
+            'elapsed_s': elapsed,
+            'requests': requests,
+            'errors': self.errors,
+            'error_rate': self.errors / requests if requests else 0.0,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            'target_readings_per_s': config.devices * len(SENSOR_IDS) * config.hz,
+            'readings_per_s': self.readings_ok / elapsed if elapsed > 0 else 0.0,
+            'requests_per_s': requests / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': {
+                **{name: float(np.percentile(latencies, q)) if len(latencies) else None
+                   for name, q in PERCENTILES.items()},
+                'mean': float(latencies.mean()) if len(latencies) else None,
+                'max': float(latencies.max()) if len(latencies) else None,
+            },
+            'max_dispatch_lag_ms': self.max_dispatch_lag * 1000,
+        }
+
+
+async def _send(session, config, body, content_type, readings, scheduled, recorder):
+    loop = asyncio.get_running_loop()
+    try:
+        async with session.post(config.url, data=body, headers={'Content-Type': content_type}) as response:
+            await response.read()
+            status = response.status
+    except asyncio.TimeoutError:
+        status = 'timeout'
+    except aiohttp.ClientError as e:
+        status = type(e).__name__
+    # From the scheduled send time: queueing for a connection counts too
+    recorder.record(status, loop.time() - scheduled, readings)
+
+
+async def _device(session, config, device, start, recorder, tasks):
+    loop = asyncio.get_running_loop()
+    signal = DeviceSignal(config.seed, device, config.hz)
+    interval = config.batch_size / config.hz
+    # Spread devices over the send interval instead of sending in bursts
+    offset = interval * device / config.devices
+    wall_offset = time.time() - loop.time()
+
+    sent = 0
+    while True:
+        scheduled = start + offset + sent * interval
+        if scheduled >= start + config.duration:
+            break
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        recorder.max_dispatch_lag = max(recorder.max_dispatch_lag, loop.time() - scheduled)
+
+        batch = signal.next_batch(int((scheduled + wall_offset) * 1_000_000), config.batch_size)
+        body, content_type = encode_payload(*batch, config.payload_format)
+        task = asyncio.create_task(_send(session, config, body, content_type, len(batch[2]), scheduled, recorder))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sent += 1
+
+
+async def _report(recorder, start, progress):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(1)
+        progress(loop.time() - start, recorder)
+
+
+async def _run(config, progress):
+    recorder = LoadRecorder()
+    tasks = set()
+    connector = aiohttp.TCPConnector(limit=config.connections)
+    timeout = aiohttp.ClientTimeout(total=config.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        reporter = asyncio.create_task(_report(recorder, start, progress)) if progress else None
+        try:
+            await asyncio.gather(*(
+                _device(session, config, device, start, recorder, tasks) for device in range(config.devices)
+            ))
+            # Requests still in flight finish (or time out) before the run ends
+            if tasks:
+                await asyncio.wait(set(tasks))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        # The offered load covers the whole duration even if the last requests return early
+        elapsed = max(loop.time() - start, config.duration)
+    return recorder.summary(config, elapsed)
+
+
+def run_load(config, progress=None):
+    """
+    Run one load test and return its summary: request and error counts,
+    achieved throughput against the target rate, and latency percentiles.
+    progress(elapsed, recorder) is called every second if given.
+    """
+    if aiohttp is None:
+        raise RuntimeError('The load generator needs aiohttp (pip install aiohttp)')
+    return asyncio.run(_run(config, progress))
@@ -0,0 +1,111 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from sensors.aggregation import TIERS, bucket_start
+from sensors.parallel import setup_worker
+
+
+def _aggregate_chunk(tier_name, start_time, end_time):
+    from sensors.aggregation import aggregate_range
+    return len(aggregate_range(tier_name, start_time, end_time))
+
+
+class Command(BaseCommand):
+    help = 'Re-derive aggregation tiers for a historical time range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='from_time',
+            required=True,
+            help='Range start, ISO datetime (inclusive)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='to_time',
+            required=True,
+            help='Range end, ISO datetime (exclusive; rounded up to a whole bucket of each tier)'
+        )
+        parser.add_argument(
+            '--tier',
+            choices=list(TIERS) + ['all'],
+            default='all',
+            help='Tier to rebuild; "all" rebuilds 1sec, 1min, then 1hour (default: all)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes (default: 1). SQLite serializes writers, so use >1 with PostgreSQL'
+        )
+        parser.add_argument(
+            '--chunk-buckets',
+            type=int,
+            default=None,
+            help='Buckets per grouped query (default: 1 hour of buckets, 24 for 1hour)'
+        )
+
+    def handle(self, *args, **options):
+        start_time = parse_datetime(options['from_time'])
+        end_time = parse_datetime(options['to_time'])
+        if not start_time or not end_time:
+            raise CommandError('--from and --to must be ISO datetimes')
+        if timezone.is_naive(start_time):
+            start_time = timezone.make_aware(start_time)
+        if timezone.is_naive(end_time):
+            end_time = timezone.make_aware(end_time)
+        if start_time >= end_time:
+            raise CommandError('--from must be before --to')
+
+        tiers = list(TIERS) if options['tier'] == 'all' else [options['tier']]
+        workers = max(1, options['workers'])
+
+        for tier_name in tiers:
+            tier = TIERS[tier_name]
+            chunk_buckets = options['chunk_buckets'] or (24 if tier_name == '1hour' else 3600 // int(tier.width.total_seconds()))
+            chunk = tier.width * chunk_buckets
+
+            # Align both ends to bucket boundaries so no bucket is split across
+            # chunks, and the buckets at either end are rebuilt from all of
+            # their source rows (the upsert replaces the stored row)
+            chunk_start = bucket_start(start_time, tier.kind)
+            tier_end = bucket_start(end_time, tier.kind)
+            if tier_end < end_time:
+                tier_end += tier.width
+            chunks = []
+            while chunk_start < tier_end:
+                chunks.append((tier_name, chunk_start, min(chunk_start + chunk, tier_end)))
+                chunk_start += chunk
+
+            self.stdout.write(
+                f'\nRebuilding {tier_name} from {chunks[0][1]} to {tier_end} '
+                f'in {len(chunks)} chunks with {workers} worker(s)'
+            )
+
+            started = time.time()
+            rows = 0
+            if workers == 1:
+                for done, args in enumerate(chunks, start=1):
+                    rows += _aggregate_chunk(*args)
+                    self._progress(done, len(chunks), rows)
+            else:
+                # Children must not inherit open connections
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker) as pool:
+                    for done, count in enumerate(pool.map(_aggregate_chunk, *zip(*chunks)), start=1):
+                        rows += count
+                        self._progress(done, len(chunks), rows)
+
+            elapsed = time.time() - started
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(
+                f'[OK] Wrote {rows:,} {tier_name} rows in {elapsed:.1f}s '
+                f'({rows / elapsed if elapsed > 0 else 0:,.0f} rows/sec)'
+            ))
+
+    def _progress(self, done, total, rows):
+        self.stdout.write(f'\rChunks: {done}/{total} ({rows:,} rows)', ending='')
+        self.stdout.flush()
@@ -1,7 +1,14 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from sensors.models import SensorReading, SensorAggregated1Sec, SensorAggregated1Min
+from sensors import partitions, retention
+
+
+LABELS = {
+    'raw': 'Raw readings',
+    '1sec': '1-sec aggregations',
+    '1min': '1-min aggregations',
+}
 
 
 class Command(BaseCommand):
@@ -17,45 +24,70 @@ class Command(BaseCommand):
         parser.add_argument(
             '--dry-run',
             action='store_true',
-            help='Show what would be deleted without actually deleting'
+            help='Show estimated row counts without deleting anything'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows deleted per statement (default: SENSOR_RETENTION CHUNK_SIZE)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=None,
+            help='Seconds to pause between chunks (default: SENSOR_RETENTION SLEEP_SECONDS)'
         )
 
     def handle(self, *args, **options):
-        days = options['days']
         dry_run = options['dry_run']
-
-        cutoff_raw = timezone.now() - timedelta(days=days)
-        cutoff_1sec = timezone.now() - timedelta(days=30)
-        cutoff_1min = timezone.now() - timedelta(days=365)
+        now = timezone.now()
+        cutoffs = {name: retention.cutoff_for(name, now) for name in retention.TABLES}
+        cutoffs['raw'] = now - timedelta(days=options['days'])
 
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN - No data will be deleted'))
 
-        # Count what will be deleted
-        raw_count = SensorReading.objects.filter(timestamp__lt=cutoff_raw).count()
-        sec_count = SensorAggregated1Sec.objects.filter(timestamp__lt=cutoff_1sec).count()
-        min_count = SensorAggregated1Min.objects.filter(timestamp__lt=cutoff_1min).count()
-
-        self.stdout.write(f'\nRaw readings older than {days} days: {raw_count:,}')
-        self.stdout.write(f'1-sec aggregations older than 30 days: {sec_count:,}')
-        self.stdout.write(f'1-min aggregations older than 365 days: {min_count:,}')
-
-        if not dry_run:
-            # Delete raw readings
-            if raw_count > 0:
-                deleted, _ = SensorReading.objects.filter(timestamp__lt=cutoff_raw).delete()
-                self.stdout.write(self.style.SUCCESS(f'[OK] Deleted {deleted:,} raw readings'))
-
-            # Delete 1-sec aggregations
-            if sec_count > 0:
-                deleted, _ = SensorAggregated1Sec.objects.filter(timestamp__lt=cutoff_1sec).delete()
-                self.stdout.write(self.style.SUCCESS(f'[OK] Deleted {deleted:,} 1-sec aggregations'))
-
-            # Delete 1-min aggregations
-            if min_count > 0:
-                deleted, _ = SensorAggregated1Min.objects.filter(timestamp__lt=cutoff_1min).delete()
-                self.stdout.write(self.style.SUCCESS(f'[OK] Deleted {deleted:,} 1-min aggregations'))
-
-            self.stdout.write(self.style.SUCCESS('\n[OK] Cleanup complete'))
-        else:
+        # Index-based estimates; an exact count() would scan the whole expired range
+        self.stdout.write('')
+        for name, model in retention.TABLES.items():
+            estimate = retention.estimate_expired(model, cutoffs[name])
+            self.stdout.write(f'{LABELS[name]} older than {cutoffs[name]:%Y-%m-%d %H:%M}: ~{estimate:,}')
+            if name == 'raw':
+                for partition, day, rows in partitions.expired_partitions(cutoffs[name]):
+                    self.stdout.write(f'  partition {partition} ({day}): ~{rows:,} rows')
+
+        if dry_run:
             self.stdout.write(self.style.WARNING('\nDry run complete - no data was deleted'))
+            return
+
+        for name, model in retention.TABLES.items():
+            cutoff = cutoffs[name]
+            if name == 'raw' and partitions.is_partitioned():
+                dropped, rows = partitions.drop_partitions_before(cutoff)
+                self.stdout.write(self.style.SUCCESS(
+                    f'[OK] Dropped {dropped} raw reading partitions (~{rows:,} rows)'
+                ))
+                # What is still older sits in the default partition
+                cutoff = partitions.partitioned_cutoff(cutoff)
+
+            result = retention.delete_before(
+                model,
+                cutoff,
+                chunk_size=options['chunk_size'],
+                sleep_seconds=options['sleep'],
+                progress=self._progress,
+            )
+            rate = result.deleted / result.seconds if result.seconds > 0 else 0
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(
+                f'[OK] Deleted {result.deleted:,} {LABELS[name].lower()} in {result.chunks} chunks, '
+                f'{result.seconds:.1f}s ({rate:,.0f} rows/sec)'
+            ))
+
+        self.stdout.write(self.style.SUCCESS('\n[OK] Cleanup complete'))
+
+    def _progress(self, deleted, elapsed):
+        rate = deleted / elapsed if elapsed > 0 else 0
+        self.stdout.write(f'\rDeleted: {deleted:,} ({rate:,.0f} rows/sec)', ending='')
+        self.stdout.flush()
@@ -0,0 +1,125 @@
+import json
+import platform
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from sensors.benchmarks import BENCHMARKS
+
+# Result name suffixes telling which direction is an improvement; other
+# results (row counts, sizes of the generated data) are shown but not judged
+HIGHER_IS_BETTER = ('_per_sec', '_speedup', '_budget_x', 'hit_ratio')
+LOWER_IS_BETTER = ('_ms', '_queries', '_mb', '_per_tick', '_per_reading')
+
+
+class Command(BaseCommand):
+    help = 'Run sensor pipeline performance benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help=f'Benchmarks to run (default: all). Available: {", ".join(BENCHMARKS)}'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of timed repetitions; the best run is reported (default: 5)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed for generated benchmark data (default: 0)'
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Write the results to this JSON file'
+        )
+        parser.add_argument(
+            '--compare',
+            default=None,
+            help='JSON results of an earlier run (--output) to compare against'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=20,
+            help='With --compare, flag results this many percent worse as regressions (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(unknown)}')
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Cannot read baseline {options["compare"]}: {e}')
+
+        run = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'results': {},
+        }
+        regressions = []
+
+        for name in names:
+            self.stdout.write(self.style.SUCCESS(f'\n=== {name} ==='))
+            results = BENCHMARKS[name](repeat=options['repeat'], seed=options['seed'])
+            run['results'][name] = results
+            for key, value in results.items():
+                line = f'{key}: {self._format(value)}'
+                previous = baseline.get(name, {}).get(key)
+                change = self._change(key, value, previous)
+                if change is not None:
+                    line += f'  (baseline {self._format(previous)}, {change:+.1f}%)'
+                    if key.endswith(HIGHER_IS_BETTER + LOWER_IS_BETTER) and change < -options['threshold']:
+                        regressions.append(f'{name}.{key}')
+                        line = self.style.ERROR(line)
+                self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\n[OK] Wrote results to {options["output"]}'))
+
+        if options['compare']:
+            if regressions:
+                self.stdout.write(self.style.ERROR(
+                    f'\n{len(regressions)} result(s) more than {options["threshold"]:g}% worse than the baseline: '
+                    + ', '.join(regressions)
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'\n[OK] No result more than {options["threshold"]:g}% worse than the baseline'
+                ))
+
+    @staticmethod
+    def _format(value):
+        return f'{value:,.2f}' if isinstance(value, float) else value
+
+    @staticmethod
+    def _change(key, value, previous):
+        """
+        Percent change from the baseline, signed so that negative is worse
+        for LOWER_IS_BETTER results. None if not comparable.
+        """
+        numeric = (int, float)
+        if isinstance(value, bool) or not isinstance(value, numeric) or not isinstance(previous, numeric) or not previous:
+            return None
+        if key.endswith(LOWER_IS_BETTER):
+            return (previous - value) / abs(previous) * 100
+        return (value - previous) / abs(previous) * 100
@@ -1,9 +1,13 @@
 import random
-import math
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
 from django.utils import timezone
-from sensors.models import SensorReading, SensorAggregated1Sec
+from django.utils.dateparse import parse_datetime
+from sensors import seeding
+from sensors.parallel import setup_worker
 
 
 class Command(BaseCommand):
@@ -28,11 +32,33 @@ class Command(BaseCommand):
             default='all',
             help='Comma-separated sensor IDs (e.g., "1,2,3") or "all" for all sensors (default: all)'
         )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed; the same seed, range and sensors give the same readings (default: random, printed)'
+        )
+        parser.add_argument(
+            '--end',
+            default=None,
+            help='End of the generated range, ISO datetime (default: now, truncated to the second)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes generating blocks (default: 1). With PostgreSQL they also write; '
+                 'SQLite serializes writers, so there the main process writes'
+        )
 
     def handle(self, *args, **options):
         hours = options['hours']
         frequency = options['frequency']
         sensor_ids_option = options['sensors']
+        workers = max(1, options['workers'])
+
+        if hours <= 0 or frequency <= 0:
+            raise CommandError('--hours and --frequency must be positive')
 
         # Parse sensor IDs
         if sensor_ids_option == 'all':
@@ -49,171 +75,75 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('No valid sensor IDs provided'))
             return
 
+        if options['end']:
+            end_time = parse_datetime(options['end'])
+            if not end_time:
+                raise CommandError('--end must be an ISO datetime')
+            if timezone.is_naive(end_time):
+                end_time = timezone.make_aware(end_time)
+            # Blocks and their 1-second aggregates start on whole seconds
+            end_time = end_time.replace(microsecond=0)
+        else:
+            end_time = timezone.now().replace(microsecond=0)
+
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+
         self.stdout.write(self.style.SUCCESS(
-            f'Generating {hours} hours of data at {frequency}Hz for sensors: {sensor_ids}'
+            f'Generating {hours} hours of data at {frequency}Hz for sensors: {sensor_ids} (seed {seed})'
         ))
 
         # Calculate time range
-        end_time = timezone.now()
         start_time = end_time - timedelta(hours=hours)
-        total_seconds = int((end_time - start_time).total_seconds())
+        total_seconds = hours * 3600
         total_readings = total_seconds * frequency * len(sensor_ids)
 
         self.stdout.write(f'Time range: {start_time} to {end_time}')
         self.stdout.write(f'Total readings to generate: {total_readings:,}')
 
-        # Initialize sensor characteristics
-        sensors_config = {}
-        for sensor_id in sensor_ids:
-            sensors_config[sensor_id] = {
-                'base_value': random.uniform(40, 60),
-                'trend': random.uniform(-0.001, 0.001),
-                'noise_amplitude': random.uniform(1, 3),
-                'frequency_multiplier': random.uniform(0.5, 2.0)
-            }
-
-        # Generate data
-        batch_size = 1000
-        readings_batch = []
+        blocks = seeding.plan_blocks(seed, sensor_ids, start_time, total_seconds, frequency)
         readings_created = 0
+        started = time.time()
 
-        interval = timedelta(seconds=1.0 / frequency)
-        current_time = start_time
-
-        while current_time < end_time:
-            iteration = int((current_time - start_time).total_seconds() * frequency)
-
-            for sensor_id in sensor_ids:
-                config = sensors_config[sensor_id]
-
-                # Generate realistic value
-                base = config['base_value']
-                trend = config['trend'] * iteration
-                noise = random.gauss(0, config['noise_amplitude'])
-                sinusoidal = 5 * math.sin(
-                    iteration * 0.01 * config['frequency_multiplier'] + sensor_id
-                )
-
-                value = base + trend + noise + sinusoidal
-
-                # Occasional spikes (0.5% chance)
-                if random.random() < 0.005:
-                    value += random.choice([-15, 15])
-
-                # Create reading
-                readings_batch.append(
-                    SensorReading(
-                        sensor_id=sensor_id,
-                        timestamp=current_time,
-                        value=round(value, 2)
-                    )
-                )
-
-            # Bulk insert when batch is full
-            if len(readings_batch) >= batch_size:
-                SensorReading.objects.bulk_create(readings_batch, batch_size=batch_size)
-                readings_created += len(readings_batch)
-                readings_batch = []
-
-                # Progress update
-                progress = (readings_created / total_readings) * 100
-                self.stdout.write(
-                    f'\rProgress: {progress:.1f}% ({readings_created:,}/{total_readings:,} readings)',
-                    ending=''
-                )
-                self.stdout.flush()
-
-            current_time += interval
-
-        # Insert remaining readings
-        if readings_batch:
-            SensorReading.objects.bulk_create(readings_batch, batch_size=batch_size)
-            readings_created += len(readings_batch)
+        for count in self._seed_blocks(blocks, workers):
+            readings_created += count
+
+            # Progress update
+            progress = (readings_created / total_readings) * 100
+            self.stdout.write(
+                f'\rProgress: {progress:.1f}% ({readings_created:,}/{total_readings:,} readings)',
+                ending=''
+            )
+            self.stdout.flush()
 
+        elapsed = time.time() - started
         self.stdout.write('')  # New line after progress
         self.stdout.write(self.style.SUCCESS(
-            f'\n[OK] Successfully created {readings_created:,} sensor readings'
+            f'\n[OK] Successfully created {readings_created:,} sensor readings '
+            f'in {elapsed:.1f}s ({readings_created / max(elapsed, 1e-9):,.0f} rows/s)'
         ))
 
-        # Now generate aggregated data if frequency is high
-        if frequency > 1:
-            self.stdout.write(self.style.SUCCESS(
-                '\nGenerating 1-second aggregations...'
-            ))
-            self.generate_aggregations(start_time, end_time, sensor_ids)
-
-    def generate_aggregations(self, start_time, end_time, sensor_ids):
-        """Generate 1-second aggregations from the seeded raw data"""
-        from django.db.models import Avg, Min, Max, StdDev, Count
-
-        aggregations_batch = []
-        batch_size = 100
-        created_count = 0
-
-        # Round start_time to the nearest second
-        current_time = start_time.replace(microsecond=0)
-        end_time_rounded = end_time.replace(microsecond=0)
-
-        while current_time < end_time_rounded:
-            next_time = current_time + timedelta(seconds=1)
-
-            for sensor_id in sensor_ids:
-                # Aggregate this second's data
-                readings = SensorReading.objects.filter(
-                    sensor_id=sensor_id,
-                    timestamp__gte=current_time,
-                    timestamp__lt=next_time
-                )
-
-                agg = readings.aggregate(
-                    avg=Avg('value'),
-                    min_val=Min('value'),
-                    max_val=Max('value'),
-                    std=StdDev('value'),
-                    count=Count('id')
-                )
-
-                if agg['count'] and agg['count'] > 0:
-                    aggregations_batch.append(
-                        SensorAggregated1Sec(
-                            sensor_id=sensor_id,
-                            timestamp=current_time,
-                            avg=agg['avg'],
-                            min=agg['min_val'],
-                            max=agg['max_val'],
-                            std=agg['std'] if agg['std'] is not None else 0.0,
-                            count=agg['count']
-                        )
-                    )
-
-            # Bulk insert
-            if len(aggregations_batch) >= batch_size:
-                SensorAggregated1Sec.objects.bulk_create(
-                    aggregations_batch,
-                    batch_size=batch_size,
-                    ignore_conflicts=True
-                )
-                created_count += len(aggregations_batch)
-                aggregations_batch = []
-
-                self.stdout.write(
-                    f'\rAggregations created: {created_count:,}',
-                    ending=''
-                )
-                self.stdout.flush()
-
-            current_time = next_time
-
-        # Insert remaining
-        if aggregations_batch:
-            SensorAggregated1Sec.objects.bulk_create(
-                aggregations_batch,
-                batch_size=batch_size,
-                ignore_conflicts=True
-            )
-            created_count += len(aggregations_batch)
-
-        self.stdout.write('')
+        # The 1-second tier was written with each block; roll up the rest
+        started = time.time()
+        written = seeding.aggregate_tiers(start_time, end_time)
         self.stdout.write(self.style.SUCCESS(
-            f'[OK] Created {created_count:,} 1-second aggregations'
+            f'[OK] Created {total_seconds * len(sensor_ids):,} 1-second, {written["1min"]:,} 1-minute '
+            f'and {written["1hour"]:,} 1-hour aggregations in {time.time() - started:.1f}s'
         ))
+
+    def _seed_blocks(self, blocks, workers):
+        """Generate and write the blocks, yielding the row count of each"""
+        if workers == 1:
+            for block in blocks:
+                yield seeding.seed_block(block)[1]
+            return
+
+        # Don't hand a live connection to forked workers
+        connections.close_all()
+        parallel_writes = connection.vendor == 'postgresql'
+        with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker) as pool:
+            if parallel_writes:
+                for _, count in pool.map(seeding.seed_block, blocks):
+                    yield count
+            else:
+                for block, timestamps, values in pool.map(seeding.generate_only, blocks):
+                    yield seeding.write_block(block.sensor_id, timestamps, values, block.frequency)
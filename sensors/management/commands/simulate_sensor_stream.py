@@ -1,10 +1,18 @@
 import time
 import random
 import math
+import json
 import requests
 from datetime import datetime
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
+from sensors import loadgen
+from sensors.ingest import (
+    BINARY_CONTENT_TYPE,
+    EPOCH,
+    ONE_MICROSECOND,
+    encode_binary_readings
+)
 
 
 class Command(BaseCommand):
@@ -29,17 +37,68 @@ class Command(BaseCommand):
             default=6,
             help='Number of readings to batch per sensor before sending (default: 6)'
         )
+        parser.add_argument(
+            '--format',
+            choices=['json', 'binary'],
+            default='json',
+            help='Payload format: JSON array or columnar binary frame (default: json)'
+        )
+        parser.add_argument(
+            '--load',
+            action='store_true',
+            help='Open-loop load generator mode (needs aiohttp): many devices, latency percentiles'
+        )
+        parser.add_argument(
+            '--devices',
+            type=int,
+            default=1,
+            help='Load mode: simulated devices, 12 sensors each (default: 1)'
+        )
+        parser.add_argument(
+            '--hz',
+            type=float,
+            default=60,
+            help='Load mode: readings per second per sensor (default: 60)'
+        )
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=20,
+            help='Load mode: HTTP connection pool size (default: 20)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=5,
+            help='Load mode: request timeout in seconds (default: 5)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Load mode: random seed of the generated values (default: 0)'
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Load mode: write the result summary to this JSON file'
+        )
 
     def handle(self, *args, **options):
         duration = options['duration']
         api_url = options['api_url']
         batch_size = options['batch_size']
+        payload_format = options['format']
+
+        if options['load']:
+            return self.handle_load(options)
 
         self.stdout.write(self.style.SUCCESS(
             f'Starting sensor stream simulation for {duration} seconds'
         ))
         self.stdout.write(f'API URL: {api_url}')
         self.stdout.write(f'Batch size: {batch_size} readings per sensor')
+        self.stdout.write(f'Payload format: {payload_format}')
         self.stdout.write(f'Total data rate: {12 * 60} readings/second ({12 * 60 * batch_size / batch_size} requests/second)')
 
         # Initialize sensor base values and trends
@@ -78,10 +137,10 @@ class Command(BaseCommand):
                     if random.random() < 0.01:
                         value += random.choice([-20, 20])
 
-                    # Create reading
+                    # Create reading (timestamp is encoded when the batch is sent)
                     reading = {
                         'sensor_id': sensor_id,
-                        'timestamp': timezone.now().isoformat(),
+                        'timestamp': timezone.now(),
                         'value': round(value, 2)
                     }
 
@@ -97,8 +156,8 @@ class Command(BaseCommand):
                     try:
                         response = requests.post(
                             api_url,
-                            json=batch_to_send,
-                            timeout=5
+                            timeout=5,
+                            **self.encode_batch(batch_to_send, payload_format)
                         )
 
                         if response.status_code == 201:
@@ -146,3 +205,77 @@ class Command(BaseCommand):
         self.stdout.write(f'Average rate: {readings_sent / total_time:.2f} readings/second')
         self.stdout.write(f'Errors: {errors}')
         self.stdout.write(f'Success rate: {(readings_sent / (readings_sent + errors) * 100):.2f}%' if readings_sent + errors > 0 else 'N/A')
+
+    def handle_load(self, options):
+        if not loadgen.is_available():
+            raise CommandError('--load needs aiohttp (pip install aiohttp)')
+        if options['devices'] < 1 or options['hz'] <= 0 or options['batch_size'] < 1 or options['connections'] < 1:
+            raise CommandError('--devices, --hz, --batch-size and --connections must be positive')
+
+        config = loadgen.LoadConfig(
+            url=options['api_url'],
+            devices=options['devices'],
+            hz=options['hz'],
+            batch_size=options['batch_size'],
+            duration=options['duration'],
+            connections=options['connections'],
+            payload_format=options['format'],
+            timeout=options['timeout'],
+            seed=options['seed'],
+        )
+        target = config.devices * 12 * config.hz
+        self.stdout.write(self.style.SUCCESS(
+            f'Load test: {config.devices} device(s) x 12 sensors at {config.hz:g}Hz for {config.duration}s'
+        ))
+        self.stdout.write(f'API URL: {config.url}')
+        self.stdout.write(
+            f'Target: {target:,.0f} readings/second in {target / (12 * config.batch_size):,.1f} requests/second '
+            f'({config.payload_format}, {config.connections} connections)'
+        )
+
+        def progress(elapsed, recorder):
+            self.stdout.write(
+                f'[{elapsed:.1f}s] {recorder.requests} requests, '
+                f'{recorder.readings_ok / elapsed:,.0f} readings/sec - Errors: {recorder.errors}'
+            )
+
+        try:
+            result = loadgen.run_load(config, progress)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nLoad test interrupted by user'))
+            return
+
+        latency = result['latency_ms']
+        self.stdout.write(self.style.SUCCESS('\n=== Load Test Complete ==='))
+        self.stdout.write(f'Duration: {result["elapsed_s"]:.2f} seconds')
+        self.stdout.write(
+            f'Throughput: {result["readings_per_s"]:,.0f} readings/second '
+            f'(target {result["target_readings_per_s"]:,.0f}), {result["requests_per_s"]:,.1f} requests/second'
+        )
+        self.stdout.write(f'Errors: {result["errors"]} of {result["requests"]} ({result["error_rate"]:.2%}) {result["statuses"]}')
+        if latency['p50'] is not None:
+            self.stdout.write(
+                'Latency ms: ' + ', '.join(f'{name} {latency[name]:.1f}' for name in ['p50', 'p95', 'p99', 'p999', 'max'])
+            )
+        self.stdout.write(f'Max dispatch lag: {result["max_dispatch_lag_ms"]:.1f} ms')
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'[OK] Wrote results to {options["output"]}'))
+
+    def encode_batch(self, batch, payload_format):
+        """Build the requests.post body arguments for a batch of readings"""
+        if payload_format == 'binary':
+            frame = encode_binary_readings(
+                [reading['sensor_id'] for reading in batch],
+                [(reading['timestamp'] - EPOCH) // ONE_MICROSECOND for reading in batch],
+                [reading['value'] for reading in batch],
+                value_width=8  # float32 would distort the 2-decimal values
+            )
+            return {'data': frame, 'headers': {'Content-Type': BINARY_CONTENT_TYPE}}
+
+        return {'json': [
+            {**reading, 'timestamp': reading['timestamp'].isoformat()}
+            for reading in batch
+        ]}
@@ -0,0 +1,564 @@
+"""
+In-process metrics (counters, gauges, histograms) exported at /metrics in
+the Prometheus text format.
+
+Recording is a dict update under a per-metric lock; nothing leaves the
+process on the hot path. The web (Daphne), ingest and Celery processes
+each keep their own values, and a daemon thread in every process that
+recorded something publishes a snapshot to the shared cache every
+PUBLISH_INTERVAL seconds, as its field of one process hash (backing off
+while the cache is unreachable, with one warning per outage). /metrics
+merges the snapshots of all processes: counters and histograms are summed,
+gauges summed or maxed per metric.
+
+A process silent for PROCESS_TIMEOUT seconds is gone (exited, or a
+recycled Celery child). The scrape that notices retires it: its counters
+and histograms are added to a persistent retired total and its snapshot is
+removed in the same transaction, so merged counters never go down (which
+Prometheus would take for a reset); its gauges are dropped. On Redis every
+step is a single command or a MULTI/EXEC, so concurrent publishers and
+scrapers cannot lose each other's updates; other cache backends use a lock
+that only covers the current process (enough for LocMemCache).
+
+Aggregation watermark lag does not depend on which process ran the task
+and is read from AggregationWatermark at scrape time.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Publish this process's snapshot for /metrics (off: /metrics shows only the serving process)
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'PUBLISH_INTERVAL': 5,
+    # Snapshots older than this belong to processes that are gone
+    'PROCESS_TIMEOUT': 60,
+}
+
+KEY_PREFIX = 'sensors:metrics:'
+# {process id: {'published_at': time.time(), 'snapshot': snapshot()}}
+PROCESSES_KEY = f'{KEY_PREFIX}processes'
+# {field: total} of the counters and histograms of retired processes
+RETIRED_KEY = f'{KEY_PREFIX}retired'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+_registry = {}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_METRICS', {})}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), merge='sum', shared=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # How gauges of several processes combine: 'sum' or 'max'
+        self.merge = merge
+        # False: computed by the scraping process, never published
+        self.shared = shared
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """[(label values, value)] of this process"""
+        with self._lock:
+            return [(key, self._copy(value)) for key, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _recorded()
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        _recorded()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _recorded()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Fixed buckets; a value is [per-bucket counts (last is +Inf), sum]"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            current = self._values.get(key)
+            if current is None:
+                current = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            current[0][index] += 1
+            current[1] += value
+        _recorded()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+
+# Ingest
+READINGS_INGESTED = Counter('sensor_readings_ingested_total', 'Readings written to the raw table')
+BULK_CREATE_SECONDS = Histogram('sensor_bulk_create_seconds', 'Duration of one raw readings bulk_create')
+INGEST_BUFFER_DEPTH = Gauge('sensor_ingest_buffer_depth', 'Readings waiting in the write-behind buffers')
+INGEST_BUFFER_REJECTED = Counter('sensor_ingest_buffer_rejected_total', 'Readings refused with 429 by a full write buffer')
+INGEST_BUFFER_FLUSH_SECONDS = Histogram('sensor_ingest_buffer_flush_seconds', 'Duration of one write buffer flush transaction')
+
+# HTTP
+HTTP_REQUESTS = Counter('sensor_http_requests_total', 'HTTP requests', ['view', 'method', 'status'])
+HTTP_REQUEST_SECONDS = Histogram('sensor_http_request_duration_seconds', 'HTTP request latency until the response is returned', ['view', 'method'])
+HTTP_REQUEST_QUERIES = Histogram('sensor_http_request_db_queries', 'Database queries per HTTP request', ['view'], buckets=QUERY_BUCKETS)
+
+# Aggregation
+AGGREGATION_SECONDS = Histogram('sensor_aggregation_duration_seconds', 'Duration of one catch-up run of a tier', ['tier'], buckets=LATENCY_BUCKETS + (30, 60))
+AGGREGATION_ROWS = Counter('sensor_aggregation_rows_total', 'Aggregation rows written', ['tier'])
+STREAMING_EMIT_SECONDS = Histogram('sensor_streaming_emit_seconds', 'Duration of one streaming aggregator emit')
+STREAMING_EMIT_LAG = Gauge('sensor_streaming_emit_lag_seconds', 'Age of the newest second at its streaming emit', merge='max')
+WATERMARK_LAG = Gauge('sensor_aggregation_watermark_lag_seconds', 'Time since the aggregation watermark of a tier', ['tier'], shared=False)
+
+# Anomalies
+ANOMALY_DETECTION_SECONDS = Histogram('sensor_anomaly_detection_seconds', 'Duration of scoring one tick in the anomaly engine')
+ANOMALIES_DETECTED = Counter('sensor_anomalies_detected_total', 'Anomalies recorded', ['anomaly_type'])
+
+# History cache
+HISTORY_CACHE_LOOKUPS = Counter('sensor_history_cache_lookups_total', 'History cache block lookups and fresh tail queries', ['result'])
+
+# WebSocket
+WS_CLIENTS = Gauge('sensor_websocket_clients', 'Connected WebSocket clients')
+WS_MESSAGES_SENT = Counter('sensor_websocket_messages_sent_total', 'Frames sent to WebSocket clients', ['type'])
+CHANNEL_GROUP_SENDS = Counter('sensor_channel_group_sends_total', 'Channel layer group_sends of the tick publisher', ['result'])
+CHANNEL_GROUP_SEND_SECONDS = Histogram('sensor_channel_group_send_seconds', 'Duration of one tick publisher group_send')
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+_store_lock = threading.Lock()
+# True from a failed publish until the next one succeeds
+_publish_failing = False
+
+
+def process_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _recorded():
+    """Start this process's snapshot publisher on first use"""
+    if _publisher is None:
+        _start_publisher()
+
+
+def _start_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            return
+        if not _config()['ENABLED']:
+            _publisher = False
+            return
+        _publisher = threading.Thread(target=_publish_loop, name='metrics-publisher', daemon=True)
+        _publisher.start()
+        atexit.register(publish)
+
+
+def _publish_loop():
+    delay = _config()['PUBLISH_INTERVAL']
+    while True:
+        time.sleep(delay)
+        config = _config()
+        if publish():
+            delay = config['PUBLISH_INTERVAL']
+        else:
+            # Back off while the cache is down, but publish at least twice per
+            # PROCESS_TIMEOUT so a live process is never retired as gone
+            delay = max(config['PUBLISH_INTERVAL'], min(delay * 2, config['PROCESS_TIMEOUT'] / 2))
+
+
+def snapshot(include_local=False):
+    """This process's values: {metric name: [(label values, value)]}"""
+    return {
+        name: metric.samples() for name, metric in _registry.items()
+        if metric.shared or include_local
+    }
+
+
+def publish():
+    """
+    Store this process's snapshot in the shared cache.
+    Returns False if the cache could not be written.
+    """
+    global _publish_failing
+
+    config = _config()
+    if not config['ENABLED']:
+        return False
+    try:
+        _store(caches[config['CACHE_ALIAS']]).publish(
+            process_id(), {'published_at': time.time(), 'snapshot': snapshot()}
+        )
+    except Exception as e:
+        # Warn once per outage, not on every retry
+        if _publish_failing:
+            logger.debug('Could not publish metrics snapshot: %s', e)
+        else:
+            logger.warning('Could not publish metrics snapshot, retrying with backoff: %s', e)
+        _publish_failing = True
+        return False
+
+    if _publish_failing:
+        logger.info('Publishing metrics snapshots again')
+        _publish_failing = False
+    return True
+
+
+def _retired_fields(entry):
+    """
+    (field, amount) pairs of the counters and histograms of a process
+    snapshot; a field is the JSON of [metric name, label values] plus the
+    bucket index or 'sum' for histograms
+    """
+    for name, samples in entry['snapshot'].items():
+        metric = _registry.get(name)
+        if metric is None or metric.kind == 'gauge':
+            continue
+        for key, value in samples:
+            if metric.kind == 'histogram':
+                for index, count in enumerate(value[0]):
+                    if count:
+                        yield json.dumps([name, list(key), index]), count
+                yield json.dumps([name, list(key), 'sum']), value[1]
+            elif value:
+                yield json.dumps([name, list(key)]), value
+
+
+def _retired_snapshot(totals):
+    """Retired totals as a snapshot that collect can merge"""
+    snapshot = {}
+    histograms = {}
+    for field, amount in totals.items():
+        name, key, *index = json.loads(field)
+        metric = _registry.get(name)
+        if metric is None:
+            continue
+        if metric.kind == 'histogram':
+            value = histograms.get((name, tuple(key)))
+            if value is None:
+                value = histograms[name, tuple(key)] = [[0] * (len(metric.buckets) + 1), 0.0]
+            if index[0] == 'sum':
+                value[1] = amount
+            else:
+                value[0][index[0]] = amount
+        else:
+            snapshot.setdefault(name, []).append((tuple(key), amount))
+    for (name, key), value in histograms.items():
+        snapshot.setdefault(name, []).append((key, value))
+    return snapshot
+
+
+def _stale(entry, deadline):
+    return entry is None or entry['published_at'] < deadline
+
+
+def _store(cache):
+    from django.core.cache.backends.redis import RedisCache
+
+    return _RedisStore(cache) if isinstance(cache, RedisCache) else _CacheStore(cache)
+
+
+class _RedisStore:
+    """
+    Process snapshots in a Redis hash (HSET per publish) and retired totals
+    in another (HINCRBYFLOAT). A retirement WATCHes the process hash, so it
+    is dropped if anything published in between and retried by the next
+    scrape.
+    """
+
+    def __init__(self, cache):
+        self.processes = cache.make_and_validate_key(PROCESSES_KEY)
+        self.retired_key = cache.make_and_validate_key(RETIRED_KEY)
+        # Writes go to the primary; reads from it too, so they see the last publish
+        self.client = cache._cache.get_client(self.processes, write=True)
+        self.serializer = cache._cache._serializer
+
+    def publish(self, pid, entry):
+        self.client.hset(self.processes, pid, self.serializer.dumps(entry))
+
+    def read(self):
+        """({process id: entry}, retired totals) as of one instant"""
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self.processes)
+            pipe.hgetall(self.retired_key)
+            processes, retired = pipe.execute()
+        return (
+            {pid.decode(): self.serializer.loads(raw) for pid, raw in processes.items()},
+            {field.decode(): _parse_total(raw) for field, raw in retired.items()},
+        )
+
+    def retire(self, pid, deadline):
+        from redis.exceptions import WatchError
+
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(self.processes)
+                raw = pipe.hget(self.processes, pid)
+                entry = None if raw is None else self.serializer.loads(raw)
+                if raw is None or not _stale(entry, deadline):
+                    return
+                pipe.multi()
+                pipe.hdel(self.processes, pid)
+                for field, amount in _retired_fields(entry):
+                    pipe.hincrbyfloat(self.retired_key, field, amount)
+                pipe.execute()
+            except WatchError:
+                pass
+
+
+def _parse_total(raw):
+    value = float(raw)
+    return int(value) if value.is_integer() else value
+
+
+class _CacheStore:
+    """The same operations for any other cache backend, under _store_lock"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def publish(self, pid, entry):
+        with _store_lock:
+            processes = self.cache.get(PROCESSES_KEY) or {}
+            processes[pid] = entry
+            self.cache.set(PROCESSES_KEY, processes, timeout=None)
+
+    def read(self):
+        with _store_lock:
+            stored = self.cache.get_many([PROCESSES_KEY, RETIRED_KEY])
+        return stored.get(PROCESSES_KEY) or {}, stored.get(RETIRED_KEY) or {}
+
+    def retire(self, pid, deadline):
+        with _store_lock:
+            processes = self.cache.get(PROCESSES_KEY) or {}
+            entry = processes.get(pid)
+            if entry is None or not _stale(entry, deadline):
+                return
+            retired = self.cache.get(RETIRED_KEY) or {}
+            for field, amount in _retired_fields(entry):
+                retired[field] = retired.get(field, 0) + amount
+            del processes[pid]
+            self.cache.set_many({PROCESSES_KEY: processes, RETIRED_KEY: retired}, timeout=None)
+
+
+def _reset_after_fork():
+    """A forked child (Celery prefork) starts from zero; its parent keeps reporting its own values"""
+    global _publisher, _publisher_lock, _store_lock, _publish_failing
+    _publisher = None
+    _publish_failing = False
+    _publisher_lock = threading.Lock()
+    _store_lock = threading.Lock()
+    for metric in _registry.values():
+        metric._lock = threading.Lock()
+        metric._values.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _process_snapshots():
+    """
+    Snapshots of every process, this one taken fresh, plus the retired
+    totals. Gauges count only for live processes. Processes found silent
+    are retired afterwards, for the next scrape; this one still counts them
+    from their snapshot.
+    """
+    snapshots = [snapshot(include_local=True)]
+    config = _config()
+    if not config['ENABLED']:
+        return snapshots
+    try:
+        store = _store(caches[config['CACHE_ALIAS']])
+        pid = process_id()
+        deadline = time.time() - config['PROCESS_TIMEOUT']
+        processes, retired = store.read()
+        snapshots.append(_retired_snapshot(retired))
+        gone = []
+        for process, entry in processes.items():
+            if process == pid:
+                continue
+            if _stale(entry, deadline):
+                gone.append(process)
+                snapshots.append({
+                    name: samples for name, samples in entry['snapshot'].items()
+                    if name in _registry and _registry[name].kind != 'gauge'
+                })
+            else:
+                snapshots.append(entry['snapshot'])
+        for process in gone:
+            store.retire(process, deadline)
+    except Exception:
+        logger.exception('Could not read metrics snapshots of other processes')
+    return snapshots
+
+
+def _merge(metric, values):
+    if metric.kind == 'histogram':
+        counts = [sum(column) for column in zip(*(value[0] for value in values))]
+        return [counts, sum(value[1] for value in values)]
+    if metric.kind == 'gauge' and metric.merge == 'max':
+        return max(values)
+    return sum(values)
+
+
+def collect():
+    """Merged values of all processes: {metric name: {label values: value}}"""
+    grouped = {name: {} for name in _registry}
+    for process_snapshot in _process_snapshots():
+        for name, samples in process_snapshot.items():
+            if name not in grouped:
+                continue
+            for key, value in samples:
+                grouped[name].setdefault(tuple(key), []).append(value)
+    return {
+        name: {key: _merge(_registry[name], values) for key, values in samples.items()}
+        for name, samples in grouped.items()
+    }
+
+
+def update_watermark_lag(now=None):
+    """Set the watermark lag of every tier from AggregationWatermark"""
+    from .models import AggregationWatermark
+
+    now = now or timezone.now()
+    WATERMARK_LAG.reset()
+    for tier, watermark in AggregationWatermark.objects.values_list('tier', 'watermark'):
+        WATERMARK_LAG.set((now - watermark).total_seconds(), tier=tier)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(metric, key, extra=()):
+    pairs = list(zip(metric.labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(values=None):
+    """Prometheus text exposition (format 0.0.4) of the merged metrics"""
+    values = collect() if values is None else values
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.get(name, {}).items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_labels(metric, key)} {_number(value)}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f'{name}_bucket{_labels(metric, key, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric, key)} {_number(float(total))}')
+            lines.append(f'{name}_count{_labels(metric, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and database query count of every request,
+    labelled with the URL name of the view. Streamed response bodies are
+    produced after the middleware returns and are not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(elapsed, view=view, method=request.method)
+        HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        HTTP_REQUEST_QUERIES.observe(queries, view=view)
+        return response
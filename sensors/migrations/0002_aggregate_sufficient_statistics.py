@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:32
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_sufficient_statistics(apps, schema_editor):
+    """
+    Derive sum and sum_sq from the stored avg/std/count of existing rows.
+    std is the population standard deviation, so sum_sq = count * (std^2 + avg^2).
+
+    Rows written before this migration by the old 1-min/1-hour tasks hold an
+    unweighted average of averages and count = number of child buckets, so
+    their statistics are approximate; everything written afterwards is exact.
+    """
+    for model_name in ['SensorAggregated1Sec', 'SensorAggregated1Min', 'SensorAggregated1Hour']:
+        model = apps.get_model('sensors', model_name)
+        std = Coalesce(F('std'), Value(0.0))
+        model.objects.update(
+            sum=F('avg') * F('count'),
+            sum_sq=F('count') * (std * std + F('avg') * F('avg')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensoraggregated1hour',
+            name='sum',
+            field=models.FloatField(default=0.0, help_text='Sum of values (for exact rollups)'),
+        ),
+        migrations.AddField(
+            model_name='sensoraggregated1hour',
+            name='sum_sq',
+            field=models.FloatField(default=0.0, help_text='Sum of squared values (for exact rollups)'),
+        ),
+        migrations.AddField(
+            model_name='sensoraggregated1min',
+            name='sum',
+            field=models.FloatField(default=0.0, help_text='Sum of values (for exact rollups)'),
+        ),
+        migrations.AddField(
+            model_name='sensoraggregated1min',
+            name='sum_sq',
+            field=models.FloatField(default=0.0, help_text='Sum of squared values (for exact rollups)'),
+        ),
+        migrations.AddField(
+            model_name='sensoraggregated1sec',
+            name='sum',
+            field=models.FloatField(default=0.0, help_text='Sum of values (for exact rollups)'),
+        ),
+        migrations.AddField(
+            model_name='sensoraggregated1sec',
+            name='sum_sq',
+            field=models.FloatField(default=0.0, help_text='Sum of squared values (for exact rollups)'),
+        ),
+        migrations.RunPython(backfill_sufficient_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0002_aggregate_sufficient_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregationWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tier', models.CharField(choices=[('1sec', '1 Second'), ('1min', '1 Minute'), ('1hour', '1 Hour')], max_length=10, unique=True)),
+                ('watermark', models.DateTimeField(help_text='All buckets starting before this time are aggregated')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Aggregation Watermark',
+                'verbose_name_plural': 'Aggregation Watermarks',
+                'db_table': 'aggregation_watermarks',
+            },
+        ),
+    ]
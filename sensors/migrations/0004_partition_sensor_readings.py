@@ -0,0 +1,123 @@
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import migrations
+
+
+TABLE = 'sensor_readings'
+UNPARTITIONED = 'sensor_readings_unpartitioned'
+SEQUENCE = 'sensor_readings_partitioned_id_seq'
+PRECREATE_DAYS = 3
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _create_indexes(schema_editor, model):
+    """Recreate the indexes Django manages for SensorReading"""
+    for field in model._meta.local_fields:
+        if field.db_index and not field.primary_key:
+            schema_editor.execute(schema_editor._create_index_sql(model, fields=[field]))
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def partition_readings(apps, schema_editor):
+    """
+    Convert sensor_readings into a table range-partitioned by UTC day.
+
+    PostgreSQL only; other databases keep the plain table. Existing rows are
+    copied into daily partitions, so this is slow on a large table. The
+    primary key becomes (id, timestamp) because a partitioned table's unique
+    constraints must include the partition key; ids still come from one
+    sequence and stay unique.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    SensorReading = apps.get_model('sensors', 'SensorReading')
+    qn = schema_editor.quote_name
+
+    schema_editor.execute(f'ALTER TABLE {qn(TABLE)} RENAME TO {qn(UNPARTITIONED)}')
+    schema_editor.execute(f'CREATE SEQUENCE {qn(SEQUENCE)} AS bigint')
+    schema_editor.execute(
+        f'CREATE TABLE {qn(TABLE)} ('
+        f'  "id" bigint NOT NULL DEFAULT nextval(\'{SEQUENCE}\'),'
+        f'  "sensor_id" integer NOT NULL,'
+        f'  "timestamp" timestamp with time zone NOT NULL,'
+        f'  "value" double precision NOT NULL,'
+        f'  "created_at" timestamp with time zone NOT NULL,'
+        f'  PRIMARY KEY ("id", "timestamp")'
+        f') PARTITION BY RANGE ("timestamp")'
+    )
+    schema_editor.execute(f'ALTER SEQUENCE {qn(SEQUENCE)} OWNED BY {qn(TABLE)}."id"')
+    # Catches rows outside every daily partition so inserts never fail
+    schema_editor.execute(f'CREATE TABLE {qn(TABLE + "_default")} PARTITION OF {qn(TABLE)} DEFAULT')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN("timestamp"), MAX("timestamp") FROM {qn(UNPARTITIONED)}')
+        first, last = cursor.fetchone()
+
+    today = datetime.now(timezone.utc).date()
+    day = min(first.astimezone(timezone.utc).date(), today) if first else today
+    end = max(last.astimezone(timezone.utc).date(), today) if last else today
+    end += timedelta(days=PRECREATE_DAYS)
+    while day <= end:
+        schema_editor.execute(
+            f'CREATE TABLE {qn(f"{TABLE}_p{day:%Y%m%d}")} PARTITION OF {qn(TABLE)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [_day_start(day), _day_start(day + timedelta(days=1))]
+        )
+        day += timedelta(days=1)
+
+    schema_editor.execute(
+        f'INSERT INTO {qn(TABLE)} ("id", "sensor_id", "timestamp", "value", "created_at") '
+        f'SELECT "id", "sensor_id", "timestamp", "value", "created_at" FROM {qn(UNPARTITIONED)}'
+    )
+    schema_editor.execute(
+        f'SELECT setval(\'{SEQUENCE}\', COALESCE(MAX("id"), 0) + 1, false) FROM {qn(TABLE)}'
+    )
+    schema_editor.execute(f'DROP TABLE {qn(UNPARTITIONED)}')
+
+    _create_indexes(schema_editor, SensorReading)
+
+
+def unpartition_readings(apps, schema_editor):
+    """Copy readings back into a single plain table"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    SensorReading = apps.get_model('sensors', 'SensorReading')
+    qn = schema_editor.quote_name
+    partitioned = f'{TABLE}_partitioned'
+
+    schema_editor.execute(f'ALTER TABLE {qn(TABLE)} RENAME TO {qn(partitioned)}')
+    # create_model also creates the model's indexes, so free their names first
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, partitioned)
+    for name, info in constraints.items():
+        if info['index'] and not info['primary_key']:
+            schema_editor.execute(f'DROP INDEX {qn(name)}')
+
+    schema_editor.create_model(SensorReading)
+    schema_editor.execute(
+        f'INSERT INTO {qn(TABLE)} ("id", "sensor_id", "timestamp", "value", "created_at") '
+        f'OVERRIDING SYSTEM VALUE '
+        f'SELECT "id", "sensor_id", "timestamp", "value", "created_at" FROM {qn(partitioned)}'
+    )
+    schema_editor.execute(
+        f'SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX("id"), 0) + 1, false) FROM {qn(TABLE)}',
+        [TABLE, 'id']
+    )
+    schema_editor.execute(f'DROP TABLE {qn(partitioned)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0003_aggregation_watermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_readings, unpartition_readings),
+    ]
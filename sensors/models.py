@@ -7,6 +7,7 @@ class SensorReading(models.Model):
     """
     Raw sensor readings at 60Hz frequency.
     Retention: 7 days, then auto-deleted.
+    Partitioned by day on PostgreSQL (see sensors.partitions).
     """
     sensor_id = models.IntegerField(db_index=True, help_text="Sensor ID (1-12)")
     timestamp = models.DateTimeField(db_index=True, help_text="Reading timestamp with microsecond precision")
@@ -28,10 +29,11 @@ class SensorReading(models.Model):
 
     @classmethod
     def cleanup_old_readings(cls, days=7):
-        """Delete readings older than specified days"""
+        """Delete readings older than specified days, in chunks (or whole partitions)"""
+        from .retention import purge_readings
+
         cutoff_date = timezone.now() - timedelta(days=days)
-        deleted_count, _ = cls.objects.filter(timestamp__lt=cutoff_date).delete()
-        return deleted_count
+        return purge_readings(cutoff_date).deleted
 
 
 class SensorAggregated1Sec(models.Model):
@@ -46,6 +48,8 @@ class SensorAggregated1Sec(models.Model):
     max = models.FloatField(help_text="Maximum value")
     std = models.FloatField(null=True, blank=True, help_text="Standard deviation")
     count = models.IntegerField(help_text="Number of readings in aggregation")
+    sum = models.FloatField(default=0.0, help_text="Sum of values (for exact rollups)")
+    sum_sq = models.FloatField(default=0.0, help_text="Sum of squared values (for exact rollups)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -75,6 +79,8 @@ class SensorAggregated1Min(models.Model):
     max = models.FloatField(help_text="Maximum value")
     std = models.FloatField(null=True, blank=True, help_text="Standard deviation")
     count = models.IntegerField(help_text="Number of readings in aggregation")
+    sum = models.FloatField(default=0.0, help_text="Sum of values (for exact rollups)")
+    sum_sq = models.FloatField(default=0.0, help_text="Sum of squared values (for exact rollups)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -104,6 +110,8 @@ class SensorAggregated1Hour(models.Model):
     max = models.FloatField(help_text="Maximum value")
     std = models.FloatField(null=True, blank=True, help_text="Standard deviation")
     count = models.IntegerField(help_text="Number of readings in aggregation")
+    sum = models.FloatField(default=0.0, help_text="Sum of values (for exact rollups)")
+    sum_sq = models.FloatField(default=0.0, help_text="Sum of squared values (for exact rollups)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -161,3 +169,27 @@ class Anomaly(models.Model):
 
     def __str__(self):
         return f"Anomaly: Sensor {self.sensor_id} - {self.anomaly_type} ({self.severity}) at {self.timestamp}"
+
+
+class AggregationWatermark(models.Model):
+    """
+    Progress marker for each aggregation tier.
+    Every bucket that starts before `watermark` has been aggregated.
+    """
+    TIER_CHOICES = [
+        ('1sec', '1 Second'),
+        ('1min', '1 Minute'),
+        ('1hour', '1 Hour'),
+    ]
+
+    tier = models.CharField(max_length=10, choices=TIER_CHOICES, unique=True)
+    watermark = models.DateTimeField(help_text="All buckets starting before this time are aggregated")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'aggregation_watermarks'
+        verbose_name = 'Aggregation Watermark'
+        verbose_name_plural = 'Aggregation Watermarks'
+
+    def __str__(self):
+        return f"{self.tier} aggregated up to {self.watermark}"
@@ -0,0 +1,12 @@
+"""
+Helpers for management commands that fan work out to a process pool.
+"""
+from django.db import connections
+
+
+def setup_worker():
+    """Process pool initializer: make Django usable in the child process"""
+    import django
+    django.setup()
+    # Never share a forked parent's database connection
+    connections.close_all()
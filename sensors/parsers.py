@@ -0,0 +1,17 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from .ingest import BINARY_CONTENT_TYPE, BinaryFrameError, decode_binary_readings
+
+
+class BinaryReadingsParser(BaseParser):
+    """
+    Parses columnar binary reading frames into a ReadingBatch.
+    See sensors.ingest for the frame layout.
+    """
+    media_type = BINARY_CONTENT_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return decode_binary_readings(stream.read())
+        except BinaryFrameError as e:
+            raise ParseError(f'Binary parse error - {e}')
@@ -0,0 +1,195 @@
+"""
+Daily partitions for the raw readings table.
+
+At 60Hz x 12 sensors the raw table grows by about 62M rows a day, and
+deleting expired rows one by one locks and bloats it. On PostgreSQL,
+sensor_readings is a range-partitioned table (see migration 0004) with one
+partition per UTC day plus a default partition. Retention detaches and
+drops whole expired days, and queries filtered on timestamp (history,
+aggregation) are pruned to the days they touch.
+
+Rows outside every daily partition (seeded past days, ingest beyond the
+precreated days) land in the default partition. Creating a day's partition
+moves that day's rows out of it first, and retention deletes expired rows
+left in it in chunks (see sensors.retention.purge_readings).
+
+Other databases (SQLite in development) keep a single table. Every helper
+here is a no-op there and retention falls back to chunked deletes (see
+sensors.retention).
+"""
+import re
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import SensorReading
+
+
+DEFAULTS = {
+    # Days of partitions kept created ahead of today
+    'PRECREATE_DAYS': 3,
+}
+
+TABLE = SensorReading._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+COLUMNS = ['id', 'sensor_id', 'timestamp', 'value', 'created_at']
+PARTITION_PATTERN = re.compile(rf'^{TABLE}_p(\d{{8}})$')
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_READING_PARTITIONS', {})}
+
+
+def partition_name(day):
+    """Name of the partition holding a UTC date"""
+    return f'{TABLE}_p{day:%Y%m%d}'
+
+
+def _day_start(day):
+    return datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def partitioned_cutoff(cutoff):
+    """
+    Start of the UTC day containing cutoff. Once the expired daily
+    partitions are dropped, readings older than this can only be in the
+    default partition.
+    """
+    return _day_start(cutoff.astimezone(dt_timezone.utc).date())
+
+
+def is_partitioned():
+    """True if the readings table is a partitioned PostgreSQL table"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE]
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions():
+    """
+    Daily partitions of the readings table, oldest first, as
+    (name, date, estimated rows) tuples. The default partition is excluded.
+    """
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, child.reltuples
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.oid = to_regclass(%s)
+            """,
+            [TABLE]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, reltuples in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            day = datetime.strptime(match.group(1), '%Y%m%d').date()
+            # reltuples is -1 until the partition is first analyzed
+            partitions.append((name, day, max(int(reltuples), 0)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _table_exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        return cursor.fetchone()[0]
+
+
+def create_partition(day):
+    """
+    Create the partition for a UTC date if it does not exist.
+
+    PostgreSQL refuses to create a partition for a range the default
+    partition already holds rows of, so in that case the partition is built
+    as a plain table, the day's rows are moved into it from the default
+    partition, and it is attached, all in one transaction.
+    """
+    name = partition_name(day)
+    if _table_exists(name):
+        return
+
+    qn = connection.ops.quote_name
+    bounds = [_day_start(day), _day_start(day + timedelta(days=1))]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {qn(DEFAULT_PARTITION)} '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s)',
+            bounds
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {qn(name)} '
+                f'PARTITION OF {qn(TABLE)} FOR VALUES FROM (%s) TO (%s)',
+                bounds
+            )
+            return
+
+        columns = ', '.join(qn(column) for column in COLUMNS)
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS ('
+            f'  DELETE FROM {qn(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s'
+            f'  RETURNING {columns}'
+            f') INSERT INTO {qn(name)} ({columns}) SELECT {columns} FROM moved',
+            bounds
+        )
+        # Builds the partition's indexes and checks the default partition
+        cursor.execute(
+            f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)',
+            bounds
+        )
+
+
+def ensure_partitions(start=None, days_ahead=None):
+    """
+    Create daily partitions from start (default: today, UTC) through
+    days_ahead days later. Returns the names of the partitions checked.
+    """
+    if not is_partitioned():
+        return []
+    if days_ahead is None:
+        days_ahead = _config()['PRECREATE_DAYS']
+    first = start or datetime.now(dt_timezone.utc).date()
+
+    names = []
+    for offset in range(days_ahead + 1):
+        day = first + timedelta(days=offset)
+        create_partition(day)
+        names.append(partition_name(day))
+    return names
+
+
+def expired_partitions(cutoff):
+    """Daily partitions whose whole day is older than cutoff"""
+    cutoff_day = cutoff.astimezone(dt_timezone.utc).date()
+    return [partition for partition in list_partitions() if partition[1] < cutoff_day]
+
+
+def drop_partitions_before(cutoff):
+    """
+    Detach and drop every daily partition entirely older than cutoff.
+    Readings of the day containing cutoff are kept until that day expires.
+    Expired rows in the default partition are not touched (see
+    sensors.retention.purge_readings).
+    Returns (partitions dropped, estimated rows removed).
+    """
+    qn = connection.ops.quote_name
+    dropped = expired_partitions(cutoff)
+    for name, _, _ in dropped:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+            cursor.execute(f'DROP TABLE {qn(name)}')
+    return len(dropped), sum(rows for _, _, rows in dropped)
+
@@ -0,0 +1,194 @@
+"""
+Columnar and streaming renderers for the time-series endpoints.
+
+Views that list a renderer with ``columnar = True`` return their series as
+one array per field (built straight from values_list, see
+history.columnar_series) instead of one serialized object per row, and the
+renderer only encodes the result.
+
+- ColumnarJSONRenderer: ``?format=columnar`` or
+  ``Accept: application/vnd.sensor-columnar+json``
+- MessagePackRenderer: ``?format=msgpack`` or ``Accept: application/x-msgpack``
+  (only when the msgpack package is installed)
+
+Renderers with ``streaming = True`` (NDJSON and CSV) instead encode a row
+iterator lazily for a StreamingHttpResponse (see streaming_response), so
+the memory used does not depend on the number of rows. Their render() only
+handles small payloads such as error responses.
+
+Under ASGI, Django consumes a synchronous streaming iterator with
+sync_to_async(list) before sending anything, which would hold the whole
+body in memory. stream_content hands ASGI requests an asynchronous iterator
+instead that encodes one chunk per sync_to_async call.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.sensor-columnar+json'
+    format = 'columnar'
+    columnar = True
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self._encode, use_bin_type=True)
+
+    @staticmethod
+    def _encode(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(f'Cannot encode {type(obj).__name__} as MessagePack')
+
+
+COLUMNAR_RENDERERS = [ColumnarJSONRenderer] + ([MessagePackRenderer] if msgpack is not None else [])
+
+# Rows encoded per chunk written to the response
+STREAM_BATCH_ROWS = 1000
+
+
+def _batched(rows, size=STREAM_BATCH_ROWS):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class NDJSONRenderer(BaseRenderer):
+    """One JSON object per line: ``?format=ndjson`` or ``Accept: application/x-ndjson``"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+    streaming = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=JSONEncoder) + '\n').encode()
+
+    def stream(self, fields, rows):
+        encoder = JSONEncoder()
+        for batch in _batched(rows):
+            yield ''.join(encoder.encode(dict(zip(fields, row))) + '\n' for row in batch).encode()
+
+
+class CSVRenderer(BaseRenderer):
+    """Header row plus one line per row: ``?format=csv`` or ``Accept: text/csv``"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    streaming = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        return b''.join(self.stream(list(data), [list(data.values())]))
+
+    def stream(self, fields, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for batch in _batched(rows):
+            writer.writerows([
+                [self._format(value) for value in row] for row in batch
+            ])
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    @staticmethod
+    def _format(value):
+        if isinstance(value, datetime):
+            # Same representation as the JSON responses
+            value = value.isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return value
+
+
+STREAMING_RENDERERS = [NDJSONRenderer, CSVRenderer]
+
+
+def is_columnar(request):
+    """True if the request negotiated one of the columnar renderers"""
+    return getattr(request.accepted_renderer, 'columnar', False)
+
+
+def is_streaming(request):
+    """True if the request negotiated one of the streaming renderers"""
+    return getattr(request.accepted_renderer, 'streaming', False)
+
+
+_DONE = object()
+
+
+async def _async_chunks(chunks):
+    """
+    Pull chunks from a synchronous iterator one at a time in the request's
+    sync thread (where its database cursor lives), so each is sent before
+    the next is encoded.
+    """
+    iterator = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        # Release the cursor if the client went away mid-stream
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def stream_content(request, chunks):
+    """Streaming response content for chunks: asynchronous under ASGI, as is under WSGI"""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return _async_chunks(chunks)
+    return chunks
+
+
+def streaming_response(request, fields, rows, filename=None):
+    """
+    Stream rows (tuples in fields order) with the negotiated streaming
+    renderer. Rows are pulled from the iterator as the client reads.
+    """
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        stream_content(request, renderer.stream(fields, rows)),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}'
+    )
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+    return response
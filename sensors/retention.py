@@ -0,0 +1,163 @@
+"""
+Chunked, rate-limited retention for raw readings and aggregation tiers.
+
+A single queryset delete() of a week of 60Hz readings goes through Django's
+deletion collector and holds locks for minutes. Here expired rows are
+removed oldest first, a bounded time-ordered chunk per statement
+(QuerySet._raw_delete, no collector and no signals, which these models do
+not use), with a pause between chunks so live ingest keeps its I/O.
+
+Every chunk commits on its own and always removes the oldest remaining
+rows, so an interrupted or time-boxed run leaves a consistent prefix
+deleted and the next run simply continues.
+
+Raw readings in a partitioned table (see sensors.partitions) are removed by
+dropping whole expired partitions instead; only the expired rows left in
+the default partition are deleted in chunks.
+"""
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import partitions
+from .models import SensorReading, SensorAggregated1Sec, SensorAggregated1Min
+
+
+DEFAULTS = {
+    # Days each table is kept
+    'DAYS': {'raw': 7, '1sec': 30, '1min': 365},
+    # Rows per DELETE statement
+    'CHUNK_SIZE': 5000,
+    # Pause between chunks (seconds)
+    'SLEEP_SECONDS': 0.05,
+    # Time budget per scheduled run; whatever is left resumes on the next run
+    'MAX_SECONDS': 600,
+}
+
+TABLES = {
+    'raw': SensorReading,
+    '1sec': SensorAggregated1Sec,
+    '1min': SensorAggregated1Min,
+}
+
+RetentionResult = namedtuple('RetentionResult', ['deleted', 'chunks', 'seconds', 'complete'])
+
+
+def _config():
+    config = {**DEFAULTS, **getattr(settings, 'SENSOR_RETENTION', {})}
+    config['DAYS'] = {**DEFAULTS['DAYS'], **config['DAYS']}
+    return config
+
+
+def cutoff_for(name, now=None):
+    """Oldest timestamp kept for a table"""
+    return (now or timezone.now()) - timedelta(days=_config()['DAYS'][name])
+
+
+def estimate_expired(model, cutoff):
+    """
+    Estimate rows older than cutoff from two index lookups instead of a
+    count() scan: ids grow with arrival time, so the expired rows are about
+    the id range below the first row at or after cutoff.
+    """
+    if model is SensorReading and partitions.is_partitioned():
+        return sum(rows for _, _, rows in partitions.expired_partitions(cutoff))
+
+    first_id = model.objects.order_by('pk').values_list('pk', flat=True).first()
+    if first_id is None:
+        return 0
+    boundary_id = model.objects.filter(timestamp__gte=cutoff).order_by('timestamp').values_list('pk', flat=True).first()
+    if boundary_id is None:
+        boundary_id = model.objects.order_by('-pk').values_list('pk', flat=True).first() + 1
+    return max(boundary_id - first_id, 0)
+
+
+def delete_before(model, cutoff, chunk_size=None, sleep_seconds=None, max_seconds=None, progress=None):
+    """
+    Delete rows of model older than cutoff, oldest first, in chunks of about
+    chunk_size rows. Stops after max_seconds (if given) with complete=False.
+    progress, if given, is called as progress(deleted, elapsed) after every
+    chunk. Returns a RetentionResult.
+    """
+    config = _config()
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    sleep_seconds = config['SLEEP_SECONDS'] if sleep_seconds is None else sleep_seconds
+
+    expired = model.objects.filter(timestamp__lt=cutoff)
+    started = time.perf_counter()
+    deleted = 0
+    chunks = 0
+    complete = False
+    while True:
+        # Timestamp of the chunk_size-th oldest expired row bounds this chunk
+        nth = list(expired.order_by('timestamp').values_list('timestamp', flat=True)[chunk_size - 1:chunk_size])
+        boundary = nth[0] if nth else None
+        chunk = expired if boundary is None else model.objects.filter(timestamp__lte=boundary)
+        count = chunk._raw_delete(chunk.db)
+        deleted += count
+        chunks += 1
+
+        elapsed = time.perf_counter() - started
+        if progress is not None:
+            progress(deleted, elapsed)
+        if boundary is None or count == 0:
+            complete = True
+            break
+        if max_seconds is not None and elapsed >= max_seconds:
+            break
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+    return RetentionResult(deleted, chunks, time.perf_counter() - started, complete)
+
+
+def purge_readings(cutoff, **options):
+    """
+    Remove raw readings older than cutoff. A partitioned table drops whole
+    expired days, then deletes the older rows that sit in the default
+    partition in chunks; otherwise everything is deleted in chunks (options
+    are passed to delete_before). Returns a RetentionResult; deleted is
+    estimated for dropped partitions.
+    """
+    if not partitions.is_partitioned():
+        return delete_before(SensorReading, cutoff, **options)
+
+    started = time.perf_counter()
+    dropped, rows = partitions.drop_partitions_before(cutoff)
+    # Partition pruning confines this to the default partition
+    leftover = delete_before(SensorReading, partitions.partitioned_cutoff(cutoff), **options)
+    return RetentionResult(
+        rows + leftover.deleted, dropped + leftover.chunks, time.perf_counter() - started, leftover.complete
+    )
+
+
+def purge_expired(name, now=None, **options):
+    """
+    Apply the retention policy of one table ('raw', '1sec' or '1min').
+    Raw readings go through purge_readings; the tiers are deleted in chunks
+    (options are passed to delete_before). Returns a RetentionResult.
+    """
+    model = TABLES[name]
+    cutoff = cutoff_for(name, now)
+
+    if model is SensorReading:
+        return purge_readings(cutoff, **options)
+    return delete_before(model, cutoff, **options)
+
+
+def run_retention(now=None):
+    """
+    Apply every table's retention policy within the MAX_SECONDS budget.
+    Tables not finished in time resume on the next run.
+    Returns {name: RetentionResult}.
+    """
+    budget = _config()['MAX_SECONDS']
+    started = time.perf_counter()
+    results = {}
+    for name in TABLES:
+        remaining = max(budget - (time.perf_counter() - started), 0)
+        results[name] = purge_expired(name, now, max_seconds=remaining)
+    return results
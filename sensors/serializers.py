@@ -33,6 +33,14 @@ class SensorAggregated1SecSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class SensorLiveSerializer(serializers.ModelSerializer):
+    """1-second aggregates of the live endpoints, in the shape the live ring buffers serve"""
+
+    class Meta:
+        model = SensorAggregated1Sec
+        fields = ['sensor_id', 'timestamp', 'avg', 'min', 'max', 'std', 'count']
+
+
 class SensorAggregated1MinSerializer(serializers.ModelSerializer):
     """Serializer for 1-minute aggregated data"""
 
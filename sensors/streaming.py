@@ -0,0 +1,315 @@
+"""
+Streaming 1-second aggregation fed directly by the ingest path.
+
+aggregate_1sec_data used to re-query the raw table for every sensor every
+second. Instead, each stored ReadingBatch is folded into running per
+(sensor, second) state -- count, mean, M2 (sum of squared deviations), min
+and max -- using the parallel variance merge of Chan et al. A background
+thread emits every finished second to SensorAggregated1Sec in one bulk
+upsert, so the raw table is never rescanned for aggregation.
+
+Each emit adds its statistics into the stored row (see
+aggregation.merge_aggregates), so readings that arrive after their second
+was emitted, or the same second emitted by several ingest processes, merge
+exactly instead of overwriting each other.
+
+aggregate_1sec_data does not run while streaming is enabled, so the emit
+thread advances the '1sec' watermark to the first second it has not yet
+closed. Without that, aggregation.final_until('1sec') would stay None and
+the history cache would never serve 1sec blocks.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .aggregation import advance_watermark, merge_aggregates
+from .ingest import EPOCH
+from .models import SensorAggregated1Sec
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'EMIT_INTERVAL': 0.25,
+    'GRACE_SECONDS': 1,
+}
+
+US_PER_SECOND = 1_000_000
+
+# Seconds for which emitted (sensor, second) keys are remembered, to tell
+# late partial seconds from first emits
+EMITTED_HISTORY_SECONDS = 120
+
+# Group keys pack (second, sensor_id) into one int64; sensor ids must fit in 20 bits
+SENSOR_KEY_BITS = 20
+
+
+def merge_stats(a, b):
+    """
+    Merge two [count, mean, m2, min, max] summaries (Chan's parallel algorithm).
+    Returns a new list; neither argument is modified.
+    """
+    count = a[0] + b[0]
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / count
+    m2 = a[2] + b[2] + delta * delta * a[0] * b[0] / count
+    return [count, mean, m2, min(a[3], b[3]), max(a[4], b[4])]
+
+
+def summarize_batch(batch):
+    """
+    Reduce a ReadingBatch to per-(sensor_id, second) summaries in one
+    vectorized pass. Returns {(sensor_id, second): [count, mean, m2, min, max]}.
+    """
+    if not len(batch):
+        return {}
+
+    seconds = batch.timestamps_us // US_PER_SECOND
+    keys = (seconds << SENSOR_KEY_BITS) | batch.sensor_ids.astype(np.int64)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+    values = batch.values.astype(np.float64)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, weights=values) / counts
+    m2s = np.bincount(inverse, weights=(values - means[inverse]) ** 2)
+    mins = np.full(len(unique_keys), np.inf)
+    maxs = np.full(len(unique_keys), -np.inf)
+    np.minimum.at(mins, inverse, values)
+    np.maximum.at(maxs, inverse, values)
+
+    sensor_mask = (1 << SENSOR_KEY_BITS) - 1
+    return {
+        (key & sensor_mask, key >> SENSOR_KEY_BITS): [count, mean, m2, mn, mx]
+        for key, count, mean, m2, mn, mx in zip(
+            unique_keys.tolist(), counts.tolist(), means.tolist(),
+            m2s.tolist(), mins.tolist(), maxs.tolist()
+        )
+    }
+
+
+class StreamingAggregator:
+    """Running per-(sensor, second) statistics with periodic emission"""
+
+    def __init__(self, emit_interval=0.25, grace_seconds=1):
+        self.emit_interval = emit_interval
+        self.grace_seconds = grace_seconds
+
+        self._lock = threading.Lock()
+        self._emit_lock = threading.Lock()
+        self._state = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._closed = False
+
+        # Seconds before this are closed and covered by the '1sec' watermark
+        self._watermark = None
+        # second -> sensor ids already emitted for it (recent seconds only)
+        self._emitted = {}
+
+        # Metrics
+        self._buckets_emitted = 0
+        self._last_emit_seconds = 0.0
+
+    def add(self, batch):
+        """Fold a stored ReadingBatch into the running state"""
+        summaries = summarize_batch(batch)
+        with self._lock:
+            self._fold(summaries)
+
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name='streaming-aggregator', daemon=True
+                )
+                self._thread.start()
+
+        # Nothing will emit for us once closed (e.g. a final buffer flush at exit)
+        if self._closed:
+            self.emit(force=True)
+
+    def _fold(self, summaries):
+        """Merge summaries into the running state; the caller holds _lock"""
+        for key, summary in summaries.items():
+            current = self._state.get(key)
+            self._state[key] = summary if current is None else merge_stats(current, summary)
+
+    def emit(self, force=False):
+        """
+        Write finished seconds to SensorAggregated1Sec.
+        With force=True every pending second is written, finished or not.
+        Returns the emitted rows as dicts. If the write fails, the seconds
+        go back into the running state and the next emit retries them.
+        """
+        with self._emit_lock:
+            cutoff = int(time.time()) - self.grace_seconds
+            with self._lock:
+                ready = {
+                    key: summary for key, summary in self._state.items()
+                    if force or key[1] < cutoff
+                }
+                for key in ready:
+                    del self._state[key]
+
+            rows = fresh = []
+            if ready:
+                started = time.perf_counter()
+                rows = [
+                    {
+                        'sensor_id': sensor_id,
+                        'timestamp': EPOCH + timedelta(seconds=second),
+                        'count': count,
+                        'sum': mean * count,
+                        'sum_sq': m2 + count * mean * mean,
+                        'min': mn,
+                        'max': mx,
+                    }
+                    for (sensor_id, second), (count, mean, m2, mn, mx) in ready.items()
+                ]
+                try:
+                    merge_aggregates(SensorAggregated1Sec, rows)
+                except Exception:
+                    with self._lock:
+                        self._fold(ready)
+                    raise
+                fresh = [row for row, first in zip(rows, self._first_emits(ready, cutoff)) if first]
+
+                self._buckets_emitted += len(rows)
+                self._last_emit_seconds = time.perf_counter() - started
+                metrics.STREAMING_EMIT_SECONDS.observe(self._last_emit_seconds)
+                metrics.AGGREGATION_ROWS.inc(len(rows), tier='1sec')
+                # From the end of the newest emitted second
+                metrics.STREAMING_EMIT_LAG.set(time.time() - (max(second for _, second in ready) + 1))
+
+            # Every second before cutoff is now written (once per second, not per emit)
+            if not force and (self._watermark is None or cutoff > self._watermark):
+                advance_watermark('1sec', EPOCH + timedelta(seconds=cutoff))
+                self._watermark = cutoff
+
+        if rows:
+            self._after_emit(rows, fresh)
+        return rows
+
+    def _first_emits(self, ready, cutoff):
+        """
+        Flag each ready (sensor, second) emitted for the first time; the
+        others are late readings merged into a second already emitted.
+        Seconds older than EMITTED_HISTORY_SECONDS count as late.
+        """
+        oldest = cutoff - EMITTED_HISTORY_SECONDS
+        for second in [second for second in self._emitted if second < oldest]:
+            del self._emitted[second]
+
+        flags = []
+        for sensor_id, second in ready:
+            emitted = self._emitted.setdefault(second, set()) if second >= oldest else None
+            flags.append(emitted is not None and sensor_id not in emitted)
+            if emitted is not None:
+                emitted.add(sensor_id)
+        return flags
+
+    def _after_emit(self, rows, fresh):
+        """
+        Publish emitted seconds to the live ring buffers, run anomaly
+        detection on the latest emitted second for each sensor and
+        broadcast the tick to WebSocket clients.
+
+        rows include late partial seconds, which the rings and the engine
+        merge into what they hold; only fresh rows (seconds emitted for the
+        first time) are scored and broadcast, since a partial second would
+        re-score a second already checked and replace a point clients
+        already plotted with wrong statistics.
+        """
+        from .anomalies import get_engine
+        from .broadcast import publish_tick
+        from .live import publish_rows
+        from .tasks import detect_anomalies
+
+        # Partial seconds (late data) add to what the rings already hold
+        publish_rows(rows, merge=True)
+
+        engine = get_engine()
+        if engine is not None:
+            # Partial seconds (late data) add to what the engine already holds
+            fresh_ids = {id(row) for row in fresh}
+            found = engine.process(
+                [row['sensor_id'] for row in rows],
+                [row['timestamp'] for row in rows],
+                [row['sum'] for row in rows],
+                [row['count'] for row in rows],
+                merge=True,
+                score=[id(row) in fresh_ids for row in rows],
+            )
+            publish_tick(fresh, found)
+            return
+
+        publish_tick(fresh)
+
+        latest = {}
+        for row in fresh:
+            if row['sensor_id'] not in latest or row['timestamp'] > latest[row['sensor_id']]['timestamp']:
+                latest[row['sensor_id']] = row
+        for row in latest.values():
+            detect_anomalies.delay(row['sensor_id'], row['timestamp'], row['sum'] / row['count'])
+
+    def close(self):
+        """Stop the emit thread and write everything still pending"""
+        self._closed = True
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.emit(force=True)
+
+    def _run(self):
+        while not self._stop.wait(self.emit_interval):
+            try:
+                self.emit()
+            except Exception:
+                logger.exception('Streaming 1-second aggregation emit failed')
+
+    def stats(self):
+        """Snapshot of pending state and emission metrics"""
+        with self._lock:
+            pending = len(self._state)
+        return {
+            'enabled': True,
+            'pending_buckets': pending,
+            'buckets_emitted': self._buckets_emitted,
+            'last_emit_ms': self._last_emit_seconds * 1000,
+        }
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'SENSOR_STREAMING_AGGREGATION', {})}
+
+
+def is_enabled():
+    return _config()['ENABLED']
+
+
+def get_aggregator():
+    """Return the process-wide streaming aggregator, or None if disabled"""
+    global _aggregator
+
+    config = _config()
+    if not config['ENABLED']:
+        return None
+
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                _aggregator = StreamingAggregator(
+                    emit_interval=config['EMIT_INTERVAL'],
+                    grace_seconds=config['GRACE_SECONDS'],
+                )
+                atexit.register(_aggregator.close)
+    return _aggregator
@@ -1,13 +1,13 @@
 from celery import shared_task
 from django.utils import timezone
-from django.db.models import Avg, Min, Max, StdDev, Count
+from django.db.models import Avg, StdDev
 from datetime import timedelta
 import math
+from . import anomalies, broadcast, latest, live, metrics, partitions, retention, streaming
+from .aggregation import catch_up
+from .ingest import SENSOR_ID_MAX, SENSOR_ID_MIN
 from .models import (
-    SensorReading,
     SensorAggregated1Sec,
-    SensorAggregated1Min,
-    SensorAggregated1Hour,
     Anomaly
 )
 
@@ -16,179 +16,91 @@ from .models import (
 def aggregate_1sec_data():
     """
     Aggregate raw 60Hz sensor data into 1-second summaries.
-    Runs every second.
-    """
-    # Get current time and round down to the second
-    now = timezone.now()
-    end_time = now.replace(microsecond=0)
-    start_time = end_time - timedelta(seconds=1)
-
-    aggregated_count = 0
-
-    # Process each sensor
-    for sensor_id in range(1, 13):
-        # Get all readings for this sensor in the last second
-        readings = SensorReading.objects.filter(
-            sensor_id=sensor_id,
-            timestamp__gte=start_time,
-            timestamp__lt=end_time
-        )
+    Runs every second; catches up on every second missed since the watermark.
 
-        # Calculate aggregations
-        agg_data = readings.aggregate(
-            avg=Avg('value'),
-            min_val=Min('value'),
-            max_val=Max('value'),
-            std=StdDev('value'),
-            count=Count('id')
+    Skipped when streaming aggregation is enabled: the ingest process then
+    emits 1-second summaries itself (see sensors.streaming).
+    """
+    if streaming.is_enabled():
+        return "Streaming aggregation enabled, skipped raw table scan"
+
+    # Every closed second since the watermark: one grouped query per chunk
+    result = catch_up('1sec')
+
+    # Newly closed seconds feed the live ring buffers (see sensors.live)
+    rows = [{field: getattr(row, field) for field in live.ROW_FIELDS} for row in result.rows]
+    live.publish_rows(rows)
+
+    # Check for anomalies in newly closed seconds
+    found = []
+    engine = anomalies.get_engine()
+    if engine is not None:
+        found = engine.process(
+            [row.sensor_id for row in result.rows],
+            [row.timestamp for row in result.rows],
+            [row.sum for row in result.rows],
+            [row.count for row in result.rows],
         )
+    else:
+        for row in result.rows:
+            detect_anomalies.delay(row.sensor_id, row.timestamp, row.avg)
 
-        # Only create aggregation if we have data
-        if agg_data['count'] and agg_data['count'] > 0:
-            # Create or update 1-second aggregation
-            SensorAggregated1Sec.objects.update_or_create(
-                sensor_id=sensor_id,
-                timestamp=start_time,
-                defaults={
-                    'avg': agg_data['avg'],
-                    'min': agg_data['min_val'],
-                    'max': agg_data['max_val'],
-                    'std': agg_data['std'] if agg_data['std'] is not None else 0.0,
-                    'count': agg_data['count']
-                }
-            )
-            aggregated_count += 1
-
-            # Check for anomalies
-            detect_anomalies.delay(sensor_id, start_time, agg_data['avg'])
+    # One WebSocket frame for the whole tick
+    broadcast.publish_tick(rows, found)
 
-    return f"Aggregated 1-sec data for {aggregated_count} sensors"
+    return f"Aggregated {result.count} 1-sec buckets up to {result.watermark}"
 
 
 @shared_task
 def aggregate_1min_data():
     """
     Aggregate 1-second data into 1-minute summaries.
-    Runs every minute.
+    Runs every minute; catches up on every minute missed since the watermark.
     """
-    # Get current time and round down to the minute
-    now = timezone.now()
-    end_time = now.replace(second=0, microsecond=0)
-    start_time = end_time - timedelta(minutes=1)
+    result = catch_up('1min')
 
-    aggregated_count = 0
-
-    # Process each sensor
-    for sensor_id in range(1, 13):
-        # Get all 1-second aggregations for this sensor in the last minute
-        sec_data = SensorAggregated1Sec.objects.filter(
-            sensor_id=sensor_id,
-            timestamp__gte=start_time,
-            timestamp__lt=end_time
-        )
-
-        # Calculate aggregations from the averages (weighted by count)
-        agg_data = sec_data.aggregate(
-            avg=Avg('avg'),
-            min_val=Min('min'),
-            max_val=Max('max'),
-            count=Count('id')
-        )
-
-        # Calculate weighted standard deviation
-        if agg_data['count'] and agg_data['count'] > 0:
-            # Simple average of std devs (approximation)
-            std_data = sec_data.aggregate(avg_std=Avg('std'))
-            std = std_data['avg_std'] if std_data['avg_std'] is not None else 0.0
-
-            # Create or update 1-minute aggregation
-            SensorAggregated1Min.objects.update_or_create(
-                sensor_id=sensor_id,
-                timestamp=start_time,
-                defaults={
-                    'avg': agg_data['avg'],
-                    'min': agg_data['min_val'],
-                    'max': agg_data['max_val'],
-                    'std': std,
-                    'count': agg_data['count']
-                }
-            )
-            aggregated_count += 1
-
-    return f"Aggregated 1-min data for {aggregated_count} sensors"
+    return f"Aggregated {result.count} 1-min buckets up to {result.watermark}"
 
 
 @shared_task
 def aggregate_1hour_data():
     """
     Aggregate 1-minute data into 1-hour summaries.
-    Runs every hour.
+    Runs every hour; catches up on every hour missed since the watermark.
     """
-    # Get current time and round down to the hour
-    now = timezone.now()
-    end_time = now.replace(minute=0, second=0, microsecond=0)
-    start_time = end_time - timedelta(hours=1)
-
-    aggregated_count = 0
-
-    # Process each sensor
-    for sensor_id in range(1, 13):
-        # Get all 1-minute aggregations for this sensor in the last hour
-        min_data = SensorAggregated1Min.objects.filter(
-            sensor_id=sensor_id,
-            timestamp__gte=start_time,
-            timestamp__lt=end_time
-        )
-
-        # Calculate aggregations
-        agg_data = min_data.aggregate(
-            avg=Avg('avg'),
-            min_val=Min('min'),
-            max_val=Max('max'),
-            count=Count('id')
-        )
+    result = catch_up('1hour')
 
-        # Calculate weighted standard deviation
-        if agg_data['count'] and agg_data['count'] > 0:
-            # Simple average of std devs (approximation)
-            std_data = min_data.aggregate(avg_std=Avg('std'))
-            std = std_data['avg_std'] if std_data['avg_std'] is not None else 0.0
-
-            # Create or update 1-hour aggregation
-            SensorAggregated1Hour.objects.update_or_create(
-                sensor_id=sensor_id,
-                timestamp=start_time,
-                defaults={
-                    'avg': agg_data['avg'],
-                    'min': agg_data['min_val'],
-                    'max': agg_data['max_val'],
-                    'std': std,
-                    'count': agg_data['count']
-                }
-            )
-            aggregated_count += 1
-
-    return f"Aggregated 1-hour data for {aggregated_count} sensors"
+    return f"Aggregated {result.count} 1-hour buckets up to {result.watermark}"
 
 
 @shared_task
 def cleanup_old_readings():
     """
-    Delete raw sensor readings older than 7 days.
+    Delete raw sensor readings older than 7 days, 1-second aggregations
+    older than 30 days and 1-minute aggregations older than 1 year.
     Runs daily at 2 AM (configured in celery.py).
-    """
-    cutoff_date = timezone.now() - timedelta(days=7)
-    deleted_count, _ = SensorReading.objects.filter(timestamp__lt=cutoff_date).delete()
 
-    # Also cleanup old 1-second aggregations (older than 30 days)
-    cutoff_30_days = timezone.now() - timedelta(days=30)
-    deleted_1sec, _ = SensorAggregated1Sec.objects.filter(timestamp__lt=cutoff_30_days).delete()
+    Deletes in small chunks within a time budget (see sensors.retention);
+    anything left over is picked up by the next run.
+    """
+    results = retention.run_retention()
+    summary = ', '.join(
+        f"{result.deleted} {name} rows{'' if result.complete else ' (incomplete)'}"
+        for name, result in results.items()
+    )
+    return f"Deleted {summary}"
 
-    # Cleanup old 1-minute aggregations (older than 1 year)
-    cutoff_1_year = timezone.now() - timedelta(days=365)
-    deleted_1min, _ = SensorAggregated1Min.objects.filter(timestamp__lt=cutoff_1_year).delete()
 
-    return f"Deleted {deleted_count} raw readings, {deleted_1sec} 1-sec aggregations, {deleted_1min} 1-min aggregations"
+@shared_task
+def maintain_reading_partitions():
+    """
+    Create the raw readings partitions for today and the next few days.
+    Runs hourly; a no-op unless the table is partitioned (PostgreSQL).
+    """
+    names = partitions.ensure_partitions()
+    if not names:
+        return "Readings table is not partitioned"
+    return f"Ensured partitions {names[0]} to {names[-1]}"
 
 
 @shared_task
@@ -197,6 +109,9 @@ def detect_anomalies(sensor_id, timestamp, current_value):
     Detect anomalies in sensor data using statistical methods.
     - Spike detection: > 3 standard deviations from 10-minute rolling mean
     - Out of range: Below min or above max thresholds
+
+    Superseded by the batched AnomalyEngine when SENSOR_ANOMALY_ENGINE is
+    enabled; kept for the fan-out path and ad-hoc use.
     """
     # Get last 10 minutes of 1-second aggregated data for this sensor
     lookback_time = timestamp - timedelta(minutes=10)
@@ -212,23 +127,22 @@ def detect_anomalies(sensor_id, timestamp, current_value):
 
     # Calculate rolling statistics
     stats = historical_data.aggregate(
-        avg=Avg('avg'),
+        mean=Avg('avg'),
         std=StdDev('avg')
     )
 
-    mean = stats['avg']
+    mean = stats['mean']
     std = stats['std'] if stats['std'] is not None else 0.0
 
-    # Define sensor-specific thresholds (these would normally come from config/database)
-    SENSOR_MIN = 0.0  # Minimum expected value
-    SENSOR_MAX = 100.0  # Maximum expected value
-    SPIKE_THRESHOLD = 3.0  # Number of standard deviations
+    SENSOR_MIN = anomalies.SENSOR_MIN
+    SENSOR_MAX = anomalies.SENSOR_MAX
+    SPIKE_THRESHOLD = anomalies.SPIKE_THRESHOLD
 
     anomalies_created = []
 
     # Check for spike (> 3 std deviations from mean)
     if std > 0 and abs(current_value - mean) > (SPIKE_THRESHOLD * std):
-        severity = 'high' if abs(current_value - mean) > (5 * std) else 'medium'
+        severity = 'high' if abs(current_value - mean) > (anomalies.HIGH_SEVERITY_THRESHOLD * std) else 'medium'
         anomaly = Anomaly.objects.create(
             sensor_id=sensor_id,
             timestamp=timestamp,
@@ -239,7 +153,7 @@ def detect_anomalies(sensor_id, timestamp, current_value):
             expected_range_max=mean + (SPIKE_THRESHOLD * std),
             description=f"Value {current_value:.2f} is {abs(current_value - mean) / std:.1f} std devs from mean {mean:.2f}"
         )
-        anomalies_created.append('spike')
+        anomalies_created.append(anomaly)
 
     # Check for out of range
     if current_value < SENSOR_MIN or current_value > SENSOR_MAX:
@@ -253,10 +167,16 @@ def detect_anomalies(sensor_id, timestamp, current_value):
             expected_range_max=SENSOR_MAX,
             description=f"Value {current_value:.2f} is outside range [{SENSOR_MIN}, {SENSOR_MAX}]"
         )
-        anomalies_created.append('out_of_range')
+        anomalies_created.append(anomaly)
 
     if anomalies_created:
-        return f"Created {len(anomalies_created)} anomalies: {', '.join(anomalies_created)}"
+        for anomaly in anomalies_created:
+            metrics.ANOMALIES_DETECTED.inc(anomaly_type=anomaly.anomaly_type)
+        broadcast.publish_tick([], anomalies_created)
+        return (
+            f"Created {len(anomalies_created)} anomalies: "
+            f"{', '.join(anomaly.anomaly_type for anomaly in anomalies_created)}"
+        )
 
     return "No anomalies detected"
 
@@ -266,37 +186,41 @@ def check_sensor_dropouts():
     """
     Check for sensor dropouts (no data for > 5 seconds).
     Runs periodically (every 10 seconds).
+
+    Last readings come from the shared latest-value registry (see
+    sensors.latest). A sensor stays reported (at most every 5 minutes) for
+    as long as it is silent.
     """
     now = timezone.now()
     dropout_threshold = now - timedelta(seconds=5)
-    dropouts_detected = []
-
-    for sensor_id in range(1, 13):
-        # Check last reading for this sensor
-        last_reading = SensorReading.objects.filter(
-            sensor_id=sensor_id
-        ).order_by('-timestamp').first()
-
-        if last_reading and last_reading.timestamp < dropout_threshold:
-            # Check if we already reported this dropout recently
-            recent_dropout = Anomaly.objects.filter(
-                sensor_id=sensor_id,
-                anomaly_type='dropout',
-                timestamp__gte=now - timedelta(minutes=5)
-            ).exists()
-
-            if not recent_dropout:
-                Anomaly.objects.create(
-                    sensor_id=sensor_id,
-                    timestamp=now,
-                    anomaly_type='dropout',
-                    severity='high',
-                    value=0.0,
-                    description=f"No data received for {(now - last_reading.timestamp).total_seconds():.0f} seconds"
-                )
-                dropouts_detected.append(sensor_id)
-
-    if dropouts_detected:
-        return f"Detected dropouts for sensors: {', '.join(map(str, dropouts_detected))}"
+
+    last_seen = {
+        sensor_id: reading[0]
+        for sensor_id, reading in latest.get_latest(range(SENSOR_ID_MIN, SENSOR_ID_MAX + 1)).items()
+        if reading
+    }
+
+    # Skip sensors whose dropout was already reported recently
+    recently_reported = set(Anomaly.objects.filter(
+        anomaly_type='dropout',
+        timestamp__gte=now - timedelta(minutes=5)
+    ).values_list('sensor_id', flat=True))
+
+    dropouts = [
+        Anomaly(
+            sensor_id=sensor_id,
+            timestamp=now,
+            anomaly_type='dropout',
+            severity='high',
+            value=0.0,
+            description=f"No data received for {(now - last_time).total_seconds():.0f} seconds"
+        )
+        for sensor_id, last_time in sorted(last_seen.items())
+        if last_time < dropout_threshold and sensor_id not in recently_reported
+    ]
+    Anomaly.objects.bulk_create(dropouts)
+
+    if dropouts:
+        return f"Detected dropouts for sensors: {', '.join(str(a.sensor_id) for a in dropouts)}"
 
     return "No dropouts detected"
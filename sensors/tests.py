@@ -1,3 +1,662 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, transaction
+from django.test import TestCase, override_settings
+
+from . import broadcast, history_cache, live, metrics, seeding
+from .aggregation import aggregate_range, catch_up, final_until, finalize, merge_aggregates
+from .anomalies import AnomalyEngine
+from .buffer import IngestBufferFull, IngestWriteBuffer
+from .consumers import SensorDataConsumer
+from .history import columnar_series
+from .ingest import (
+    BINARY_CONTENT_TYPE,
+    BINARY_HEADER,
+    BinaryFrameError,
+    ReadingBatch,
+    decode_binary_readings,
+    encode_binary_readings,
+    store_readings
+)
+from .models import AggregationWatermark, Anomaly, SensorAggregated1Hour, SensorAggregated1Min, SensorAggregated1Sec, SensorReading
+from .renderers import STREAM_BATCH_ROWS
+from .serializers import SensorAggregated1MinSerializer
+from .streaming import StreamingAggregator
+from .tasks import check_sensor_dropouts
+
+
+# Local memory, so the tests need no Redis server or channel layer
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-default'},
+    'history': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-history'},
+}
+LOCAL_CHANNEL_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+START = datetime(2026, 1, 1, 9, tzinfo=dt_timezone.utc)
+
+
+def make_batch(sensor_id, count, start_us=None):
+    start_us = int(START.timestamp() * 1_000_000) if start_us is None else start_us
+    return ReadingBatch(
+        sensor_ids=np.full(count, sensor_id, dtype=np.int64),
+        values=np.arange(count, dtype=np.float64),
+        timestamps_us=start_us + np.arange(count, dtype=np.int64) * 100_000,
+    )
+
+
+def add_readings(sensor_id, start, seconds, hz=4):
+    """hz readings per second with values 0, 1, 2, ... from start"""
+    SensorReading.objects.bulk_create([
+        SensorReading(sensor_id=sensor_id, timestamp=start + timedelta(seconds=i / hz), value=float(i))
+        for i in range(int(seconds * hz))
+    ])
+
+
+@override_settings(
+    CACHES=LOCAL_CACHE,
+    CHANNEL_LAYERS=LOCAL_CHANNEL_LAYER,
+    SENSOR_STREAMING_AGGREGATION={'ENABLED': False},
+    SENSOR_METRICS={'ENABLED': False},
+)
+class IngestWriteBufferTests(TestCase):
+    def setUp(self):
+        # Flushed by hand; the background thread never wakes on its own
+        self.buffer = IngestWriteBuffer(max_rows=10_000, flush_interval=3600, max_pending=100)
+        self.addCleanup(self.buffer.close)
+
+    def test_failed_flush_requeues_and_applies_backpressure(self):
+        self.buffer.submit(make_batch(1, 30))
+        self.buffer.submit(make_batch(2, 20))
+
+        with mock.patch('sensors.buffer.store_readings', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('sensors.buffer', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        stats = self.buffer.stats()
+        self.assertEqual(stats['depth'], 50)
+        self.assertTrue(stats['retrying'])
+        self.assertEqual(stats['rows_failed'], 0)
+        with self.assertRaises(IngestBufferFull):
+            self.buffer.submit(make_batch(3, 1))
+
+        self.assertEqual(self.buffer.flush(), 50)
+        self.assertEqual(SensorReading.objects.count(), 50)
+        self.assertEqual(self.buffer.stats()['depth'], 0)
+
+        # Accepting again once a write succeeded
+        self.buffer.submit(make_batch(3, 1))
+        self.assertEqual(self.buffer.flush(), 1)
+
+    def test_streaming_aggregator_only_sees_committed_batches(self):
+        aggregator = mock.Mock()
+        with mock.patch('sensors.streaming.get_aggregator', return_value=aggregator):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(OperationalError), transaction.atomic():
+                    store_readings(make_batch(1, 10))
+                    raise OperationalError('commit failed')
+            aggregator.add.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    store_readings(make_batch(1, 10))
+            aggregator.add.assert_called_once()
+
+
+@override_settings(
+    CACHES=LOCAL_CACHE,
+    SENSOR_INGEST_BUFFER={'ENABLED': False},
+    SENSOR_STREAMING_AGGREGATION={'ENABLED': False},
+    SENSOR_METRICS={'ENABLED': False},
+)
+class IngestFastPathTests(TestCase):
+    """The fast path answers exactly as SensorReadingBulkCreateSerializer does"""
+
+    VALID = [
+        {'sensor_id': 1, 'timestamp': '2026-01-01T09:00:00Z', 'value': 50},
+        {'sensor_id': 12, 'timestamp': '2026-01-01T10:00:00.250+01:00', 'value': -1.5},
+        {'sensor_id': 3, 'timestamp': '2026-01-01T09:00:01', 'value': 1e3},
+    ]
+
+    def _post(self, payload, fast_path):
+        with self.settings(SENSOR_INGEST_FAST_PATH=fast_path):
+            response = self.client.post('/api/sensors/ingest/', payload, content_type='application/json')
+        stored = list(SensorReading.objects.order_by('id').values_list('sensor_id', 'timestamp', 'value'))
+        SensorReading.objects.all().delete()
+        return response.status_code, response.json(), stored
+
+    def assertSameResponse(self, payload, status):
+        fast, serializer = self._post(payload, True), self._post(payload, False)
+        self.assertEqual(fast, serializer)
+        self.assertEqual(fast[0], status)
+
+    def test_valid_batches(self):
+        self.assertSameResponse(self.VALID, 201)
+        self.assertSameResponse([], 201)
+
+    def test_invalid_readings(self):
+        valid = self.VALID[0]
+        for reading in [
+            {**valid, 'sensor_id': 0},
+            {**valid, 'sensor_id': 13},
+            {**valid, 'sensor_id': True},
+            {**valid, 'timestamp': 'not-a-time'},
+            {**valid, 'timestamp': '2026-02-30T00:00:00Z'},
+            {**valid, 'timestamp': 1767258000},
+            {**valid, 'value': 'abc'},
+            {**valid, 'value': None},
+            {'sensor_id': 1, 'timestamp': '2026-01-01T09:00:00Z'},
+        ]:
+            with self.subTest(reading=reading):
+                self.assertSameResponse([reading], 400)
+
+    def test_partially_invalid_batch_stores_nothing(self):
+        self.assertSameResponse(self.VALID + [{**self.VALID[0], 'sensor_id': 13}], 400)
+
+    def test_lenient_serializer_inputs_are_accepted_alike(self):
+        # Numeric strings pass FloatField and IntegerField; the fast path hands them over
+        self.assertSameResponse([{**self.VALID[0], 'value': '1.5', 'sensor_id': '2'}], 201)
+
+
+@override_settings(
+    CACHES=LOCAL_CACHE,
+    SENSOR_INGEST_BUFFER={'ENABLED': False},
+    SENSOR_STREAMING_AGGREGATION={'ENABLED': False},
+    SENSOR_METRICS={'ENABLED': False},
+)
+class BinaryFrameTests(TestCase):
+    SENSOR_IDS = [1, 7, 12]
+    TIMESTAMPS_US = [1_767_258_000_000_000, 1_767_258_000_016_667, 1_767_258_000_033_333]
+    VALUES = [50.25, -3.5, 1e-3]
+
+    def test_round_trip(self):
+        for width in (4, 8):
+            with self.subTest(width=width):
+                frame = encode_binary_readings(self.SENSOR_IDS, self.TIMESTAMPS_US, self.VALUES, value_width=width)
+                batch = decode_binary_readings(frame)
+                self.assertEqual(batch.sensor_ids.tolist(), self.SENSOR_IDS)
+                self.assertEqual(batch.timestamps_us.tolist(), self.TIMESTAMPS_US)
+                expected = np.array(self.VALUES, dtype=np.float32 if width == 4 else np.float64)
+                self.assertEqual(batch.values.tolist(), expected.tolist())
+                self.assertEqual(batch.datetimes[1], datetime(2026, 1, 1, 9, 0, 0, 16_667, tzinfo=dt_timezone.utc))
+
+    def test_malformed_frames_are_rejected(self):
+        frame = encode_binary_readings(self.SENSOR_IDS, self.TIMESTAMPS_US, self.VALUES)
+        header = frame[:BINARY_HEADER.size]
+        cases = {
+            'shorter than the header': frame[:10],
+            'magic': b'XXXX' + frame[4:],
+            'width': header[:4] + bytes([2]) + frame[5:],
+            'length does not match': frame[:-1],
+            'length does not match ': frame + b'\0',
+            'sensor_id': encode_binary_readings([1, 13, 2], self.TIMESTAMPS_US, self.VALUES),
+            'sensor_id ': encode_binary_readings([0, 1, 2], self.TIMESTAMPS_US, self.VALUES),
+            'timestamp': encode_binary_readings(self.SENSOR_IDS, [-1, 0, 1], self.VALUES),
+            'finite': encode_binary_readings(self.SENSOR_IDS, self.TIMESTAMPS_US, [1.0, float('nan'), 2.0]),
+        }
+        for message, data in cases.items():
+            with self.subTest(message), self.assertRaisesMessage(BinaryFrameError, message.strip()):
+                decode_binary_readings(data)
+
+    def test_ingest_endpoint(self):
+        frame = encode_binary_readings(self.SENSOR_IDS, self.TIMESTAMPS_US, self.VALUES, value_width=8)
+        response = self.client.post('/api/sensors/ingest/', frame, content_type=BINARY_CONTENT_TYPE)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(SensorReading.objects.order_by('timestamp').values_list('sensor_id', 'value')),
+            list(zip(self.SENSOR_IDS, self.VALUES))
+        )
+
+        response = self.client.post('/api/sensors/ingest/', frame[:-1], content_type=BINARY_CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Binary parse error', response.json()['detail'])
+        self.assertEqual(SensorReading.objects.count(), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class AggregationTests(TestCase):
+    def test_upsert_replaces_stored_rows(self):
+        add_readings(1, START, 2)
+        aggregate_range('1sec', START, START + timedelta(seconds=2))
+        SensorReading.objects.filter(timestamp__gte=START + timedelta(seconds=0.5)).delete()
+        aggregate_range('1sec', START, START + timedelta(seconds=2))
+
+        row = SensorAggregated1Sec.objects.get(sensor_id=1, timestamp=START)
+        self.assertEqual((row.count, row.sum, row.min, row.max), (2, 1.0, 0.0, 1.0))
+
+    def test_merged_partials_equal_one_pass(self):
+        add_readings(1, START, 1, hz=10)
+        values = np.arange(10, dtype=np.float64)
+        for part in (values[:3], values[3:]):
+            merge_aggregates(SensorAggregated1Sec, [{
+                'sensor_id': 2, 'timestamp': START, 'count': len(part), 'sum': part.sum(),
+                'sum_sq': (part * part).sum(), 'min': part.min(), 'max': part.max(),
+            }])
+        aggregate_range('1sec', START, START + timedelta(seconds=1))
+
+        merged = SensorAggregated1Sec.objects.get(sensor_id=2, timestamp=START)
+        whole = SensorAggregated1Sec.objects.get(sensor_id=1, timestamp=START)
+        self.assertEqual((merged.count, merged.sum, merged.min, merged.max), (10, 45.0, 0.0, 9.0))
+        self.assertAlmostEqual(merged.avg, whole.avg)
+        self.assertAlmostEqual(merged.std, whole.std)
+        self.assertAlmostEqual(merged.std, values.std())
+
+    def test_catch_up_advances_watermark_and_folds_in_late_readings(self):
+        add_readings(1, START, 5)
+        AggregationWatermark.objects.create(tier='1sec', watermark=START)
+        result = catch_up('1sec', now=START + timedelta(seconds=5, milliseconds=300))
+        self.assertEqual(result.watermark, START + timedelta(seconds=5))
+        self.assertEqual(len(result.rows), 5)
+        self.assertEqual(AggregationWatermark.objects.get(tier='1sec').watermark, START + timedelta(seconds=5))
+
+        # A late reading inside the lateness window, and nothing new closed
+        SensorReading.objects.create(sensor_id=1, timestamp=START + timedelta(seconds=1.1), value=100.0)
+        result = catch_up('1sec', now=START + timedelta(seconds=5, milliseconds=600))
+        self.assertEqual(result.rows, [])
+        row = SensorAggregated1Sec.objects.get(sensor_id=1, timestamp=START + timedelta(seconds=1))
+        self.assertEqual((row.count, row.max), (5, 100.0))
+
+    @override_settings(SENSOR_AGGREGATION={'CHUNK_BUCKETS': {'1sec': 2}})
+    def test_catch_up_returns_new_rows_of_every_chunk(self):
+        add_readings(1, START, 5)
+        AggregationWatermark.objects.create(tier='1sec', watermark=START)
+        result = catch_up('1sec', now=START + timedelta(seconds=5, milliseconds=300))
+        self.assertEqual(
+            [row.timestamp for row in result.rows],
+            [START + timedelta(seconds=second) for second in range(5)]
+        )
+
+    def test_backfill_rebuilds_whole_buckets_at_an_unaligned_end(self):
+        add_readings(1, START, 120)
+        for tier in ('1sec', '1min', '1hour'):
+            aggregate_range(tier, START, START + timedelta(hours=1))
+
+        call_command('backfill_aggregates', '--from', START.isoformat(), '--tier', '1min',
+                     '--to', (START + timedelta(seconds=30)).isoformat(), stdout=StringIO())
+        call_command('backfill_aggregates', '--from', START.isoformat(), '--tier', '1hour',
+                     '--to', (START + timedelta(minutes=1)).isoformat(), stdout=StringIO())
+
+        self.assertEqual(SensorAggregated1Min.objects.get(sensor_id=1, timestamp=START).count, 240)
+        self.assertEqual(SensorAggregated1Hour.objects.get(sensor_id=1, timestamp=START).count, 480)
+
+    def test_seed_rollup_leaves_a_partial_final_bucket_alone(self):
+        add_readings(1, START, 120)
+        for tier in ('1sec', '1min', '1hour'):
+            aggregate_range(tier, START, START + timedelta(hours=1))
+
+        written = seeding.aggregate_tiers(START - timedelta(minutes=1), START + timedelta(seconds=30))
+
+        self.assertEqual(written, {'1min': 0, '1hour': 0})
+        self.assertEqual(SensorAggregated1Min.objects.get(sensor_id=1, timestamp=START).count, 240)
+        self.assertEqual(SensorAggregated1Hour.objects.get(sensor_id=1, timestamp=START).count, 480)
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class DropoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sensor_silent_for_an_hour_is_reported(self):
+        now = datetime.now(dt_timezone.utc)
+        SensorReading.objects.create(sensor_id=4, timestamp=now - timedelta(hours=1), value=1.0)
+        SensorReading.objects.create(sensor_id=5, timestamp=now, value=1.0)
+
+        check_sensor_dropouts()
+
+        self.assertEqual(list(Anomaly.objects.filter(anomaly_type='dropout').values_list('sensor_id', flat=True)), [4])
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class ExportCommandTests(TestCase):
+    def test_naive_times_are_accepted(self):
+        add_readings(1, START, 120)
+        aggregate_range('1sec', START, START + timedelta(minutes=2))
+        aggregate_range('1min', START, START + timedelta(minutes=2))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        call_command('export_sensor_data', '--table', '1min', '--from', '2026-01-01T00:00:00',
+                     '--to', '2026-01-02T00:00:00', '--dir', directory.name, stdout=StringIO())
+
+        with open(os.path.join(directory.name, '1min_2026-01-01.csv')) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)  # header and two minutes
+
+    def test_unparseable_times_are_rejected(self):
+        for value in ('yesterday', '2026-13-01T00:00:00'):
+            with self.assertRaisesMessage(CommandError, 'ISO datetimes'):
+                call_command('export_sensor_data', '--from', value, '--to', '2026-01-02T00:00:00', stdout=StringIO())
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class HistoryStreamingTests(TestCase):
+    """NDJSON history under ASGI is sent chunk by chunk with memory independent of the range"""
+
+    def _seed(self, rows):
+        SensorAggregated1Sec.objects.all().delete()
+        SensorAggregated1Sec.objects.bulk_create([
+            SensorAggregated1Sec(
+                sensor_id=1, timestamp=START + timedelta(seconds=second),
+                **finalize(60, 3000.0 + second, 150_000.0 + second, 49.0, 51.0)
+            )
+            for second in range(rows)
+        ], batch_size=5000)
+
+    async def _stream(self, rows):
+        """(chunk count, lines, tracemalloc peak in bytes) of one streamed response"""
+        response = await self.async_client.get('/api/sensors/1/history/', {
+            'start_time': START.isoformat(),
+            'end_time': (START + timedelta(seconds=rows - 1)).isoformat(),
+            'resolution': '1sec',
+            'format': 'ndjson',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+
+        chunks = lines = 0
+        tracemalloc.start()
+        try:
+            # As the ASGI handler sends it
+            async for chunk in response:
+                chunks += 1
+                lines += chunk.count(b'\n')
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return chunks, lines, peak
+
+    async def test_ndjson_streams_incrementally_with_bounded_memory(self):
+        peaks = {}
+        for rows in (10_000, 40_000):
+            await sync_to_async(self._seed)(rows)
+            chunks, lines, peaks[rows] = await self._stream(rows)
+            self.assertEqual(lines, rows)
+            self.assertGreaterEqual(chunks, rows // STREAM_BATCH_ROWS)
+
+        # Four times the rows, the same peak (one database fetch and one encoded chunk);
+        # a body collected by sync_to_async(list) needs about 7MB at 40,000 rows
+        self.assertLess(peaks[40_000], peaks[10_000] * 1.5)
+        self.assertLess(peaks[40_000], 4 * 2**20)
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class HistoryQueryTests(TestCase):
+    def test_naive_times_are_accepted(self):
+        add_readings(1, START, 120)
+        aggregate_range('1sec', START, START + timedelta(minutes=2))
+        aggregate_range('1min', START, START + timedelta(minutes=2))
+
+        for params in [
+            {'resolution': '1sec'},
+            {'resolution': '1min'},
+            {'resolution': '1sec', 'max_points': '20', 'downsample': 'lttb'},
+        ]:
+            response = self.client.get('/api/sensors/1/history/', {
+                'start_time': '2026-01-01T09:00:00', 'end_time': '2026-01-01T10:00:00', **params
+            })
+            self.assertEqual(response.status_code, 200, params)
+            self.assertGreater(response.json()['count'], 0)
+
+    def test_cached_history_matches_the_serializer_and_columnar_path(self):
+        add_readings(1, START, 180)
+        aggregate_range('1sec', START, START + timedelta(minutes=3))
+        aggregate_range('1min', START, START + timedelta(minutes=3))
+        # The whole day is closed, so it is served from cached blocks
+        AggregationWatermark.objects.create(tier='1min', watermark=START + timedelta(days=2))
+        history_cache.clear()
+        history_cache.reset_stats()
+        self.addCleanup(history_cache.clear)
+        queryset = SensorAggregated1Min.objects.filter(sensor_id=1).order_by('timestamp')
+        params = {'start_time': '2026-01-01T09:00:00Z', 'end_time': '2026-01-01T10:00:00Z', 'resolution': '1min'}
+
+        for _ in range(2):
+            response = self.client.get('/api/sensors/1/history/', params)
+            self.assertEqual(response.json()['data'], json.loads(json.dumps(
+                SensorAggregated1MinSerializer(queryset, many=True).data
+            )))
+
+            with mock.patch.object(SensorAggregated1MinSerializer, 'to_representation', side_effect=AssertionError):
+                response = self.client.get('/api/sensors/1/history/', {**params, 'format': 'columnar'})
+            self.assertEqual(response.json()['data'], columnar_series(queryset)[0])
+        self.assertEqual((history_cache.stats()['misses'], history_cache.stats()['hits']), (1, 3))
+
+    def test_streaming_aggregator_advances_1sec_watermark(self):
+        self.assertIsNone(final_until('1sec'))
+        # Emitted by hand; the background thread never wakes on its own
+        aggregator = StreamingAggregator(emit_interval=3600, grace_seconds=1)
+        self.addCleanup(aggregator.close)
+        now_us = int(datetime.now(dt_timezone.utc).timestamp()) * 1_000_000
+        aggregator.add(make_batch(1, 30, start_us=now_us - 10_000_000))
+
+        with mock.patch.object(aggregator, '_after_emit'):
+            rows = aggregator.emit()
+        self.assertEqual(len(rows), 3)
+
+        watermark = AggregationWatermark.objects.get(tier='1sec').watermark
+        self.assertGreater(watermark, rows[-1]['timestamp'])
+        self.assertIsNotNone(final_until('1sec'))
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class LiveRingTests(TestCase):
+    def setUp(self):
+        live.reset()
+        self.addCleanup(live.reset)
+        now = datetime.now(dt_timezone.utc).replace(microsecond=0)
+        self.rows = {
+            sensor_id: [
+                {'sensor_id': sensor_id, 'timestamp': now - timedelta(seconds=age),
+                 'count': 60, 'sum': 3000.0, 'sum_sq': 150_060.0, 'min': 49.0, 'max': 51.0}
+                for age in range(59, 0, -1)
+            ]
+            for sensor_id in (1, 2)
+        }
+        merge_aggregates(SensorAggregated1Sec, self.rows[1] + self.rows[2])
+
+    def test_ring_created_mid_window_falls_back_to_the_database(self):
+        # The cache was flushed: the ring only sees the newest seconds
+        live.publish_rows(self.rows[1][-5:])
+        self.assertIsNone(live.get_window([1])[1])
+
+        data = self.client.get('/api/sensors/1/live/').json()
+        self.assertEqual(data['count'], 59)
+
+        # Once the ring covers the window it is served without the database
+        self.assertIsNotNone(live.get_window([1], 4)[1])
+
+    def test_ring_and_database_rows_have_the_same_fields(self):
+        live.publish_rows(self.rows[1])
+        self.assertIsNotNone(live.get_window([1])[1])
+        from_ring = self.client.get('/api/sensors/1/live/').json()['data']
+        from_database = self.client.get('/api/sensors/2/live/').json()['data']
+
+        self.assertEqual(len(from_ring), len(from_database))
+        self.assertEqual(set(from_ring[0]), set(live.LIVE_FIELDS))
+        self.assertEqual(set(from_database[0]), set(live.LIVE_FIELDS))
+        self.assertEqual(from_ring[-1]['timestamp'], from_database[-1]['timestamp'])
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': False})
+class StreamingAggregatorTests(TestCase):
+    def test_late_partial_seconds_are_merged_but_not_broadcast(self):
+        aggregator = StreamingAggregator(emit_interval=3600, grace_seconds=1)
+        self.addCleanup(aggregator.close)
+        second_us = (int(datetime.now(dt_timezone.utc).timestamp()) - 10) * 1_000_000
+
+        with mock.patch.object(aggregator, '_after_emit') as after_emit:
+            aggregator.add(make_batch(1, 5, start_us=second_us))
+            aggregator.emit()
+            rows, fresh = after_emit.call_args.args
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(fresh, rows)
+
+            # Late readings of the same second, plus a second seen for the first time
+            aggregator.add(make_batch(1, 3, start_us=second_us + 600_000))
+            aggregator.add(make_batch(2, 5, start_us=second_us))
+            aggregator.emit()
+            rows, fresh = after_emit.call_args.args
+            self.assertEqual(len(rows), 2)
+            self.assertEqual([row['sensor_id'] for row in fresh], [2])
+
+        stored = SensorAggregated1Sec.objects.get(sensor_id=1)
+        self.assertEqual(stored.count, 8)
+
+    def test_late_partial_second_is_not_scored_again(self):
+        aggregator = StreamingAggregator(emit_interval=3600, grace_seconds=1)
+        self.addCleanup(aggregator.close)
+        engine = AnomalyEngine(window_seconds=60, min_history=5)
+        first_us = (int(datetime.now(dt_timezone.utc).timestamp()) - 30) * 1_000_000
+
+        def second(offset, value):
+            return ReadingBatch(
+                sensor_ids=np.full(4, 1, dtype=np.int64),
+                values=value + np.array([-0.5, 0.0, 0.5, 0.0]),
+                timestamps_us=first_us + offset * 1_000_000 + np.arange(4, dtype=np.int64) * 100_000,
+            )
+
+        with mock.patch('sensors.anomalies.get_engine', return_value=engine), \
+                mock.patch('sensors.broadcast.publish_tick'), mock.patch('sensors.live.publish_rows'):
+            for offset in range(10):
+                aggregator.add(second(offset, 50.0 + offset % 2))
+            aggregator.emit()
+            aggregator.add(second(10, 90.0))
+            aggregator.emit()
+            self.assertEqual(Anomaly.objects.filter(anomaly_type='spike').count(), 1)
+
+            # Late readings of the spike second, the only row of the next emit
+            aggregator.add(second(10, 91.0))
+            aggregator.emit()
+        self.assertEqual(Anomaly.objects.filter(anomaly_type='spike').count(), 1)
+        self.assertEqual(SensorAggregated1Sec.objects.get(sensor_id=1, count=8).max, 91.5)
+
+    def test_failed_write_is_retried_by_the_next_emit(self):
+        aggregator = StreamingAggregator(emit_interval=3600, grace_seconds=1)
+        self.addCleanup(aggregator.close)
+        second_us = (int(datetime.now(dt_timezone.utc).timestamp()) - 10) * 1_000_000
+        aggregator.add(make_batch(1, 5, start_us=second_us))
+
+        with mock.patch('sensors.streaming.merge_aggregates', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                aggregator.emit()
+        self.assertFalse(SensorAggregated1Sec.objects.exists())
+
+        with mock.patch.object(aggregator, '_after_emit'):
+            aggregator.add(make_batch(1, 3, start_us=second_us + 600_000))
+            rows = aggregator.emit()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(SensorAggregated1Sec.objects.get(sensor_id=1).count, 8)
+
+
+@override_settings(CACHES=LOCAL_CACHE, CHANNEL_LAYERS=LOCAL_CHANNEL_LAYER, SENSOR_METRICS={'ENABLED': False})
+class BroadcastRoutingTests(TestCase):
+    async def _receive(self, client):
+        return json.loads((await client.receive_output(5))['text'])
+
+    async def _send(self, client, message):
+        await client.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+        return await self._receive(client)
+
+    async def _connect(self):
+        client = ApplicationCommunicator(
+            SensorDataConsumer.as_asgi(), {'type': 'websocket', 'path': '/ws/sensors/', 'headers': []}
+        )
+        await client.send_input({'type': 'websocket.connect'})
+        await client.receive_output(5)  # websocket.accept
+        await self._receive(client)  # connection_established
+        return client
+
+    async def test_one_frame_per_client_per_tick(self):
+        subscribed, everything = await self._connect(), await self._connect()
+        await self._send(subscribed, {'type': 'subscribe', 'sensor_ids': [1, 2, 3]})
+
+        rows = [
+            {'sensor_id': sensor_id, 'timestamp': START, 'count': 60, 'sum': 3000.0,
+             'sum_sq': 150_060.0, 'min': 49.0, 'max': 51.0}
+            for sensor_id in range(1, 13)
+        ]
+        publisher = mock.Mock()
+        with mock.patch('sensors.broadcast.get_publisher', return_value=publisher):
+            broadcast.publish_tick(rows)
+        self.assertEqual(publisher.publish.call_count, 1)
+        layer = get_channel_layer()
+        await layer.group_send('sensors', {'type': 'sensor_batch', 'data': publisher.publish.call_args.args[0]})
+
+        frame = await self._receive(subscribed)
+        self.assertEqual([row['sensor_id'] for row in frame['sensors']], [1, 2, 3])
+        frame = await self._receive(everything)
+        self.assertEqual(len(frame['sensors']), 12)
+        for client in (subscribed, everything):
+            self.assertTrue(await client.receive_nothing())
+
+        # A tick with none of the client's sensors sends it nothing
+        frame = broadcast.build_frame([row for row in rows if row['sensor_id'] > 3])
+        await layer.group_send('sensors', {'type': 'sensor_batch', 'data': frame})
+        await self._receive(everything)
+        self.assertTrue(await subscribed.receive_nothing())
+
+        for client in (subscribed, everything):
+            await client.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await client.wait(5)
+
+
+@override_settings(CACHES=LOCAL_CACHE, SENSOR_METRICS={'ENABLED': True, 'PROCESS_TIMEOUT': 60})
+class MetricsMergeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _publish_other(self, published_at, pid='worker:1'):
+        metrics._store(cache).publish(pid, {'published_at': published_at, 'snapshot': {
+            metrics.READINGS_INGESTED.name: [((), 500)],
+            metrics.BULK_CREATE_SECONDS.name: [((), [[2] + [0] * len(metrics.LATENCY_BUCKETS), 0.0015])],
+            metrics.WS_CLIENTS.name: [((), 3)],
+        }})
+
+    def test_counters_of_a_gone_process_never_go_down(self):
+        local = metrics.collect()
+        self._publish_other(time.time())
+        live = metrics.collect()
+        self.assertEqual(live[metrics.READINGS_INGESTED.name].get((), 0) - local[metrics.READINGS_INGESTED.name].get((), 0), 500)
+        self.assertEqual(live[metrics.WS_CLIENTS.name].get((), 0) - local[metrics.WS_CLIENTS.name].get((), 0), 3)
+
+        # Silent past PROCESS_TIMEOUT: still counted on the scrape that retires it, then from the retired totals
+        self._publish_other(time.time() - 61)
+        for _ in range(2):
+            values = metrics.collect()
+            for name in (metrics.READINGS_INGESTED.name, metrics.BULK_CREATE_SECONDS.name):
+                self.assertEqual(values[name], live[name])
+            self.assertEqual(values[metrics.WS_CLIENTS.name], local[metrics.WS_CLIENTS.name])
+        processes, retired = metrics._store(cache).read()
+        self.assertNotIn('worker:1', processes)
+
+        # A second process retiring adds to the totals instead of replacing them
+        self._publish_other(time.time() - 61, pid='worker:2')
+        metrics.collect()
+        values = metrics.collect()
+        self.assertEqual(
+            values[metrics.READINGS_INGESTED.name][()] - local[metrics.READINGS_INGESTED.name].get((), 0), 1000
+        )
+
+    def test_publish_warns_once_per_outage(self):
+        self.addCleanup(setattr, metrics, '_publish_failing', False)
+        with mock.patch('sensors.metrics._store', side_effect=ConnectionError('Redis is down')), \
+                self.assertLogs('sensors.metrics', 'DEBUG') as logs:
+            self.assertFalse(any(metrics.publish() for _ in range(3)))
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'DEBUG', 'DEBUG'])
+
+        with self.assertLogs('sensors.metrics', 'INFO') as logs:
+            self.assertTrue(metrics.publish())
+            self.assertTrue(metrics.publish())
+        self.assertEqual(logs.output, ['INFO:sensors.metrics:Publishing metrics snapshots again'])
+        self.assertIn(metrics.process_id(), metrics._store(cache).read()[0])
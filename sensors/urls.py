@@ -4,12 +4,19 @@ from . import views
 urlpatterns = [
     # Data ingestion
     path('ingest/', views.ingest_sensor_data, name='ingest-sensor-data'),
+    path('ingest/stats/', views.get_ingest_stats, name='get-ingest-stats'),
 
     # Data retrieval
     path('list/', views.list_sensors, name='list-sensors'),
+    path('live/', views.get_batch_live_data, name='get-batch-live-data'),
+    path('history/', views.get_batch_historical_data, name='get-batch-historical-data'),
+    path('history/stats/', views.get_history_cache_stats, name='get-history-cache-stats'),
     path('<int:sensor_id>/live/', views.get_live_data, name='get-live-data'),
     path('<int:sensor_id>/history/', views.get_historical_data, name='get-historical-data'),
 
+    # Bulk export
+    path('export/', views.export_sensor_data, name='export-sensor-data'),
+
     # Anomalies
     path('anomalies/', views.get_anomalies, name='get-anomalies'),
 ]
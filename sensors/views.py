@@ -1,61 +1,111 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+import tempfile
 from datetime import timedelta
 from django.db.models import Max
 from .models import (
-    SensorReading,
     SensorAggregated1Sec,
-    SensorAggregated1Min,
-    SensorAggregated1Hour,
     Anomaly
 )
 from .serializers import (
     SensorReadingSerializer,
     SensorReadingBulkCreateSerializer,
-    SensorAggregated1SecSerializer,
-    SensorAggregated1MinSerializer,
-    SensorAggregated1HourSerializer,
+    SensorLiveSerializer,
     AnomalySerializer,
     SensorListSerializer
 )
+from .ingest import ReadingBatch, parse_json_readings, store_readings
+from .parsers import BinaryReadingsParser
+from .renderers import (
+    COLUMNAR_RENDERERS,
+    STREAMING_RENDERERS,
+    is_columnar,
+    is_streaming,
+    stream_content,
+    streaming_response
+)
+from .buffer import IngestBufferFull, get_write_buffer
+from .downsampling import DOWNSAMPLERS
+from .history import (
+    MIN_POINTS,
+    RESOLUTIONS,
+    STREAM_FIELDS,
+    columnar_series,
+    downsample,
+    grouped_columnar_series,
+    grouped_rows,
+    select_resolution,
+    stream_rows
+)
+from .latest import get_latest
+from . import export, history_cache, live, metrics
+
+# Seconds of 1-second data returned by the live endpoints
+LIVE_WINDOW_SECONDS = 60
 
 
 @api_view(['POST'])
+@parser_classes([JSONParser, BinaryReadingsParser])
 def ingest_sensor_data(request):
     """
     Batch insert sensor readings from Raspberry Pi.
     Expects array of readings: [{"sensor_id": 1, "timestamp": "...", "value": 123.45}, ...]
+    or a columnar binary frame sent as application/x-sensor-readings.
     """
-    if not isinstance(request.data, list):
+    # Binary frames are decoded and validated by BinaryReadingsParser
+    if isinstance(request.data, ReadingBatch):
+        batch = request.data
+    elif not isinstance(request.data, list):
         return Response(
             {"error": "Expected an array of sensor readings"},
             status=status.HTTP_400_BAD_REQUEST
         )
-
-    # Validate all readings
-    serializer = SensorReadingBulkCreateSerializer(data=request.data, many=True)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    # Bulk create sensor readings for efficiency
-    readings = [
-        SensorReading(
-            sensor_id=item['sensor_id'],
-            timestamp=item['timestamp'],
-            value=item['value']
+    else:
+        # Fast path: columnar validation, falls back to the serializer for
+        # anything unusual so 400 responses keep the serializer's error format
+        batch = None
+        if getattr(settings, 'SENSOR_INGEST_FAST_PATH', True):
+            batch = parse_json_readings(request.data)
+
+        if batch is None:
+            serializer = SensorReadingBulkCreateSerializer(data=request.data, many=True)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            batch = ReadingBatch.from_validated_data(serializer.validated_data)
+
+    # Hand off to the write-behind buffer when enabled
+    write_buffer = get_write_buffer()
+    if write_buffer is not None:
+        try:
+            write_buffer.submit(batch)
+        except IngestBufferFull as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": "1"}
+            )
+        return Response(
+            {
+                "success": True,
+                "count": len(batch),
+                "message": f"Successfully queued {len(batch)} sensor readings"
+            },
+            status=status.HTTP_201_CREATED
         )
-        for item in serializer.validated_data
-    ]
 
     try:
-        SensorReading.objects.bulk_create(readings, batch_size=500)
+        count = store_readings(batch)
         return Response(
             {
                 "success": True,
-                "count": len(readings),
-                "message": f"Successfully inserted {len(readings)} sensor readings"
+                "count": count,
+                "message": f"Successfully inserted {count} sensor readings"
             },
             status=status.HTTP_201_CREATED
         )
@@ -67,10 +117,128 @@ def ingest_sensor_data(request):
 
 
 @api_view(['GET'])
+def get_ingest_stats(request):
+    """
+    Get write-behind buffer metrics: depth, rejected readings and flush latency.
+    """
+    write_buffer = get_write_buffer()
+    if write_buffer is None:
+        return Response({"enabled": False})
+    return Response(write_buffer.stats())
+
+
+@api_view(['GET'])
+def get_history_cache_stats(request):
+    """
+    Get history cache metrics of this process: block hits, misses, hit ratio
+    and fresh tail queries.
+    """
+    return Response(history_cache.stats())
+
+
+@api_view(['GET'])
+def get_metrics(request):
+    """
+    Prometheus metrics of all web, ingest and Celery processes (text
+    exposition format), merged from their published snapshots.
+    """
+    metrics.update_watermark_lag()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _parse_history_query(request):
+    """
+    Parse and validate the shared history query parameters.
+    Returns ((start_time, end_time, resolution, max_points, method), None)
+    or (None, error response).
+    """
+    # Parse query parameters
+    start_time_str = request.query_params.get('start_time')
+    end_time_str = request.query_params.get('end_time')
+    resolution = request.query_params.get('resolution', 'auto')
+
+    if not start_time_str or not end_time_str:
+        return None, Response(
+            {"error": "start_time and end_time are required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        from django.utils.dateparse import parse_datetime
+        start_time = parse_datetime(start_time_str)
+        end_time = parse_datetime(end_time_str)
+
+        if not start_time or not end_time:
+            raise ValueError("Invalid datetime format")
+        # Naive times are in TIME_ZONE, as the ORM would read them
+        if timezone.is_naive(start_time):
+            start_time = timezone.make_aware(start_time)
+        if timezone.is_naive(end_time):
+            end_time = timezone.make_aware(end_time)
+    except Exception as e:
+        return None, Response(
+            {"error": f"Invalid datetime format: {str(e)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Optional point budget for charts
+    max_points = request.query_params.get('max_points')
+    method = request.query_params.get('downsample', 'lttb')
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+            if max_points < MIN_POINTS:
+                raise ValueError
+        except ValueError:
+            return None, Response(
+                {"error": f"max_points must be an integer of at least {MIN_POINTS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    if method not in DOWNSAMPLERS:
+        return None, Response(
+            {"error": f"Invalid downsample. Use {', '.join(repr(name) for name in DOWNSAMPLERS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Auto-select resolution based on time range (and point budget)
+    try:
+        resolution = select_resolution(start_time, end_time, resolution, max_points)
+    except ValueError:
+        return None, Response(
+            {"error": "Invalid resolution. Use 'auto', '1sec', '1min', or '1hour'"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return (start_time, end_time, resolution, max_points, method), None
+
+
+def _parse_sensor_ids(request):
+    """
+    Parse ?sensor_ids=1,2,3 (default: all sensors).
+    Returns (sorted sensor ids, None) or (None, error response).
+    """
+    value = request.query_params.get('sensor_ids')
+    if not value:
+        return list(range(1, 13)), None
+    try:
+        sensor_ids = sorted({int(part) for part in value.split(',') if part.strip()})
+    except ValueError:
+        sensor_ids = []
+    if not sensor_ids or sensor_ids[0] < 1 or sensor_ids[-1] > 12:
+        return None, Response(
+            {"error": "sensor_ids must be a comma-separated list of ids between 1 and 12"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return sensor_ids, None
+
+
+@api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + COLUMNAR_RENDERERS)
 def get_live_data(request, sensor_id):
     """
     Get the last 60 seconds of sensor data for real-time dashboard.
     Returns 1-second aggregated data for smoother visualization.
+    With ?format=columnar (or msgpack) data holds one array per field.
     """
     if sensor_id < 1 or sensor_id > 12:
         return Response(
@@ -78,15 +246,33 @@ def get_live_data(request, sensor_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    # Served from the live ring buffer, which the 1-second aggregator keeps current
+    series = live.get_window([sensor_id], LIVE_WINDOW_SECONDS)[sensor_id]
+    if series is not None:
+        timestamps, rows = series
+        return Response({
+            "sensor_id": sensor_id,
+            "data": history_cache.series_columns(timestamps, rows) if is_columnar(request) else rows,
+            "count": len(rows)
+        })
+
     # Get last 60 seconds of 1-second aggregated data
-    cutoff_time = timezone.now() - timedelta(seconds=60)
+    cutoff_time = timezone.now() - timedelta(seconds=LIVE_WINDOW_SECONDS)
 
     data = SensorAggregated1Sec.objects.filter(
         sensor_id=sensor_id,
         timestamp__gte=cutoff_time
     ).order_by('timestamp')
 
-    serializer = SensorAggregated1SecSerializer(data, many=True)
+    if is_columnar(request):
+        columns, count = columnar_series(data)
+        return Response({
+            "sensor_id": sensor_id,
+            "data": columns,
+            "count": count
+        })
+
+    serializer = SensorLiveSerializer(data, many=True)
     return Response({
         "sensor_id": sensor_id,
         "data": serializer.data,
@@ -95,6 +281,7 @@ def get_live_data(request, sensor_id):
 
 
 @api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + COLUMNAR_RENDERERS + STREAMING_RENDERERS)
 def get_historical_data(request, sensor_id):
     """
     Get historical sensor data with automatic aggregation level selection.
@@ -102,6 +289,10 @@ def get_historical_data(request, sensor_id):
     - start_time: ISO datetime (required)
     - end_time: ISO datetime (required)
     - resolution: 'auto', '1sec', '1min', '1hour' (default: 'auto')
+    - max_points: downsample to at most this many points (optional)
+    - downsample: 'lttb' or 'minmax' (default: 'lttb')
+    - format: 'columnar' or 'msgpack' for one array per field, 'ndjson' or
+      'csv' to stream rows with flat memory (optional)
     """
     if sensor_id < 1 or sensor_id > 12:
         return Response(
@@ -109,80 +300,217 @@ def get_historical_data(request, sensor_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Parse query parameters
-    start_time_str = request.query_params.get('start_time')
-    end_time_str = request.query_params.get('end_time')
-    resolution = request.query_params.get('resolution', 'auto')
+    params, error = _parse_history_query(request)
+    if error:
+        return error
+    start_time, end_time, resolution, max_points, method = params
 
-    if not start_time_str or not end_time_str:
-        return Response(
-            {"error": "start_time and end_time are required"},
-            status=status.HTTP_400_BAD_REQUEST
+    if is_streaming(request):
+        # Query appropriate aggregation table
+        queryset = RESOLUTIONS[resolution].model.objects.filter(
+            sensor_id=sensor_id,
+            timestamp__gte=start_time,
+            timestamp__lte=end_time
+        ).order_by('timestamp')
+        return streaming_response(
+            request, STREAM_FIELDS, stream_rows(queryset, max_points, method),
+            filename=f'sensor_{sensor_id}_{resolution}'
         )
 
-    try:
-        from django.utils.dateparse import parse_datetime
-        start_time = parse_datetime(start_time_str)
-        end_time = parse_datetime(end_time_str)
+    # Closed windows come from the history cache, the open tail from the database
+    timestamps, rows = history_cache.history_series(resolution, sensor_id, start_time, end_time)
+    total = len(rows)
+    if max_points is not None:
+        timestamps, rows = history_cache.downsample_series(timestamps, rows, max_points, method)
+    if is_columnar(request):
+        data = history_cache.history_columns(timestamps, rows)
+    else:
+        data = history_cache.history_rows(rows)
+    count = len(rows)
 
-        if not start_time or not end_time:
-            raise ValueError("Invalid datetime format")
-    except Exception as e:
-        return Response(
-            {"error": f"Invalid datetime format: {str(e)}"},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    extra = {"downsampled_from": total} if max_points is not None else {}
+    return Response({
+        "sensor_id": sensor_id,
+        "start_time": start_time,
+        "end_time": end_time,
+        "resolution": resolution,
+        "data": data,
+        "count": count,
+        **extra
+    })
 
-    # Calculate time range for auto-resolution selection
-    time_range = end_time - start_time
 
-    # Auto-select resolution based on time range
-    if resolution == 'auto':
-        if time_range <= timedelta(hours=1):
-            resolution = '1sec'
-        elif time_range <= timedelta(days=1):
-            resolution = '1min'
-        else:
-            resolution = '1hour'
+@api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + COLUMNAR_RENDERERS)
+def get_batch_live_data(request):
+    """
+    Get the last 60 seconds of 1-second data for several sensors in one query.
+    Query params:
+    - sensor_ids: comma-separated sensor ids (default: all 12)
+    - format: 'columnar' or 'msgpack' for one array per field (optional)
+    """
+    sensor_ids, error = _parse_sensor_ids(request)
+    if error:
+        return error
+
+    window = live.get_window(sensor_ids, LIVE_WINDOW_SECONDS)
+    if all(series is not None for series in window.values()):
+        sensors_data = []
+        for sensor_id in sensor_ids:
+            timestamps, rows = window[sensor_id]
+            sensors_data.append({
+                "sensor_id": sensor_id,
+                "data": history_cache.series_columns(timestamps, rows) if is_columnar(request) else rows,
+                "count": len(rows)
+            })
+        return Response({
+            "sensors": sensors_data,
+            "count": len(sensors_data)
+        })
 
-    # Query appropriate aggregation table
-    if resolution == '1sec':
-        queryset = SensorAggregated1Sec.objects.filter(
-            sensor_id=sensor_id,
-            timestamp__gte=start_time,
-            timestamp__lte=end_time
-        ).order_by('timestamp')
-        serializer = SensorAggregated1SecSerializer(queryset, many=True)
-    elif resolution == '1min':
-        queryset = SensorAggregated1Min.objects.filter(
-            sensor_id=sensor_id,
-            timestamp__gte=start_time,
-            timestamp__lte=end_time
-        ).order_by('timestamp')
-        serializer = SensorAggregated1MinSerializer(queryset, many=True)
-    elif resolution == '1hour':
-        queryset = SensorAggregated1Hour.objects.filter(
-            sensor_id=sensor_id,
-            timestamp__gte=start_time,
-            timestamp__lte=end_time
-        ).order_by('timestamp')
-        serializer = SensorAggregated1HourSerializer(queryset, many=True)
-    else:
-        return Response(
-            {"error": "Invalid resolution. Use 'auto', '1sec', '1min', or '1hour'"},
-            status=status.HTTP_400_BAD_REQUEST
+    cutoff_time = timezone.now() - timedelta(seconds=LIVE_WINDOW_SECONDS)
+    queryset = SensorAggregated1Sec.objects.filter(
+        sensor_id__in=sensor_ids,
+        timestamp__gte=cutoff_time
+    )
+
+    sensors_data = _grouped_series(request, queryset, SensorLiveSerializer, sensor_ids)
+    return Response({
+        "sensors": sensors_data,
+        "count": len(sensors_data)
+    })
+
+
+@api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + COLUMNAR_RENDERERS + STREAMING_RENDERERS)
+def get_batch_historical_data(request):
+    """
+    Get historical data for several sensors in one query, with the same
+    resolution selection and downsampling as get_historical_data.
+    Query params:
+    - sensor_ids: comma-separated sensor ids (default: all 12)
+    - start_time, end_time, resolution, max_points, downsample, format:
+      as for get_historical_data
+    """
+    sensor_ids, error = _parse_sensor_ids(request)
+    if error:
+        return error
+    params, error = _parse_history_query(request)
+    if error:
+        return error
+    start_time, end_time, resolution, max_points, method = params
+
+    tier = RESOLUTIONS[resolution]
+    queryset = tier.model.objects.filter(
+        sensor_id__in=sensor_ids,
+        timestamp__gte=start_time,
+        timestamp__lte=end_time
+    )
+
+    if is_streaming(request):
+        return streaming_response(
+            request, STREAM_FIELDS, stream_rows(queryset, max_points, method),
+            filename=f'sensors_{resolution}'
         )
 
+    sensors_data = _grouped_series(request, queryset, tier.serializer, sensor_ids, max_points, method)
     return Response({
-        "sensor_id": sensor_id,
         "start_time": start_time,
         "end_time": end_time,
         "resolution": resolution,
-        "data": serializer.data,
-        "count": len(serializer.data)
+        "sensors": sensors_data,
+        "count": len(sensors_data)
     })
 
 
+@api_view(['GET'])
+def export_sensor_data(request):
+    """
+    Bulk export of raw readings or an aggregation tier as a file download.
+    Query params:
+    - table: 'raw', '1sec', '1min' or '1hour' (default: 1min)
+    - sensor_ids: comma-separated sensor ids (default: all 12)
+    - start_time, end_time: ISO datetimes, end exclusive
+    - output: 'csv' (streamed) or 'parquet' (requires pyarrow)
+    For large ranges prefer the export_sensor_data management command.
+    """
+    table = request.query_params.get('table', '1min')
+    output = request.query_params.get('output', 'csv')
+    if table not in export.TABLES:
+        return Response(
+            {"error": f"Invalid table. Use {', '.join(repr(name) for name in export.TABLES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if output not in export.available_outputs():
+        return Response(
+            {"error": f"Invalid output. Use {', '.join(repr(name) for name in export.available_outputs())}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    sensor_ids, error = _parse_sensor_ids(request)
+    if error:
+        return error
+    params, error = _parse_history_query(request)
+    if error:
+        return error
+    start_time, end_time = params[:2]
+
+    rows = export.iter_rows(table, start_time, end_time, sensor_ids)
+    filename = f'{table}_{start_time:%Y%m%dT%H%M%S}_{end_time:%Y%m%dT%H%M%S}.{output}'
+
+    if output == 'csv':
+        fields = export.TABLES[table][1]
+        response = StreamingHttpResponse(
+            stream_content(request, export.CSVRenderer().stream(fields, rows)),
+            content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    # Parquet needs a seekable file: spool to a temporary file, then send it
+    fileobj = tempfile.TemporaryFile()
+    export.write_rows(fileobj, table, output, rows)
+    fileobj.seek(0)
+    return FileResponse(
+        fileobj, as_attachment=True, filename=filename,
+        content_type='application/vnd.apache.parquet'
+    )
+
+
+def _grouped_series(request, queryset, serializer_class, sensor_ids, max_points=None, method='lttb'):
+    """
+    One entry per requested sensor (empty when it has no rows) from a
+    single multi-sensor query, grouped by sensor as rows stream in.
+    """
+    if is_columnar(request):
+        groups = {
+            sensor_id: (columns, total)
+            for sensor_id, columns, total in grouped_columnar_series(queryset, max_points, method)
+        }
+        empty = columnar_series(queryset.none())
+    else:
+        groups = {}
+        for sensor_id, rows in grouped_rows(queryset):
+            total = len(rows)
+            if max_points is not None:
+                rows = downsample(rows, max_points, method)
+            groups[sensor_id] = (serializer_class(rows, many=True).data, total)
+        empty = ([], 0)
+
+    sensors_data = []
+    for sensor_id in sensor_ids:
+        data, total = groups.get(sensor_id, empty)
+        entry = {
+            "sensor_id": sensor_id,
+            "data": data,
+            "count": len(data['timestamp']) if is_columnar(request) else len(data)
+        }
+        if max_points is not None:
+            entry["downsampled_from"] = total
+        sensors_data.append(entry)
+    return sensors_data
+
+
 @api_view(['GET'])
 def get_anomalies(request):
     """
@@ -243,16 +571,15 @@ def list_sensors(request):
     Get list of all 12 sensors with their current status and last reading.
     """
     sensors_data = []
+    now = timezone.now()
 
-    for sensor_id in range(1, 13):
-        # Get last reading for this sensor
-        last_reading = SensorReading.objects.filter(
-            sensor_id=sensor_id
-        ).order_by('-timestamp').first()
+    # Newest reading per sensor from the shared registry (no query once warm)
+    latest = get_latest(range(1, 13))
 
+    for sensor_id, last_reading in latest.items():
         # Determine status
         if last_reading:
-            time_since_last = timezone.now() - last_reading.timestamp
+            time_since_last = now - last_reading[0]
             if time_since_last < timedelta(seconds=5):
                 status_str = "online"
             elif time_since_last < timedelta(minutes=1):
@@ -266,8 +593,8 @@ def list_sensors(request):
             "sensor_id": sensor_id,
             "name": f"Sensor {sensor_id}",
             "status": status_str,
-            "last_reading_time": last_reading.timestamp if last_reading else None,
-            "last_value": last_reading.value if last_reading else None
+            "last_reading_time": last_reading[0] if last_reading else None,
+            "last_value": last_reading[1] if last_reading else None
         })
 
     serializer = SensorListSerializer(sensors_data, many=True)
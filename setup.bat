@@ -34,7 +34,7 @@ echo.
 echo [2/6] Activating virtual environment and installing Python dependencies...
 call venv\Scripts\activate.bat
 pip install --upgrade pip
-pip install django djangorestframework django-cors-headers
+pip install django djangorestframework django-cors-headers numpy
 
 echo.
 echo [3/6] Running Django migrations...